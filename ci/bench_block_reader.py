@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+"""Compare block readers for hashing a local file, as pithos uploads do
+
+Usage: bench_block_reader.py FILE [BLOCKSIZE]
+
+Each reader runs in a forked child, so that the peak resident memory
+(ru_maxrss) of each one is measured independently.
+"""
+
+import os
+import sys
+import resource
+from time import time
+from hashlib import new as newhashlib
+
+from kamaki.clients.utils import readall, rstrip_nul, BlockSource
+
+
+def hash_copies(path, blocksize):
+    """The former reader: readall blocks and rstrip copies"""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        for offset in xrange(0, size, blocksize):
+            block = readall(f, min(blocksize, size - offset))
+            h = newhashlib('sha256')
+            h.update(block.rstrip('\x00'))
+            h.hexdigest()
+
+
+def hash_views(path, blocksize):
+    """BlockSource: buffer views of per-block, read-only file mappings"""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        nblocks = 1 + (size - 1) // blocksize
+        for offset, block in BlockSource(f).blocks(blocksize, nblocks):
+            h = newhashlib('sha256')
+            h.update(rstrip_nul(block))
+            h.hexdigest()
+
+
+def run(name, reader, path, blocksize):
+    pid = os.fork()
+    if not pid:
+        start = time()
+        reader(path, blocksize)
+        duration = time() - start
+        size = os.stat(path).st_size
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print '%-8s %8.2fs %10.1f MB/s  max rss %8d KB' % (
+            name, duration, size / (duration or 1e-9) / 2 ** 20, maxrss)
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    path = sys.argv[1]
+    blocksize = int(sys.argv[2]) if len(sys.argv) > 2 else 4 * 1024 * 1024
+    print 'file: %s (%s bytes), block size: %s' % (
+        path, os.stat(path).st_size, blocksize)
+    for name, reader in (('copies', hash_copies), ('views', hash_views)):
+        run(name, reader, path, blocksize)
@@ -488,9 +488,19 @@ def exec_cmd(instance, cmd_args, help_method):
             help_method()
         else:
             raise
+    finally:
+        close_worker_pools(instance)
     return 1
 
 
+def close_worker_pools(instance):
+    """Stop the worker threads of the clients of a command instance"""
+    for attr in ('client', 'dst_client'):
+        client = getattr(instance, attr, None)
+        if hasattr(client, 'close_worker_pool'):
+            client.close_worker_pool()
+
+
 def get_command_group(unparsed, arguments):
     groups = arguments['config'].groups
     for term in unparsed:
@@ -42,6 +42,7 @@ from kamaki.cli.cmdtree import CommandTree
 from kamaki.cli.utils import filter_dicts_by_dict, format_size
 from kamaki.clients.image import ImageClient
 from kamaki.clients.pithos import PithosClient
+from kamaki.cli.cmds.pithos import get_hash_cache, get_block_store
 from kamaki.clients import ClientError
 from kamaki.cli.argument import (
     FlagArgument, ValueArgument, RepeatableArgument, KeyValueArgument,
@@ -417,6 +418,16 @@ class image_register(_ImageInit, OptionalOutput):
             '--upload-image-file'),
         progress_bar=ProgressBarArgument(
             'Do not use progress bar', '--no-progress-bar', default=False),
+        hash_workers=IntArgument(
+            'Number of parallel block hashing workers for image file upload '
+            '(default: 1)',
+            '--hash-workers'),
+        hash_processes=FlagArgument(
+            'Hash image file blocks in processes instead of threads',
+            '--hash-processes'),
+        no_hash_cache=FlagArgument(
+            'Do not use or update the local cache of block hashes',
+            '--no-hash-cache'),
         name=ValueArgument('The name of the new image', '--name'),
         pithos_location=PithosLocationArgument(
             'The Pithos+ image location to put the image at. Format:       '
@@ -429,6 +440,12 @@ class image_register(_ImageInit, OptionalOutput):
     def _get_pithos_client(self, locator):
         pithos = self.get_client(PithosClient, 'pithos')
         pithos.account, pithos.container = locator.uuid, locator.container
+        pithos.HASH_WORKERS = int(self['hash_workers'] or 1)
+        pithos.HASH_WITH_PROCESSES = self['hash_processes']
+        if self['local_image_path'] and not self['no_hash_cache']:
+            pithos.hash_cache = get_hash_cache(self.config)
+        if self['local_image_path']:
+            pithos.block_store = get_block_store(self.config, pithos)
         return pithos
 
     def _load_params_from_file(self, location):
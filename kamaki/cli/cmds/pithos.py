@@ -36,12 +36,18 @@ from io import StringIO
 from pydoc import pager
 from os import path, walk, makedirs
 from threading import activeCount, enumerate as activethreads
+from itertools import islice
 
 from kamaki.clients.pithos import PithosClient, ClientError
+from kamaki.clients.astakos import CachedAstakosClient
+from kamaki.clients.pithos.hashcache import HashCache
+from kamaki.clients.pithos.journal import UploadJournal
+from kamaki.clients.pithos.blockstore import BlockStore
 from kamaki.clients.utils import escape_ctrl_chars
 
 from kamaki.cli import command
 from kamaki.cli.cmdtree import CommandTree
+from kamaki.cli.logger import get_logger
 from kamaki.cli.cmds import (
     CommandInit, dont_raise, OptionalOutput, NameFilter, errors, client_log)
 from kamaki.cli.errors import (
@@ -60,6 +66,55 @@ sharer_cmds = CommandTree('sharer', 'Pithos+/Storage sharers')
 group_cmds = CommandTree('group', 'Pithos+/Storage user groups')
 namespaces = [file_cmds, container_cmds, sharer_cmds, group_cmds]
 
+log = get_logger(__name__)
+
+#  Objects per listing page, the default page size of the Pithos+ server
+LISTING_PAGE_SIZE = 10000
+
+
+def _listing_page_size(limit):
+    """:returns: (int) the page size for listing up to limit objects"""
+    return min(limit, LISTING_PAGE_SIZE) if limit else None
+
+
+def get_hash_cache(config):
+    """:returns: (HashCache) the local block hash cache or None on failure"""
+    try:
+        return HashCache(
+            config.get('global', 'hashcache_file'),
+            limit=config.get('global', 'hashcache_limit'))
+    except Exception as e:
+        log.debug('Local hash cache is not available: %s' % e)
+        return None
+
+
+def get_upload_journal(config):
+    """:returns: (UploadJournal) the local upload journal or None on failure
+    """
+    try:
+        return UploadJournal(config.get('global', 'upload_journal_file'))
+    except Exception as e:
+        log.debug('Local upload journal is not available: %s' % e)
+        return None
+
+
+def get_block_store(config, client):
+    """:returns: (BlockStore) the local block store, checking blocks with
+        the hash algorithm of the container of client, or None if it is not
+        configured or on failure"""
+    dirpath = config.get('global', 'blockstore_dir')
+    if not dirpath:
+        return None
+    try:
+        blockhash = client.get_container_info()['x-container-block-hash']
+        return BlockStore(
+            path.expanduser(dirpath),
+            limit=config.get('global', 'blockstore_limit'),
+            blockhash=blockhash)
+    except Exception as e:
+        log.debug('Local block store is not available: %s' % e)
+        return None
+
 
 class _PithosInit(CommandInit):
     """Initilize a pithos+ client
@@ -96,6 +151,29 @@ class _PithosInit(CommandInit):
         self.container = self._custom_container() or 'pithos'
         self.client.container = self.container
 
+    def _summarize(self, action, outcomes, items='objects', unchanged=None):
+        """Report the outcome of operations run in parallel
+
+        :param action: (str) the operation, e.g., upload
+
+        :param outcomes: (list) (item, error), error is None on success
+
+        :param items: (str) what the items are, e.g., files
+
+        :param unchanged: (int) the number of items skipped, if any
+
+        :raises CLIError: if any of the items failed
+        """
+        failed = [(item, error) for item, error in outcomes if error]
+        self.error('Completed %s %s, %s%s failed' % (
+            len(outcomes) - len(failed), items, '' if unchanged is None else (
+                '%s unchanged, ' % unchanged), len(failed)))
+        if failed:
+            raise CLIError(
+                'Failed to %s %s of %s %s' % (
+                    action, len(failed), len(outcomes), items),
+                details=['%s: %s' % (item, error) for item, error in failed])
+
     def main(self):
         self._run()
 
@@ -285,8 +363,9 @@ class file_list(_PithosContainer, OptionalOutput, NameFilter):
 
     @errors.Pithos.container
     def _container_info(self):
-        r = self.client.container_get(
-            limit=False if self['more'] else self['limit'],
+        limit = None if self['more'] else (self['limit'] or None)
+        return list(islice(self.client.iter_objects(
+            limit=_listing_page_size(limit),
             marker=self['marker'],
             prefix=self.path,
             delimiter=self['delimiter'],
@@ -296,9 +375,7 @@ class file_list(_PithosContainer, OptionalOutput, NameFilter):
             if_modified_since=self['if_modified_since'],
             if_unmodified_since=self['if_unmodified_since'],
             until=self['until'],
-            meta=self['meta'])
-        files = list(r.json or [])
-        return files
+            meta=self['meta']), limit))
 
     @errors.Generic.all
     @errors.Pithos.connection
@@ -511,9 +588,33 @@ class file_delete(_PithosContainer):
         recursive=FlagArgument(
             'If a directory, empty first', ('-r', '--recursive')),
         delimiter=ValueArgument(
-            'delete objects prefixed with <object><delimiter>', '--delimiter')
+            'delete objects prefixed with <object><delimiter>', '--delimiter'),
+        parallel=IntArgument(
+            'With --recursive, delete up to N objects at once, retrying '
+            'failed ones (default: 1)',
+            '--parallel'),
     )
 
+    def _delete_parallel(self, prefix):
+        """Delete the objects under prefix in parallel, then the object"""
+        def done_cb(obj, result, error):
+            if error:
+                self.error(' * Deleting /%s/%s failed: %s' % (
+                    self.container, obj, error))
+
+        try:
+            results = self.client.bulk_object_operation(
+                'delete',
+                (o['name'] for o in self.client.iter_objects(prefix)),
+                parallel=self['parallel'],
+                done_cb=done_cb,
+                until=self['until_date'])
+        except KeyboardInterrupt:
+            raise CLIError('Canceled by user')
+        self._summarize('delete', [(obj, error) for (
+            obj, result, error) in results])
+        self.client.del_object(self.path, until=self['until_date'])
+
     @errors.Pithos.object_path
     def _delete_object(self):
         self.client.get_object_info(self.path)
@@ -522,10 +623,9 @@ class file_delete(_PithosContainer):
             # See if any objects exist under prefix
             # Add a trailing / to object's name
             prefix = self.path.rstrip('/') + '/'
-            result = self.client.container_get(prefix=prefix)
+            count = sum(1 for o in self.client.iter_objects(prefix))
 
-            if result.json:
-                count = len(result.json)
+            if count:
                 self.error(' * %d other object(s) with %s as prefix found' %
                     (count, prefix))
 
@@ -539,7 +639,9 @@ class file_delete(_PithosContainer):
 
                 self.error(' * %s!' % msg)
 
-            if not result.json or self.ask_user("Continue?"):
+            if not count or self.ask_user("Continue?"):
+                if self['recursive'] and (self['parallel'] or 1) > 1:
+                    return self._delete_parallel(prefix)
                 self.client.del_object(
                     self.path,
                     until=self['until_date'],
@@ -623,7 +725,7 @@ class _PithosFromTo(_PithosContainer):
         """
         src_objects, dst_objects, pairs = dict(), dict(), []
         try:
-            for obj in self.dst_client.list_objects(
+            for obj in self.dst_client.iter_objects(
                     prefix=self.dst_path or self.path or '/'):
                 dst_objects[obj['name']] = obj
         except ClientError as ce:
@@ -635,7 +737,7 @@ class _PithosFromTo(_PithosContainer):
             raise ce
         if self['source_prefix']:
             #  Copy and replace prefixes
-            for src_obj in self.client.list_objects(prefix=self.path):
+            for src_obj in self.client.iter_objects(prefix=self.path):
                 src_objects[src_obj['name']] = src_obj
             for src_path, src_obj in src_objects.items():
                 dst_path = '%s%s' % (
@@ -713,6 +815,81 @@ class _PithosFromTo(_PithosContainer):
                             self.arguments['force'].lvalue)])
         return pairs
 
+    def _clone_objects(self, transfer_name, parallel, **kwargs):
+        """Clone objects in parallel (see PithosClient.clone_objects), create
+        directories first
+
+        :param kwargs: clone_object keyword arguments for all objects
+        """
+        clones = []
+        for src, dst in self._src_dst(kwargs.get('source_version', None)):
+            if src and dst:
+                clones.append((src, dst, None))
+            elif dst:
+                self._report_transfer(src, dst, transfer_name)
+                self.dst_client.create_directory(dst)
+
+        def done_cb(src, dst, headers, error):
+            if error:
+                self.error('  %s /%s/%s failed: %s' % (
+                    transfer_name, self.container, src, error))
+                return
+            self._report_transfer(src, dst, transfer_name)
+
+        try:
+            results = self.dst_client.clone_objects(
+                clones,
+                source=self.client,
+                parallel=parallel,
+                done_cb=done_cb,
+                **kwargs)
+        except KeyboardInterrupt:
+            raise CLIError('Canceled by user')
+        self._summarize(transfer_name, [(src, error) for (
+            src, dst, headers, error) in results])
+
+    def _bulk_transfer(self, operation, parallel, **kwargs):
+        """Copy or move objects in parallel (see
+        PithosClient.bulk_object_operation), create directories first and
+        delete moved directories last
+
+        :param kwargs: operation keyword arguments for all objects
+        """
+        objects, dsts, leftovers = [], dict(), []
+        for src, dst in self._src_dst(kwargs.get('source_version', None)):
+            if src and dst:
+                objects.append((src, dict(dst_object=dst)))
+                dsts[src] = dst
+            elif dst:
+                self._report_transfer(src, dst, operation)
+                self.dst_client.create_directory(dst)
+            elif operation in ('move', ):
+                leftovers.append(src)
+
+        def done_cb(src, result, error):
+            if error:
+                self.error('  %s /%s/%s failed: %s' % (
+                    operation, self.container, src, error))
+                return
+            self._report_transfer(src, dsts[src], operation)
+
+        try:
+            results = self.dst_client.bulk_object_operation(
+                operation, objects,
+                parallel=parallel,
+                done_cb=done_cb,
+                src_container=self.client.container,
+                dst_container=self.dst_client.container,
+                source_account=self.client.account,
+                **kwargs)
+        except KeyboardInterrupt:
+            raise CLIError('Canceled by user')
+        self._summarize(operation, [(src, error) for (
+            src, result, error) in results])
+        for src in leftovers:
+            self._report_transfer(src, None, operation)
+            self.client.del_object(src)
+
     def _run(self, source_path_or_url, destination_path_or_url=''):
         super(_PithosFromTo, self)._run(source_path_or_url)
         dst_acc, dst_con, dst_path = self.resolve_pithos_url(
@@ -734,7 +911,16 @@ class file_copy(_PithosFromTo):
         content_type=ValueArgument(
             'change object\'s content type', '--content-type'),
         source_version=ValueArgument(
-            'The version of the source object', '--object-version')
+            'The version of the source object', '--object-version'),
+        clone=FlagArgument(
+            'Put the hashmap of each source object at the destination '
+            'instead of a server-side copy, no data are transferred if the '
+            'destination has the blocks',
+            '--clone'),
+        parallel=IntArgument(
+            'Copy up to N objects at once, retrying failed ones '
+            '(default: 1, with --clone: 8)',
+            '--parallel'),
     )
 
     @errors.Generic.all
@@ -742,6 +928,20 @@ class file_copy(_PithosFromTo):
     @errors.Pithos.container
     @errors.Pithos.account
     def _run(self):
+        if self['clone']:
+            return self._clone_objects(
+                'clone',
+                parallel=self['parallel'] or 8,
+                source_version=self['source_version'],
+                public=self['public'],
+                content_type=self['content_type'])
+        if (self['parallel'] or 1) > 1:
+            return self._bulk_transfer(
+                'copy',
+                parallel=self['parallel'],
+                source_version=self['source_version'],
+                public=self['public'],
+                content_type=self['content_type'])
         for src, dst in self._src_dst(self['source_version']):
             self._report_transfer(src, dst, 'copy')
             if src and dst:
@@ -770,7 +970,11 @@ class file_move(_PithosFromTo):
     arguments = dict(
         public=ValueArgument('publish new object', '--public'),
         content_type=ValueArgument(
-            'change object\'s content type', '--content-type')
+            'change object\'s content type', '--content-type'),
+        parallel=IntArgument(
+            'Move up to N objects at once, retrying failed ones '
+            '(default: 1)',
+            '--parallel'),
     )
 
     @errors.Generic.all
@@ -778,6 +982,12 @@ class file_move(_PithosFromTo):
     @errors.Pithos.container
     @errors.Pithos.account
     def _run(self):
+        if (self['parallel'] or 1) > 1:
+            return self._bulk_transfer(
+                'move',
+                parallel=self['parallel'],
+                public=self['public'],
+                content_type=self['content_type'])
         for src, dst in self._src_dst():
             self._report_transfer(src, dst, 'move')
             if src and dst:
@@ -800,6 +1010,95 @@ class file_move(_PithosFromTo):
         self._run()
 
 
+@command(file_cmds)
+class file_transfer(_PithosFromTo):
+    """Transfer objects between two clouds, without a local copy
+    The hashmap of each source object is put at the destination and only the
+    blocks missing from the destination are copied, from source to
+    destination, block by block
+    """
+
+    arguments = dict(
+        from_cloud=ValueArgument(
+            'The cloud of the source (default: current cloud)',
+            '--from-cloud'),
+        to_cloud=ValueArgument('The cloud of the destination', '--to-cloud'),
+        parallel=IntArgument(
+            'Transfer up to N objects at once (default: 4)', '--parallel'),
+        max_threads=IntArgument(
+            'Blocks in flight, shared by all objects (default: 5)',
+            '--threads'),
+    )
+    required = ('to_cloud', )
+
+    def __init__(self, arguments={}, astakos=None, cloud=None):
+        super(file_transfer, self).__init__(arguments, astakos, cloud)
+        #  User names are resolved by the destination cloud
+        self['destination_user'] = ValueArgument(
+            'UUID, default: the user of the destination cloud',
+            '--to-account')
+
+    def _cloud_astakos(self, cloud):
+        """:returns: (CachedAstakosClient) authenticated for cloud"""
+        try:
+            url = self.config.get_cloud(cloud, 'url')
+            token = self.config.get_cloud(cloud, 'token').split()[0]
+        except (KeyError, IndexError):
+            raise CLIError(
+                'Cloud "%s" is not configured' % cloud, importance=2,
+                details=[
+                    'To configure a cloud:',
+                    '  kamaki config set cloud.%s.url URL' % cloud,
+                    '  kamaki config set cloud.%s.token TOKEN' % cloud])
+        astakos = CachedAstakosClient(url, token)
+        astakos.authenticate()
+        return astakos
+
+    @errors.Generic.all
+    @errors.Pithos.connection
+    def _connect(self, source_path_or_url, destination_path_or_url):
+        src_cloud = self['from_cloud'] or self.cloud
+        dst_cloud = self['to_cloud']
+        if src_cloud != self.cloud:
+            self.cloud, self.astakos = src_cloud, self._cloud_astakos(
+                src_cloud)
+        src_astakos = self.astakos
+        dst_astakos = src_astakos if (
+            dst_cloud == src_cloud) else self._cloud_astakos(dst_cloud)
+        super(_PithosFromTo, self)._run(source_path_or_url)
+
+        dst_acc, dst_con, dst_path = self.resolve_pithos_url(
+            destination_path_or_url)
+        self.cloud, self.astakos = dst_cloud, dst_astakos
+        try:
+            self.dst_client = self.get_client(PithosClient, 'pithos')
+            self.dst_client.account = self['destination_user'] or (
+                dst_acc or self._custom_uuid() or dst_astakos.user_term(
+                    'id', self.dst_client.token))
+            self.dst_client.container = self['destination_container'] or (
+                dst_con or self._custom_container() or 'pithos')
+        finally:
+            self.cloud, self.astakos = src_cloud, src_astakos
+        self.dst_path = dst_path or self.path
+
+    @errors.Generic.all
+    @errors.Pithos.connection
+    @errors.Pithos.container
+    @errors.Pithos.account
+    def _run(self):
+        self.client.MAX_THREADS = int(self['max_threads'] or 5)
+        self.dst_client.MAX_THREADS = self.client.MAX_THREADS
+        self._clone_objects(
+            'transfer',
+            parallel=self['parallel'] or 4,
+            source_version=self['source_version'],
+            relay=True)
+
+    def main(self, source_path_or_url, destination_path_or_url=None):
+        self._connect(source_path_or_url, destination_path_or_url or '')
+        self._run()
+
+
 @command(file_cmds)
 class file_append(_PithosContainer):
     """Append local file to (existing) remote object
@@ -874,6 +1173,14 @@ class file_overwrite(_PithosContainer):
         start_position=IntArgument('File position in bytes', '--from'),
         end_position=IntArgument('File position in bytes', '--to'),
         object_version=ValueArgument('File to overwrite', '--object-version'),
+        block_diff=FlagArgument(
+            'Upload only the changed blocks of the range and update the '
+            'remote hashmap, instead of posting the whole range',
+            '--block-diff'),
+        max_threads=IntArgument(
+            'Upload up to N changed blocks at once (default: 5, with '
+            '--block-diff)',
+            '--threads'),
     )
     required = ('start_position', 'end_position')
 
@@ -883,6 +1190,7 @@ class file_overwrite(_PithosContainer):
     @errors.Pithos.object_size
     def _run(self, local_path, start, end):
         start, end = int(start), int(end)
+        self.client.MAX_THREADS = int(self['max_threads'] or 5)
         (progress_bar, upload_cb) = self._safe_progress_bar(
             'Overwrite %s bytes' % (end - start))
         try:
@@ -893,7 +1201,8 @@ class file_overwrite(_PithosContainer):
                     end=end,
                     source_file=f,
                     source_version=self['object_version'],
-                    upload_cb=upload_cb)
+                    upload_cb=upload_cb,
+                    block_diff=self['block_diff'])
         except ClientError as ce:
             if ce.status in (404, ):
                 self._container_exists()
@@ -915,7 +1224,9 @@ class file_upload(_PithosContainer):
     """Upload a file
 
     The default destination is /pithos/NAME
-    where NAME is the base name of the source path"""
+    where NAME is the base name of the source path
+    Use - as the source path to upload from the standard input, e.g.,
+    tar c DIR | kamaki file upload - /CONTAINER/backup.tar"""
 
     arguments = dict(
         max_threads=IntArgument('default: 5', '--threads'),
@@ -947,6 +1258,33 @@ class file_upload(_PithosContainer):
             'Confirm upload with a custom checksum (MD5)', '--etag'),
         use_hashes=FlagArgument(
             'Source file contains hashmap not data', '--source-is-hashmap'),
+        pipelined=FlagArgument(
+            'Hash and upload blocks in a single pass over the file',
+            '--pipelined'),
+        hash_workers=IntArgument(
+            'Number of parallel block hashing workers (default: 1)',
+            '--hash-workers'),
+        hash_processes=FlagArgument(
+            'Hash blocks in processes instead of threads', '--hash-processes'),
+        no_hash_cache=FlagArgument(
+            'Do not use or update the local cache of block hashes',
+            '--no-hash-cache'),
+        dedup=FlagArgument(
+            'Upload blocks shared among files only once (hash all files '
+            'first, then upload the distinct missing blocks)',
+            '--dedup'),
+        parallel_files=IntArgument(
+            'Upload up to N files at once, sharing the --threads budget '
+            '(default: 1)',
+            '--parallel-files'),
+        block_batch_size=IntArgument(
+            'Upload small missing blocks in requests of up to N bytes '
+            '(default: a request per block)',
+            '--block-batch-size'),
+        resume=FlagArgument(
+            'Resume an interrupted upload of the same file, without '
+            're-hashing it or re-uploading blocks (implies -f)',
+            '--resume'),
     )
 
     def _sharing(self):
@@ -962,8 +1300,8 @@ class file_upload(_PithosContainer):
     def _check_container_limit(self, path):
         cl_dict = self.client.get_container_limit()
         container_limit = int(cl_dict['x-container-policy-quota'])
-        r = self.client.container_get()
-        used_bytes = sum(int(o['bytes']) for o in r.json)
+        used_bytes = sum(
+            int(o['bytes']) for o in self.client.iter_objects())
         path_size = get_path_size(path)
         if container_limit and path_size > (container_limit - used_bytes):
             raise CLIError(
@@ -990,14 +1328,14 @@ class file_upload(_PithosContainer):
                 raise CLIError('%s is a directory' % lpath, details=[
                     'Use %s to upload directories & contents' % (
                         self.arguments['recursive'].lvalue)])
-            robj = self.client.container_get(path=rpath)
-            if not self['overwrite']:
-                if robj.json:
+            existing = list(self.client.iter_objects(path=rpath))
+            if not (self['overwrite'] or self['resume']):
+                if existing:
                     raise CLIError(
                         'Objects/files prefixed as %s already exist' % rpath,
                         details=['Existing objects:'] + ['\t/%s\t[%s]' % (
                             o['name'],
-                            o['content_type']) for o in robj.json] + [
+                            o['content_type']) for o in existing] + [
                             'Use -f to add, overwrite or resume'])
                 else:
                     try:
@@ -1042,7 +1380,7 @@ class file_upload(_PithosContainer):
                 if remote_path and self.object_is_dir(robj):
                     rpath += '/%s' % (short_path.replace(path.sep, '/'))
                     self.client.get_object_info(rpath)
-                if not self['overwrite']:
+                if not (self['overwrite'] or self['resume']):
                     raise CLIError(
                         'Object /%s/%s already exists' % (
                             self.container, rpath),
@@ -1057,6 +1395,13 @@ class file_upload(_PithosContainer):
 
     def _run(self, local_path, remote_path):
         self.client.MAX_THREADS = int(self['max_threads'] or 5)
+        self.client.HASH_WORKERS = int(self['hash_workers'] or 1)
+        self.client.HASH_WITH_PROCESSES = self['hash_processes']
+        self.client.BLOCK_BATCH_SIZE = int(self['block_batch_size'] or 0)
+        if not self['no_hash_cache']:
+            self.client.hash_cache = get_hash_cache(self.config)
+        self.client.upload_journal = get_upload_journal(self.config)
+        self.client.block_store = get_block_store(self.config, self.client)
         params = dict(
             content_encoding=self['content_encoding'],
             content_type=self['content_type'],
@@ -1065,6 +1410,18 @@ class file_upload(_PithosContainer):
             public=self['public'])
         container_info_cache = dict()
         rpref = 'pithos://%s' if self['account'] else ''
+        if local_path == '-':
+            self._run_stream(
+                remote_path, params, container_info_cache, rpref)
+            return
+        if self['dedup']:
+            self._run_dedup(
+                local_path, remote_path, params, container_info_cache, rpref)
+            return
+        if (self['parallel_files'] or 1) > 1:
+            self._run_parallel(
+                local_path, remote_path, params, container_info_cache, rpref)
+            return
         for f, rpath in self._src_dst(local_path, remote_path):
             self.error('%s --> %s/%s/%s' % (
                 f.name, rpref, self.client.container, rpath))
@@ -1092,8 +1449,11 @@ class file_upload(_PithosContainer):
                         hash_cb=hash_cb,
                         upload_cb=upload_cb,
                         container_info_cache=container_info_cache,
+                        pipelined=self['pipelined'],
+                        resume=self['resume'],
                         **params)
                 except KeyboardInterrupt:
+                    self.client.close_worker_pool()
                     timeout = 0.5
                     msg = '\n'
                     while activeCount() > 1:
@@ -1123,9 +1483,159 @@ class file_upload(_PithosContainer):
                 self.write('%s\n' % obj.get('x-object-public', ''))
             self.error('Upload completed')
 
+    def _run_stream(self, remote_path, params, container_info_cache, rpref):
+        try:
+            robj = self.client.get_object_info(remote_path)
+            if self.object_is_dir(robj):
+                raise CLIError(
+                    'Object /%s/%s is a directory' % (
+                        self.container, remote_path),
+                    details=['Provide the full path of the new object'])
+            if not self['overwrite']:
+                raise CLIError(
+                    'Object /%s/%s already exists' % (
+                        self.container, remote_path),
+                    details=['use -f to overwrite'])
+        except ClientError as ce:
+            if ce.status in (404, ):
+                self._container_exists()
+            else:
+                raise
+        self.error('<stdin> --> %s/%s/%s' % (
+            rpref, self.client.container, remote_path))
+        if not (self['content_type'] and self['content_encoding']):
+            ctype, cenc = guess_mime_type(remote_path)
+            params['content_type'] = self['content_type'] or ctype
+            params['content_encoding'] = self['content_encoding'] or cenc
+        try:
+            self.client.upload_from_stream(
+                remote_path, self._in,
+                etag=self['md5_checksum'],
+                container_info_cache=container_info_cache,
+                **params)
+        except KeyboardInterrupt:
+            self.client.close_worker_pool()
+            raise CLIError('Upload canceled by user')
+        if self['public']:
+            obj = self.client.get_object_info(remote_path)
+            self.write('%s\n' % obj.get('x-object-public', ''))
+        self.error('Upload completed')
+
+    def _run_dedup(
+            self, local_path, remote_path, params, container_info_cache,
+            rpref):
+        uploads = []
+        for f, rpath in self._src_dst(local_path, remote_path):
+            self.error('%s --> %s/%s/%s' % (
+                f.name, rpref, self.client.container, rpath))
+            obj_params = dict(params)
+            if not (self['content_type'] and self['content_encoding']):
+                ctype, cenc = guess_mime_type(f.name)
+                obj_params['content_type'] = self['content_type'] or ctype
+                obj_params['content_encoding'] = self[
+                    'content_encoding'] or cenc
+            #  Files are reopened when needed, to spare file descriptors
+            uploads.append((rpath, f.name, obj_params))
+            f.close()
+
+        (progress_bar, upload_cb) = self._safe_progress_bar(
+            'Uploading %s files' % len(uploads))
+        hash_cb = progress_bar.clone().get_generator(
+            'Calculating block hashes') if progress_bar else None
+        try:
+            self.client.upload_objects(
+                uploads,
+                hash_cb=hash_cb,
+                upload_cb=upload_cb,
+                container_info_cache=container_info_cache)
+        except KeyboardInterrupt:
+            self.client.close_worker_pool()
+            raise CLIError('Upload canceled by user')
+        finally:
+            self._safe_progress_bar_finish(progress_bar)
+
+        if self['public']:
+            for rpath, src, obj_params in uploads:
+                obj = self.client.get_object_info(rpath)
+                self.write('%s\n' % obj.get('x-object-public', ''))
+        self.error('Upload completed')
+
+    def _run_parallel(
+            self, local_path, remote_path, params, container_info_cache,
+            rpref):
+        def uploads():
+            for f, rpath in self._src_dst(local_path, remote_path):
+                obj_params = dict(
+                    params, pipelined=self['pipelined'], resume=self['resume'])
+                if not (self['content_type'] and self['content_encoding']):
+                    ctype, cenc = guess_mime_type(f.name)
+                    obj_params['content_type'] = self['content_type'] or ctype
+                    obj_params['content_encoding'] = self[
+                        'content_encoding'] or cenc
+                #  Files are reopened when uploaded, to spare descriptors
+                f.close()
+                yield rpath, f.name, obj_params
+
+        def done_cb(rpath, src, headers, error):
+            if error:
+                self.error('%s --> %s/%s/%s failed: %s' % (
+                    src, rpref, self.client.container, rpath, error))
+                return
+            self.error('%s --> %s/%s/%s' % (
+                src, rpref, self.client.container, rpath))
+            if self['public']:
+                obj = self.client.get_object_info(rpath)
+                self.write('%s\n' % obj.get('x-object-public', ''))
+
+        try:
+            results = self.client.upload_objects_concurrently(
+                uploads(),
+                parallel=self['parallel_files'],
+                done_cb=done_cb,
+                container_info_cache=container_info_cache)
+        except KeyboardInterrupt:
+            raise CLIError('Upload canceled by user')
+        self._summarize('upload', [(rpath, error) for (
+            rpath, headers, error) in results], 'files')
+        self.error('Upload completed')
+
     def main(self, local_path, remote_path_or_url=None):
         super(self.__class__, self)._run(remote_path_or_url)
-        if local_path.endswith('.') or local_path.endswith(path.sep):
+        for arg in (
+                'unchunked', 'pipelined', 'use_hashes', 'parallel_files',
+                'resume'):
+            if self['dedup'] and self[arg]:
+                raise CLIInvalidArgument(
+                    '%s cannot be used with %s' % (
+                        self.arguments['dedup'].lvalue,
+                        self.arguments[arg].lvalue))
+        for arg in ('unchunked', 'use_hashes'):
+            if self['resume'] and self[arg]:
+                raise CLIInvalidArgument(
+                    '%s cannot be used with %s' % (
+                        self.arguments['resume'].lvalue,
+                        self.arguments[arg].lvalue))
+            if (self['parallel_files'] or 1) > 1 and self[arg]:
+                raise CLIInvalidArgument(
+                    '%s cannot be used with %s' % (
+                        self.arguments['parallel_files'].lvalue,
+                        self.arguments[arg].lvalue))
+        if local_path == '-':
+            for arg in (
+                    'recursive', 'unchunked', 'use_hashes', 'dedup',
+                    'parallel_files', 'resume'):
+                if self[arg]:
+                    raise CLIInvalidArgument(
+                        '%s cannot be used when uploading from stdin' % (
+                            self.arguments[arg].lvalue))
+            if not self.path:
+                raise CLISyntaxError(
+                    'Remote path is required when uploading from stdin',
+                    details=[
+                        'e.g., tar c DIR | kamaki file upload - '
+                        '/CONTAINER/backup.tar'])
+            remote_path = self.path
+        elif local_path.endswith('.') or local_path.endswith(path.sep):
             remote_path = self.path or ''
         else:
             remote_path = self.path or path.basename(path.abspath(local_path))
@@ -1182,13 +1692,24 @@ class file_cat(_PithosContainer):
         if_unmodified_since=DateArgument(
             'show output unmodified since then', '--if-unmodified-since'),
         object_version=ValueArgument(
-            'Get contents of the chosen version', '--object-version')
+            'Get contents of the chosen version', '--object-version'),
+        max_threads=IntArgument(
+            'Fetch up to N blocks at once, output stays in order '
+            '(default: 5)',
+            '--threads'),
+        range_batch_size=IntArgument(
+            'Download adjacent blocks in ranges of up to N bytes '
+            '(default: a range per block)',
+            '--range-batch-size'),
     )
 
     @errors.Generic.all
     @errors.Pithos.connection
     @errors.Pithos.object_path
     def _run(self):
+        self.client.MAX_THREADS = int(self['max_threads'] or 5)
+        self.client.RANGE_BATCH_SIZE = int(self['range_batch_size'] or 0)
+        self.client.block_store = get_block_store(self.config, self.client)
         try:
             self.client.download_object(
                 self.path, self._out,
@@ -1231,20 +1752,28 @@ class file_download(_PithosContainer):
         object_version=ValueArgument(
             'download a file of a specific version', '--object-version'),
         max_threads=IntArgument('default: 5', '--threads'),
+        range_batch_size=IntArgument(
+            'Download adjacent blocks in ranges of up to N bytes '
+            '(default: a range per block)',
+            '--range-batch-size'),
         progress_bar=ProgressBarArgument(
             'do not show progress bar', ('-N', '--no-progress-bar'),
             default=False),
         recursive=FlagArgument(
             'Download a remote directory object and its contents',
-            ('-r', '--recursive'))
+            ('-r', '--recursive')),
+        parallel_files=IntArgument(
+            'Download up to N files at once, sharing the --threads budget '
+            '(default: 1)',
+            '--parallel-files'),
         )
 
-    def _src_dst(self, local_path):
-        """Create a list of (src, dst) where src is a remote location and dst
-        is an open file descriptor. Directories are denoted as (None, dirpath)
-        and they are pretended to other objects in a very strict order (shorter
-        to longer path)."""
-        ret, obj = [], None
+    def _plan(self, local_path):
+        """Yield (src, dst, resume) where src is a remote location and dst is
+        a local path, as the remote objects are listed. Directories are
+        denoted as (None, dirpath, None) and, since objects are listed in
+        order, they precede their contents"""
+        obj = None
         # The prefix is actually the relative remote path without
         # the trailing separator.
         prefix = self.path.rstrip('/')
@@ -1279,17 +1808,11 @@ class file_download(_PithosContainer):
         # We requested to download either a whole container or a directory
         if (not obj) or self.object_is_dir(obj):
             if self['recursive']:
-                obj = obj or dict(
-                    name='', content_type='application/directory')
-                dirs, files = [], []
-                result = self.client.container_get(
-                    prefix=prefix,
-                    if_modified_since=self['modified_since_date'],
-                    if_unmodified_since=self['unmodified_since_date'])
-
                 # Find the final local path for each remote object
-                # [(remote name, final local path),.]
-                for o in result.json:
+                for o in self.client.iter_objects(
+                        prefix,
+                        if_modified_since=self['modified_since_date'],
+                        if_unmodified_since=self['unmodified_since_date']):
                     remote = o['name']
                     # First find the relative path of the object
                     # without the prefix and any leading '/'
@@ -1298,44 +1821,36 @@ class file_download(_PithosContainer):
                     norm = relative.replace('/', path.sep)
                     # Append it to the desired local path
                     final = path.join(local_path, norm)
-                    if self.object_is_dir(o):
-                        dirs.append((remote, final))
-                    else:
-                        files.append((remote, final))
                     self.error(r"%s -> %s" % (remote, final))
 
-                #  Put the directories on top of the list
-                for dpath in sorted(p for _, p in dirs):
-                    if path.exists(dpath):
-                        if path.isdir(dpath):
-                            continue
-                        raise CLIError(
-                            'Cannot replace local file %s with a directory '
-                            'of the same name' % dpath,
-                            details=[
-                                'Either remove the file or specify a'
-                                'different target location'])
-                    ret.append((None, dpath, None))
-
-                #  Append the file objects
-                for opath, lpath in files:
-                    if self['resume']:
-                        fxists = path.exists(lpath)
-                        if fxists and path.isdir(lpath):
+                    if self.object_is_dir(o):
+                        if path.exists(final):
+                            if path.isdir(final):
+                                continue
+                            raise CLIError(
+                                'Cannot replace local file %s with a '
+                                'directory of the same name' % final,
+                                details=[
+                                    'Either remove the file or specify a'
+                                    'different target location'])
+                        yield (None, final, None)
+                    elif self['resume']:
+                        fxists = path.exists(final)
+                        if fxists and path.isdir(final):
                             raise CLIError(
                                 'Cannot change local dir %s into a file' % (
-                                    lpath),
+                                    final),
                                 details=[
                                     'Either remove the file or specify a'
                                     'different target location'])
-                        ret.append((opath, lpath, fxists))
-                    elif path.exists(lpath):
+                        yield (remote, final, fxists)
+                    elif path.exists(final):
                         raise CLIError(
-                            'Cannot overwrite %s' % lpath,
+                            'Cannot overwrite %s' % final,
                             details=['To overwrite/resume, use  %s' % (
                                 self.arguments['resume'].lvalue)])
                     else:
-                        ret.append((opath, lpath, None))
+                        yield (remote, final, None)
             elif prefix:
                 raise CLIError(
                     'Remote object /%s/%s is a directory' % (
@@ -1363,11 +1878,13 @@ class file_download(_PithosContainer):
             elif path.sep in local_path:
                 # Delegate intermediate local dir cration
                 # to makedirs() inside _run()
-                d = path.dirname(local_path)
-                ret.append((None, d, None))
-            ret.append((prefix, local_path, self['resume']))
+                yield (None, path.dirname(local_path), None)
+            yield (prefix, local_path, self['resume'])
 
-        for r, l, resume in ret:
+    def _src_dst(self, local_path):
+        """Yield (src, dst) where src is a remote location and dst is an open
+        file descriptor. Directories are denoted as (None, dirpath)"""
+        for r, l, resume in self._plan(local_path):
             if r:
                 mode = 'rb+' if resume and path.exists(l) else 'wb+'
                 with open(l, mode) as f:
@@ -1375,6 +1892,43 @@ class file_download(_PithosContainer):
             else:
                 yield (r, l)
 
+    def _run_parallel(self, local_path):
+        """Download up to parallel_files objects at a time, as they are
+        listed, each destination is opened only when its download starts"""
+        def downloads():
+            for rpath, lpath, resume in self._plan(local_path):
+                if not rpath:
+                    if not path.exists(lpath):
+                        self.error('Create local directory %s' % lpath)
+                        makedirs(lpath)
+                    continue
+                yield rpath, lpath, None
+
+        def done_cb(rpath, lpath, headers, error):
+            if error:
+                self.error('/%s/%s --> %s failed: %s' % (
+                    self.container, rpath, lpath, error))
+                return
+            self.error('/%s/%s --> %s' % (self.container, rpath, lpath))
+
+        try:
+            results = self.client.download_objects_concurrently(
+                downloads(),
+                parallel=self['parallel_files'],
+                done_cb=done_cb,
+                range_str=self['range'],
+                version=self['object_version'],
+                if_match=self['matching_etag'],
+                resume=self['resume'],
+                if_none_match=self['non_matching_etag'],
+                if_modified_since=self['modified_since_date'],
+                if_unmodified_since=self['unmodified_since_date'])
+        except KeyboardInterrupt:
+            raise CLIError('Download canceled by user')
+        self._summarize('download', [(rpath, error) for (
+            rpath, headers, error) in results], 'files')
+        self.error('Download completed')
+
     @errors.Generic.all
     @errors.Pithos.connection
     @errors.Pithos.container
@@ -1383,6 +1937,11 @@ class file_download(_PithosContainer):
     @errors.Pithos.local_path_download
     def _run(self, local_path):
         self.client.MAX_THREADS = int(self['max_threads'] or 5)
+        self.client.RANGE_BATCH_SIZE = int(self['range_batch_size'] or 0)
+        self.client.block_store = get_block_store(self.config, self.client)
+        if (self['parallel_files'] or 1) > 1:
+            self._run_parallel(local_path)
+            return
         progress_bar = None
         try:
             # From _src_dst():
@@ -1411,6 +1970,7 @@ class file_download(_PithosContainer):
                     if_modified_since=self['modified_since_date'],
                     if_unmodified_since=self['unmodified_since_date'])
         except KeyboardInterrupt:
+            self.client.close_worker_pool()
             timeout = 0.5
             msg = '\n'
             while activeCount() > 1:
@@ -1448,6 +2008,146 @@ class file_download(_PithosContainer):
         self._run(local_path=local_path)
 
 
+@command(file_cmds)
+class file_sync(_PithosContainer):
+    """Synchronize a local directory with a remote directory, block by block
+    Files are compared by size and block hashes, and local block hashes are
+    kept in a cache (see hashcache_file), so unchanged local files are not
+    hashed again. Unchanged files are skipped and, of the changed ones, only
+    the blocks missing from the destination are transferred.
+    Files missing from the source are not removed from the destination.
+    """
+
+    arguments = dict(
+        download=FlagArgument(
+            'Sync the local directory from the remote one (default: sync '
+            'the remote directory from the local one)',
+            '--download'),
+        max_threads=IntArgument('default: 5', '--threads'),
+        parallel_files=IntArgument(
+            'Transfer up to N files at once, sharing the --threads budget '
+            '(default: 1)',
+            '--parallel-files'),
+        no_hash_cache=FlagArgument(
+            'Do not use or update the local cache of block hashes',
+            '--no-hash-cache'),
+    )
+
+    def _remote_path(self, prefix, relative):
+        relative = relative.replace(path.sep, '/').strip('/')
+        return '/'.join([p for p in (prefix, relative) if p])
+
+    def _sync_up(self, local_dir, prefix, skipped):
+        """Yield (remote path, local path, None) for local files that differ
+        from their remote copies, create missing remote directories"""
+        remote = dict((o['name'], o) for o in self.client.iter_objects(
+            '%s/' % prefix if prefix else ''))
+        if prefix:
+            try:
+                self.client.get_object_info(prefix)
+            except ClientError as ce:
+                if ce.status not in (404, ):
+                    raise
+                self.error('remote: mkdir /%s/%s' % (self.container, prefix))
+                self.client.create_directory(prefix)
+        for top, subdirs, files in walk(local_dir):
+            subdirs.sort()
+            relative = path.relpath(top, local_dir)
+            rtop = self._remote_path(prefix, '' if (
+                relative == path.curdir) else relative)
+            if rtop != prefix and rtop not in remote:
+                self.error('remote: mkdir /%s/%s' % (self.container, rtop))
+                self.client.create_directory(rtop)
+            for f in sorted(files):
+                lpath = path.join(top, f)
+                if not path.isfile(lpath):
+                    self.error('%s not a regular file' % lpath)
+                    continue
+                rpath = self._remote_path(rtop, f)
+                o = remote.get(rpath)
+                if o and not self.object_is_dir(o):
+                    with open(lpath, 'rb') as fobj:
+                        if self.client.file_matches_object(
+                                rpath, fobj, o['bytes']):
+                            skipped.append(rpath)
+                            continue
+                yield rpath, lpath, None
+
+    def _sync_down(self, local_dir, prefix, skipped):
+        """Yield (remote path, local path, None) for remote objects that
+        differ from their local copies, create missing local directories"""
+        for o in self.client.iter_objects('%s/' % prefix if prefix else ''):
+            rpath = o['name']
+            relative = rpath[len(prefix):].strip('/')
+            lpath = path.join(local_dir, relative.replace('/', path.sep))
+            if self.object_is_dir(o):
+                if not path.isdir(lpath):
+                    self.error('Create local directory %s' % lpath)
+                    makedirs(lpath)
+                continue
+            if path.isdir(lpath):
+                raise CLIError(
+                    'Cannot change local dir %s into a file' % lpath,
+                    details=[
+                        'Either remove the directory or specify a '
+                        'different target location'])
+            if path.isfile(lpath):
+                with open(lpath, 'rb') as fobj:
+                    if self.client.file_matches_object(
+                            rpath, fobj, o['bytes']):
+                        skipped.append(rpath)
+                        continue
+            elif not path.isdir(path.dirname(lpath)):
+                makedirs(path.dirname(lpath))
+            yield rpath, lpath, None
+
+    @errors.Generic.all
+    @errors.Pithos.connection
+    @errors.Pithos.container
+    @errors.Pithos.local_path
+    def _run(self, local_path):
+        self.client.MAX_THREADS = int(self['max_threads'] or 5)
+        if not self['no_hash_cache']:
+            self.client.hash_cache = get_hash_cache(self.config)
+        self.client.block_store = get_block_store(self.config, self.client)
+        prefix, skipped = self.path.strip('/'), []
+
+        def done_cb(rpath, lpath, headers, error):
+            src, dst = (rpath, lpath) if self['download'] else (lpath, rpath)
+            self.error('%s --> %s%s' % (src, dst, (
+                ' failed: %s' % error) if error else ''))
+
+        try:
+            if self['download']:
+                results = self.client.download_objects_concurrently(
+                    self._sync_down(local_path, prefix, skipped),
+                    parallel=self['parallel_files'] or 1,
+                    done_cb=done_cb,
+                    resume=True)
+            else:
+                results = self.client.upload_objects_concurrently(
+                    self._sync_up(local_path, prefix, skipped),
+                    parallel=self['parallel_files'] or 1,
+                    done_cb=done_cb,
+                    container_info_cache=dict())
+        except KeyboardInterrupt:
+            raise CLIError('Sync canceled by user')
+        self._summarize('sync', [(rpath, error) for (
+            rpath, headers, error) in results], 'files', len(skipped))
+        self.error('Sync completed')
+
+    def main(self, local_dir, remote_path_or_url):
+        super(self.__class__, self)._run(remote_path_or_url)
+        if self['download']:
+            if path.exists(local_dir) and not path.isdir(local_dir):
+                raise CLIError('%s is not a directory' % local_dir)
+            if not path.exists(local_dir):
+                makedirs(local_dir)
+        elif not path.isdir(local_dir):
+            raise CLIError('%s is not a directory' % local_dir)
+        self._run(local_path=path.abspath(local_dir))
+
+
 @command(container_cmds)
 class container_info(_PithosAccount, OptionalOutput):
     """Get information about a container"""
@@ -1603,14 +2303,14 @@ class container_list(_PithosAccount, OptionalOutput, NameFilter):
         try:
             for container in container_list:
                 self.client.container = container['name']
-                objects = self.client.container_get(
-                    limit=False if self['more'] else self['limit'],
+                limit = None if self['more'] else (self['limit'] or None)
+                container['objects'] = list(islice(self.client.iter_objects(
+                    limit=_listing_page_size(limit),
                     if_modified_since=self['modified_since_date'],
                     if_unmodified_since=self['unmodified_since_date'],
                     until=self['until_date'],
                     show_only_shared=self['shared_by_me'],
-                    public=self['public'])
-                container['objects'] = objects.json
+                    public=self['public']), limit))
         finally:
             self.client.container = None
 
@@ -1620,14 +2320,15 @@ class container_list(_PithosAccount, OptionalOutput, NameFilter):
     def _run(self):
         container = self.container
         if container:
-            r = self.client.container_get(
-                limit=False if self['more'] else self['limit'],
+            limit = None if self['more'] else (self['limit'] or None)
+            items = list(islice(self.client.iter_objects(
+                limit=_listing_page_size(limit),
                 marker=self['marker'],
                 if_modified_since=self['modified_since_date'],
                 if_unmodified_since=self['unmodified_since_date'],
                 until=self['until_date'],
                 show_only_shared=self['shared_by_me'],
-                public=self['public'])
+                public=self['public']), limit))
         else:
             r = self.client.account_get(
                 limit=False if self['more'] else self['limit'],
@@ -1637,7 +2338,7 @@ class container_list(_PithosAccount, OptionalOutput, NameFilter):
                 until=self['until_date'],
                 show_only_shared=self['shared_by_me'],
                 public=self['public'])
-        items = list(r.json or [])
+            items = list(r.json or [])
         files = self._filter_by_name(items)
         if self['recursive'] and not container:
             self._create_object_forest(files)
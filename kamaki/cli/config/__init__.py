@@ -58,6 +58,8 @@ log = getLogger(__name__)
 # Path to the file that stores the configuration
 CONFIG_PATH = os.path.expanduser('~/.kamakirc')
 HISTORY_PATH = os.path.expanduser('~/.kamaki.history')
+HASHCACHE_PATH = os.path.expanduser('~/.kamaki.hashcache')
+UPLOAD_JOURNAL_PATH = os.path.expanduser('~/.kamaki.journal')
 CLOUD_PREFIX = 'cloud'
 
 # Name of a shell variable to bypass the CONFIG_PATH value
@@ -86,6 +88,17 @@ DOCUMENTATION['global']['colors'] = (
     'enable / disable console colors, requires "ansi-colors" (on / off)'),
 DOCUMENTATION['global']['history_file'] = 'path to store kamaki history',
 DOCUMENTATION['global']['history_limit'] = '#commands to keep in history',
+DOCUMENTATION['global']['hashcache_file'] = (
+    'path to cache block hashes of uploaded local files'),
+DOCUMENTATION['global']['hashcache_limit'] = (
+    'max size of cached block hashes in bytes'),
+DOCUMENTATION['global']['upload_journal_file'] = (
+    'path to record the progress of uploads, to resume them'),
+DOCUMENTATION['global']['blockstore_dir'] = (
+    'directory to keep transferred blocks, to reuse them instead of '
+    'downloading them again (if not set, blocks are not kept)'),
+DOCUMENTATION['global']['blockstore_limit'] = (
+    'max size of kept blocks in bytes'),
 DOCUMENTATION['global']['log_file'] = 'path to dumb kamaki logs',
 DOCUMENTATION['global']['log_token'] = (
     'show user token in HTTP logs (insecure - on / off)'),
@@ -146,6 +159,11 @@ DEFAULTS = {
         'log_pid': 'off',
         'history_file': HISTORY_PATH,
         'history_limit': 0,
+        'hashcache_file': HASHCACHE_PATH,
+        'hashcache_limit': 64 * 1024 * 1024,
+        'upload_journal_file': UPLOAD_JOURNAL_PATH,
+        'blockstore_dir': '',
+        'blockstore_limit': 1024 * 1024 * 1024,
         'user_cli': 'astakos',
         'quota_cli': 'astakos',
         'resource_cli': 'astakos',
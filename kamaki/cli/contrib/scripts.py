@@ -38,7 +38,7 @@ from kamaki.cli.errors import CLIError
 from kamaki.cli.cmdtree import CommandTree
 from kamaki.cli.cmds import errors, OptionalOutput
 from kamaki.cli.cmds.pithos import _PithosAccount
-from kamaki.cli.argument import FlagArgument
+from kamaki.cli.argument import FlagArgument, IntArgument
 
 scripts_cmds = CommandTree('scripts', 'Useful scripts')
 namespaces = [scripts_cmds, ]
@@ -60,15 +60,46 @@ class scripts_verifyfs(_PithosAccount, OptionalOutput):
             'Create missing directories objects',
             '--fix-missing-dirs'),
         yes=FlagArgument('Do not prompt for permission', '--yes'),
+        parallel=IntArgument(
+            'Rename up to N objects at once, retrying failed ones '
+            '(default: 1)',
+            '--parallel'),
     )
 
+    def _rename(self, renames):
+        """:param renames: (list) (old name, new name) pairs"""
+        if (self['parallel'] or 1) <= 1:
+            for src, dst in renames:
+                self.error(' * Renaming %s to %s' % (src, dst))
+                self.client.move_object(
+                    src_container=self.client.container,
+                    src_object=src,
+                    dst_container=self.client.container,
+                    dst_object=dst)
+            return
+        dsts = dict(renames)
+
+        def done_cb(src, result, error):
+            if error:
+                self.error(' * Renaming %s failed: %s' % (src, error))
+            else:
+                self.error(' * Renamed %s to %s' % (src, dsts[src]))
+
+        results = self.client.bulk_object_operation(
+            'move', [(src, dict(dst_object=dst)) for src, dst in renames],
+            parallel=self['parallel'],
+            done_cb=done_cb,
+            src_container=self.client.container,
+            dst_container=self.client.container)
+        self._summarize('rename', [(src, error) for (
+            src, result, error) in results])
+
     @errors.Generic.all
     @errors.Pithos.connection
     @errors.Pithos.container
     def _run(self):
         dirs, files, empty_files = [], [], []
-        result = self.client.container_get()
-        for o in result.json:
+        for o in self.client.iter_objects():
             name = o['name']
             if self.object_is_dir(o):
                 dirs.append(name)
@@ -102,16 +133,13 @@ class scripts_verifyfs(_PithosAccount, OptionalOutput):
 
         # First try to resolve conflicts
         if self['fix_conflicts']:
+            renames = []
             for c in conflicts:
                 if self['yes'] or self.ask_user('Rename %s?' % c):
                     backup = '%s_orig_%s' % (c, date.today().isoformat())
                     # TODO: check if backup name already exists
-                    self.error(' * Renaming %s to %s' % (c, backup))
-                    self.client.move_object(
-                        src_container=self.client.container,
-                        src_object=c,
-                        dst_container=self.client.container,
-                        dst_object=backup)
+                    renames.append((c, backup))
+            self._rename(renames)
 
         elif conflicts:
             raise CLIError(
@@ -123,15 +151,11 @@ class scripts_verifyfs(_PithosAccount, OptionalOutput):
 
         # renames should take place after fixing conflicts
         elif self['fix_names']:
+            renames = []
             for w in wrong:
-                correct = w.replace('\\', '/')
                 if self['yes'] or self.ask_user('Rename %s?' % w):
-                    self.error(' * Renaming %s to %s' % (w, correct))
-                    self.client.move_object(
-                        src_container=self.client.container,
-                        src_object=w,
-                        dst_container=self.client.container,
-                        dst_object=correct)
+                    renames.append((w, w.replace('\\', '/')))
+            self._rename(renames)
         elif wrong:
             raise CLIError(
                 'Directory objects with backslashes found: %s' % wrong,
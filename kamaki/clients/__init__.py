@@ -32,13 +32,18 @@
 
 from urllib2 import quote, unquote
 from urlparse import urlparse
-from threading import Thread
+from threading import Thread, Condition, Lock, local, current_thread
+from Queue import Queue, Empty, Full
 from json import dumps, loads
 from time import time
 from httplib import ResponseNotReady, HTTPException
 from time import sleep
 from random import random
 from logging import getLogger
+from collections import deque
+from weakref import WeakSet
+import atexit
+import socket
 import ssl
 
 from kamaki.clients.utils import https
@@ -53,6 +58,9 @@ log = getLogger(__name__)
 sendlog = getLogger('%s.send' % __name__)
 recvlog = getLogger('%s.recv' % __name__)
 
+#  Set by WorkerPool threads, to keep their own HTTP connections
+_worker = local()
+
 
 def _encode(v):
     if v and isinstance(v, unicode):
@@ -95,6 +103,8 @@ class ClientError(Exception):
             self.message = message
             self.status = status if isinstance(status, int) else 0
             self.details = details if details else []
+            #  seconds to wait before retrying, as suggested by the server
+            self.retry_after = None
 
     def __str__(self):
         return self.message
@@ -163,8 +173,10 @@ class RequestManager(Logged):
         if self.data:
             sendlog.info('data size: %s%s' % (len(self.data), plog))
             if self.LOG_DATA:
-                sendlog.info(utils.escape_ctrl_chars(self.data.replace(
-                    self._token, '...') if self._token else self.data))
+                data = self.data if isinstance(
+                    self.data, basestring) else '%s' % self.data
+                sendlog.info(utils.escape_ctrl_chars(data.replace(
+                    self._token, '...') if self._token else data))
         else:
             sendlog.info('data size: 0%s' % plog)
 
@@ -231,20 +243,45 @@ class RequestManager(Logged):
 class ResponseManager(Logged):
     """Manage the http request and handle the response data, headers, etc."""
 
-    def __init__(self, request, poolsize=None, connection_retry_limit=0):
+    #  Read the data of responses to a sink in chunks of this many bytes
+    SINK_CHUNK_SIZE = 64 * 1024
+
+    def __init__(
+            self, request, poolsize=None, connection_retry_limit=0,
+            sink=None):
         """
         :param request: (RequestManager)
 
         :param poolsize: (int) the size of the connection pool
 
         :param connection_retry_limit: (int)
+
+        :param sink: (memoryview) if given, the data of a successful (2XX)
+            response are read straight into it and content is empty
         """
         self.CONNECTION_TRY_LIMIT = 1 + connection_retry_limit
         self.request = request
         self._request_performed = False
         self.poolsize = poolsize
+        self.sink, self.sink_size = sink, 0
         self._headers_to_decode, self._header_prefices = [], []
 
+    def _read_into_sink(self, r):
+        """Read the response data into the sink, chunk by chunk, so that
+        they are never held as a whole in a string
+        :returns: (int) the number of bytes read
+        """
+        size, limit = 0, len(self.sink)
+        while True:
+            chunk = r.read(self.SINK_CHUNK_SIZE)
+            if not chunk:
+                return size
+            if size + len(chunk) > limit:
+                raise ClientError(
+                    'Response data exceed the %s bytes expected' % limit)
+            self.sink[size:size + len(chunk)] = chunk
+            size += len(chunk)
+
     def _get_headers_to_decode(self, headers):
         keys = set([k.lower() for k, v in headers])
         encodable = list(keys.intersection(self.headers_to_decode))
@@ -261,6 +298,9 @@ class ResponseManager(Logged):
             return
 
         pool_kw = dict(size=self.poolsize) if self.poolsize else dict()
+        pool_key = getattr(_worker, 'pool_key', None)
+        if pool_key:
+            pool_kw['pool_key'] = pool_key
         for retries in range(1, self.CONNECTION_TRY_LIMIT + 1):
             try:
                 with https.PooledHTTPConnection(
@@ -288,9 +328,16 @@ class ResponseManager(Logged):
                         self._headers[k] = unquote(v).decode('utf-8') if (
                             k.lower()) in enc_headers else v
                         recvlog.info('  %s: %s%s' % (k, v, plog))
-                    self._content = r.read()
-                    recvlog.info('data size: %s%s' % (
-                        len(self._content) if self._content else 0, plog))
+                    if self.sink is not None and 200 <= r.status < 300:
+                        self._content = ''
+                        self.sink_size = self._read_into_sink(r)
+                        recvlog.info('data size: %s (read into sink)%s' % (
+                            self.sink_size, plog))
+                    else:
+                        self._content = r.read()
+                        recvlog.info('data size: %s%s' % (
+                            len(self._content) if self._content else 0,
+                            plog))
                     if self.LOG_DATA and self._content:
                         data = '%s%s' % (self._content, plog)
                         data = utils.escape_ctrl_chars(data)
@@ -392,11 +439,376 @@ class SilentEvent(Thread):
             self._exception = e
 
 
+class Job(object):
+    """A method(*args, **kwargs) call, to be run by a WorkerPool"""
+
+    def __init__(self, method, *args, **kwargs):
+        self.method, self.args, self.kwargs = method, args, kwargs
+
+    @property
+    def exception(self):
+        return getattr(self, '_exception', False)
+
+    @property
+    def value(self):
+        return getattr(self, '_value', None)
+
+    @property
+    def nbytes(self):
+        """:returns: (int) the size of the request and response payloads, a
+            method that consumes the response may return its size instead"""
+        data = self.kwargs.get('data', None)
+        if isinstance(self.value, (int, long)):
+            return (len(data) if data else 0) + self.value
+        content = getattr(self.value, 'content', None)
+        return (len(data) if data else 0) + (len(content) if (
+            isinstance(content, basestring)) else 0)
+
+    def run(self):
+        self._exception = False
+        try:
+            self._value = self.method(*(self.args), **(self.kwargs))
+        except Exception as e:
+            estatus = e.status if isinstance(e, ClientError) else ''
+            recvlog.debug('Job %s got exception %s\n<%s %s' % (
+                self, type(e), estatus, e))
+            self._exception = e
+
+
+class AIMDController(object):
+    """Adapt the number of concurrent requests to the measured goodput
+
+    The limit starts low and grows by one per successful request, i.e., it
+    doubles every round trip (slow start), until goodput stops improving.
+    Then, it grows by one per round of "limit" requests, as long as request
+    latency does not indicate queueing, and it is cut by DECREASE whenever
+    the server is overloaded (429, 502, 503, 504 or timeouts).
+    Every change of the limit is logged and kept in history as
+    (timestamp, limit, reason, goodput in bytes/sec, latency in sec)
+    """
+
+    DECREASE = 0.5
+    OVERLOAD_STATUSES = (429, 502, 503, 504)
+    #  latency above LATENCY_FACTOR * min latency is considered queueing
+    LATENCY_FACTOR = 3.0
+    #  slow start ends after PLATEAU_ROUNDS rounds of less than 25% growth
+    PLATEAU_ROUNDS = 3
+    HISTORY_SIZE = 1024
+
+    def __init__(self, max_limit, initial=1):
+        self.max_limit = max(1, max_limit)
+        self.limit = float(max(1, min(initial, self.max_limit)))
+        self.slow_start = True
+        self.history = deque(maxlen=self.HISTORY_SIZE)
+        self.goodput, self.latency, self.min_latency = 0.0, None, None
+        self._round = (time(), 0, 0)
+        self._best_goodput, self._plateau = 0.0, 0
+        self._last_decrease = 0.0
+
+    @property
+    def window(self):
+        """:returns: (int) the number of requests to keep in flight"""
+        return int(self.limit)
+
+    def _set_limit(self, limit, reason):
+        limit = max(1.0, min(float(self.max_limit), limit))
+        if int(limit) != int(self.limit):
+            decision = (time(), int(limit), reason, self.goodput, self.latency)
+            self.history.append(decision)
+            sendlog.debug('Concurrency %s -> %s (%s, %.0f B/s, latency %s)' % (
+                int(self.limit), int(limit), reason, self.goodput,
+                '%.3fs' % self.latency if self.latency else '-'))
+        self.limit = limit
+
+    def is_overload(self, error):
+        if isinstance(error, ClientError):
+            return error.status in self.OVERLOAD_STATUSES
+        return isinstance(error, socket.timeout)
+
+    def _end_round(self, now):
+        started, nbytes, njobs = self._round
+        self._round = (now, 0, 0)
+        if not nbytes or now <= started:
+            return
+        self.goodput = nbytes / (now - started)
+        if self.goodput > 1.25 * self._best_goodput:
+            self._best_goodput, self._plateau = self.goodput, 0
+        else:
+            self._plateau += 1
+        if self.slow_start and self._plateau >= self.PLATEAU_ROUNDS:
+            self.slow_start = False
+            self._set_limit(self.limit - 1, 'goodput plateau')
+
+    def completed(self, started, nbytes=0, error=None):
+        """Update the limit with the outcome of a request
+
+        :param started: (float) the time the request started
+
+        :param nbytes: (int) the payload size of the request and response
+
+        :param error: (Exception) if the request failed
+        """
+        now = time()
+        if error:
+            if self.is_overload(error) and started > self._last_decrease:
+                #  Cut once per overload event, not for every request of it
+                self._last_decrease = now
+                self.slow_start = False
+                self._set_limit(
+                    self.limit * self.DECREASE, 'backoff on %s' % (
+                        getattr(error, 'status', '') or type(error).__name__))
+            return
+
+        latency = now - started
+        self.min_latency = min(self.min_latency or latency, latency)
+        self.latency = latency if self.latency is None else (
+            0.8 * self.latency + 0.2 * latency)
+        round_started, round_bytes, round_jobs = self._round
+        self._round = (round_started, round_bytes + nbytes, round_jobs + 1)
+        if round_jobs + 1 >= self.window:
+            self._end_round(now)
+
+        if self.slow_start:
+            self._set_limit(self.limit + 1, 'slow start')
+        elif self.latency <= self.LATENCY_FACTOR * self.min_latency:
+            self._set_limit(self.limit + 1.0 / self.limit, 'additive increase')
+
+
+class RetryPolicy(object):
+    """Decide whether and when to retry a failed job
+
+    Jobs that fail with a transient error (connection errors, timeouts,
+    408, 429 and 5xx responses) are retried up to "retries" times each,
+    after a random delay of up to BASE_DELAY * 2 ^ attempt seconds (full
+    jitter), or as long as the Retry-After header of a 429 or 503 response
+    suggests, capped to MAX_DELAY.
+    A policy is shared by the jobs of a transfer, which may be retried up to
+    "budget" times in total, so that a transfer failing persistently gives
+    up instead of stalling.
+    """
+
+    BASE_DELAY = 0.5
+    MAX_DELAY = 30.0
+    RETRY_STATUSES = (0, 408, 429, 500, 502, 503, 504)
+
+    def __init__(self, retries=5, budget=None):
+        self.retries, self.budget = retries, budget
+        self.retried, self._lock = 0, Lock()
+
+    def is_transient(self, error):
+        if isinstance(error, ClientError):
+            return error.status in self.RETRY_STATUSES
+        return isinstance(error, (socket.error, HTTPException))
+
+    def delay(self, error, attempt):
+        """:returns: (float) seconds to wait before the next attempt"""
+        retry_after = getattr(error, 'retry_after', None)
+        if retry_after is not None:
+            return min(self.MAX_DELAY, max(0.0, retry_after))
+        return random() * min(self.MAX_DELAY, self.BASE_DELAY * 2 ** attempt)
+
+    def retry(self, error, attempt):
+        """
+        :param error: (Exception) the reason the job failed
+
+        :param attempt: (int) the number of retries of this job so far
+
+        :returns: (float) seconds to wait before retrying, None to give up
+        """
+        if attempt >= self.retries or not self.is_transient(error):
+            return None
+        with self._lock:
+            if self.budget is not None and self.retried >= self.budget:
+                return None
+            self.retried += 1
+        return self.delay(error, attempt)
+
+
+class WorkerPool(object):
+    """A fixed number of long-lived threads, running Jobs from a bounded
+    queue. Jobs are submitted through JobBatch objects, which collect them
+    as they complete.
+    The number of jobs running at once is limited by the controller (by
+    default, an AIMDController) up to the number of workers.
+    If dedicated_connections is set, each worker keeps its own pool of HTTP
+    connections, so that consecutive requests of a worker reuse the same
+    connection.
+    """
+
+    POLL_INTERVAL = 0.1  # seconds
+
+    def __init__(
+            self, size,
+            queue_size=None, dedicated_connections=True, controller=None):
+        assert isinstance(size, int) and size > 0, 'Pool size not a +int'
+        self.size, self.closed, self.cancelled = size, False, False
+        self.dedicated_connections = dedicated_connections
+        self.controller = controller or AIMDController(size)
+        self.jobs_per_worker = [0] * size
+        self._jobs = Queue(queue_size or 2 * size)
+        self._running, self._slots = 0, Condition()
+        self._workers = []
+        for index in range(size):
+            worker = Thread(target=self._work, args=(index, ))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+        _open_pools.add(self)
+
+    def _work(self, index):
+        if self.dedicated_connections:
+            _worker.pool_key = 'kamaki.worker.%s' % index
+        while True:
+            batch, job = self._jobs.get()
+            if job is None:
+                break
+            if batch.cancelled:
+                job._exception = ClientError('Job cancelled')
+            else:
+                self._run(batch, job)
+                self.jobs_per_worker[index] += 1
+            batch._done.put(job)
+
+    def _run(self, batch, job):
+        """Run a job when the controller allows one more in flight, retry it
+        while the retry policy of the batch allows"""
+        attempt = 0
+        while True:
+            with self._slots:
+                while self._running >= self.controller.window:
+                    self._slots.wait(self.POLL_INTERVAL)
+                self._running += 1
+            started = time()
+            try:
+                job.run()
+            finally:
+                with self._slots:
+                    self._running -= 1
+                    self.controller.completed(
+                        started, job.nbytes, job.exception or None)
+                    self._slots.notify_all()
+            if not (job.exception and batch.retry_policy):
+                return
+            delay = batch.retry_policy.retry(job.exception, attempt)
+            if delay is None:
+                return
+            attempt += 1
+            log.debug('Retry %s in %.2fs (attempt %s) after: %s' % (
+                job, delay, attempt, job.exception))
+            #  Wait without holding a slot, give up if the batch is cancelled
+            deadline = time() + delay
+            while not batch.cancelled and time() < deadline:
+                sleep(min(self.POLL_INTERVAL, max(0, deadline - time())))
+            if batch.cancelled:
+                return
+
+    def _put(self, item):
+        """Wait for room in the queue, without blocking interrupts"""
+        while True:
+            try:
+                return self._jobs.put(item, True, self.POLL_INTERVAL)
+            except Full:
+                continue
+
+    def batch(self, retry_policy=None):
+        """
+        :param retry_policy: (RetryPolicy) if given, failed jobs of the batch
+            are retried by the workers
+
+        :returns: (JobBatch) a new set of jobs on this pool
+        """
+        assert not self.closed, 'Worker pool is closed'
+        return JobBatch(self, retry_policy)
+
+    def cancel(self):
+        """Skip the queued jobs of every batch on this pool, including jobs
+        submitted later, e.g., by other threads on interrupt. Skipped jobs
+        fail, running jobs are not interrupted"""
+        self.cancelled = True
+
+    def close(self):
+        """Stop the workers, after they finish the jobs they are running,
+        and wait for their threads to exit"""
+        if self.closed:
+            return
+        self.closed = True
+        log.debug('Close worker pool, jobs per worker: %s' % (
+            self.jobs_per_worker))
+        for worker in self._workers:
+            self._put((None, None))
+        for worker in self._workers:
+            if worker is current_thread():
+                continue
+            while worker.is_alive():
+                worker.join(self.POLL_INTERVAL)
+        _open_pools.discard(self)
+
+
+_open_pools = WeakSet()
+
+
+@atexit.register
+def _close_open_pools():
+    """Stop the workers of the pools left open, before interpreter shutdown
+    tears down the modules they use"""
+    for pool in list(_open_pools):
+        pool.close()
+
+
+class JobBatch(object):
+    """Jobs submitted to a WorkerPool by a single caller"""
+
+    def __init__(self, pool, retry_policy=None):
+        self.pool, self.pending, self._cancelled = pool, 0, False
+        self.retry_policy = retry_policy
+        self._done = Queue()
+
+    @property
+    def cancelled(self):
+        return self._cancelled or self.pool.cancelled
+
+    def submit(self, method, *args, **kwargs):
+        """Queue a method call, wait while the pool queue is full
+
+        :returns: (Job)
+        """
+        job = Job(method, *args, **kwargs)
+        self.pool._put((self, job))
+        self.pending += 1
+        return job
+
+    def completed(self, wait=False):
+        """:yields: (Job) finished jobs, in order of completion
+
+        :param wait: (bool) if set, wait for all pending jobs to finish,
+            otherwise yield only those already finished
+        """
+        while self.pending:
+            try:
+                job = self._done.get(
+                    wait, self.pool.POLL_INTERVAL if wait else None)
+            except Empty:
+                if wait:
+                    continue
+                return
+            self.pending -= 1
+            yield job
+
+    def cancel(self):
+        """Skip queued jobs and wait for the running ones to finish"""
+        self._cancelled = True
+        for job in self.completed(wait=True):
+            pass
+
+
 class Client(Logged):
     service_type = ''
     MAX_THREADS = 1
     DATE_FORMATS = ['%a %b %d %H:%M:%S %Y', ]
     CONNECTION_RETRY_LIMIT = 0
+    #  Retries of failed worker pool jobs, per job and per batch of jobs
+    JOB_RETRY_LIMIT = 5
+    JOB_RETRY_BUDGET = 64
 
     def __init__(self, endpoint_url, token, base_url=None):
         #  BW compatibility - keep base_url for some time
@@ -466,6 +878,80 @@ class Client(Logged):
             return []
         return threadlist
 
+    def _get_worker_pool(self):
+        """:returns: (WorkerPool) the pool of MAX_THREADS workers, shared by
+            the transfers of this client"""
+        size = max(1, int(self.MAX_THREADS or 1))
+        pool = getattr(self, '_worker_pool', None)
+        if pool and not pool.closed and pool.size == size:
+            return pool
+        if pool:
+            pool.close()
+        self._worker_pool = WorkerPool(size)
+        return self._worker_pool
+
+    def _new_batch(self):
+        """:returns: (JobBatch) on the worker pool, failed jobs are retried
+            according to JOB_RETRY_LIMIT and JOB_RETRY_BUDGET"""
+        return self._get_worker_pool().batch(RetryPolicy(
+            self.JOB_RETRY_LIMIT, self.JOB_RETRY_BUDGET))
+
+    def close_worker_pool(self):
+        """Stop the threads of the worker pool, if any"""
+        pool = getattr(self, '_worker_pool', None)
+        if pool:
+            pool.close()
+            self._worker_pool = None
+
+    def _cancel_jobs(self, batch):
+        """Cancel a batch of jobs and stop the workers (e.g., on interrupt)"""
+        sendlog.info('- - - wait for threads to finish')
+        batch.cancel()
+        self.close_worker_pool()
+
+    def _run_concurrently(
+            self, method, calls, collect, parallel, name, retry_policy=None):
+        """Call a method many times, up to "parallel" calls at a time, on a
+        pool of threads of their own. The worker pool of this client, which
+        the calls may share for their requests, is stopped when they are
+        over. On interrupt, its queued jobs are skipped, so that the running
+        calls end soon
+
+        :param method: called as method(*args) for each args in calls
+
+        :param calls: iterable of argument tuples, consumed as calls proceed
+
+        :param collect: called with each finished Job, in order of completion
+
+        :param parallel: (int) max number of calls running at once
+
+        :param name: (str) what the calls do, for logging, e.g., uploads
+
+        :param retry_policy: (RetryPolicy) if given, failed calls are retried
+        """
+        pool = WorkerPool(
+            parallel,
+            dedicated_connections=False,
+            controller=AIMDController(parallel, initial=parallel))
+        batch = pool.batch(retry_policy)
+        try:
+            for args in calls:
+                batch.submit(method, *args)
+                for job in batch.completed():
+                    collect(job)
+            for job in batch.completed(wait=True):
+                collect(job)
+        except KeyboardInterrupt:
+            sendlog.info('- - - wait for %s to finish' % name)
+            shared = getattr(self, '_worker_pool', None)
+            if shared:
+                shared.cancel()
+            batch.cancel()
+            raise
+        finally:
+            pool.close()
+            self.close_worker_pool()
+
     def async_run(self, method, kwarg_list):
         """Fire threads of operations
 
@@ -530,6 +1016,7 @@ class Client(Logged):
             params.update(async_params)
             success = kwargs.pop('success', 200)
             data = kwargs.pop('data', None)
+            sink = kwargs.pop('sink', None)
             headers.setdefault('X-Auth-Token', self.token)
             if 'json' in kwargs:
                 data = dumps(kwargs.pop('json'))
@@ -547,7 +1034,8 @@ class Client(Logged):
             r = ResponseManager(
                 req,
                 poolsize=self.poolsize,
-                connection_retry_limit=self.CONNECTION_RETRY_LIMIT)
+                connection_retry_limit=self.CONNECTION_RETRY_LIMIT,
+                sink=sink)
             r.headers_to_decode = self.response_headers
             r.header_prefices = self.response_header_prefices
             r.LOG_TOKEN, r.LOG_DATA, r.LOG_PID = (
@@ -568,7 +1056,13 @@ class Client(Logged):
                 except:
                     message = u'%s %s\n' % (status_msg, r)
                 status = getattr(r, 'status_code', getattr(r, 'status', 0))
-                raise ClientError(message, status=status)
+                error = ClientError(message, status=status)
+                if status in (429, 503):
+                    try:
+                        error.retry_after = float(r.headers['retry-after'])
+                    except (KeyError, TypeError, ValueError):
+                        pass
+                raise error
         return r
 
     def delete(self, path, **kwargs):
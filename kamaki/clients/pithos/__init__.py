@@ -31,27 +31,56 @@
 # interpreted as representing official policies, either expressed
 # or implied, of GRNET S.A.
 
-from threading import enumerate as activethreads
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
 
 from os import fstat
+from os.path import exists
 from hashlib import new as newhashlib
 from time import time
 from StringIO import StringIO
+from collections import deque
 
-from binascii import hexlify
-
-from kamaki.clients import SilentEvent, sendlog
+from kamaki.clients import sendlog, WorkerPool, RetryPolicy
 from kamaki.clients.pithos.rest_api import PithosRestClient
+from kamaki.clients.pithos.hashcache import _file_key
 from kamaki.clients.storage import ClientError
-from kamaki.clients.utils import path4url, filter_in, readall
+from kamaki.clients.utils import (
+    path4url, filter_in, readall, rstrip_nul, stream_blocks, BlockSource,
+    BlockSink)
 
 
 def _pithos_hash(block, blockhash):
     h = newhashlib(blockhash)
-    h.update(block.rstrip('\x00'))
+    h.update(rstrip_nul(block))
     return h.hexdigest()
 
 
+def _pithos_hash_args(args):
+    """_pithos_hash for pool workers, args: (block, blockhash)"""
+    return _pithos_hash(*args)
+
+
+def _seekable(fileobj):
+    """:returns: (bool) False for terminals, pipes and other streams"""
+    try:
+        if fileobj.isatty():
+            return False
+        fileobj.seek(0, 1)
+        return True
+    except (AttributeError, IOError, OSError, ValueError):
+        return False
+
+
+def _range_length(data_range):
+    """:returns: (int) the length of a start-end range, None for multi-part
+        ranges, which have no fixed length to check"""
+    if ',' in data_range:
+        return None
+    first, _, last = data_range.partition('-')
+    return int(last) - int(first) + 1
+
+
 def _range_up(start, end, max_value, a_range):
     """
     :param start: (int) the window bottom
@@ -102,9 +131,46 @@ def _range_up(start, end, max_value, a_range):
 class PithosClient(PithosRestClient):
     """Synnefo Pithos+ API client"""
 
+    #  Parallel block hashing: number of workers, processes or threads
+    HASH_WORKERS = 1
+    HASH_WITH_PROCESSES = False
+    #  Upload missing blocks in requests of up to this many bytes, if it is
+    #  larger than the block size (0: a request per block)
+    BLOCK_BATCH_SIZE = 0
+    #  Download runs of adjacent blocks in ranges of up to this many bytes
+    #  (0: a range per block)
+    RANGE_BATCH_SIZE = 0
+    #  Bulk operations: the method applying each one and its object argument
+    BULK_OPERATIONS = dict(
+        copy=('copy_object', 'src_object'),
+        move=('move_object', 'src_object'),
+        delete=('del_object', 'obj'),
+        meta=('set_object_meta', 'obj'))
+
     def __init__(self, endpoint_url, token, account=None, container=None):
         super(PithosClient, self).__init__(
             endpoint_url, token, account, container)
+        #  A hashcache.HashCache, to avoid re-hashing unchanged local files
+        self.hash_cache = None
+        #  A journal.UploadJournal, to resume interrupted uploads
+        self.upload_journal = None
+        #  A blockstore.BlockStore, to reuse blocks instead of downloading them
+        self.block_store = None
+
+    def _clone(self):
+        """:returns: (PithosClient) a client for the same account and
+            container, to be used by another thread. It shares the settings
+            and the worker pool of this client, if there is one already"""
+        client = self.__class__(
+            self.endpoint_url, self.token, self.account, self.container)
+        for attr in (
+                'MAX_THREADS', 'HASH_WORKERS', 'HASH_WITH_PROCESSES',
+                'BLOCK_BATCH_SIZE', 'RANGE_BATCH_SIZE',
+                'CONNECTION_RETRY_LIMIT', 'LOG_TOKEN', 'LOG_DATA', 'LOG_PID',
+                'hash_cache', 'upload_journal', 'block_store', 'poolsize'):
+            setattr(client, attr, getattr(self, attr))
+        client._worker_pool = getattr(self, '_worker_pool', None)
+        return client
 
     def create_container(
             self,
@@ -243,10 +309,69 @@ class PithosClient(PithosRestClient):
         return r.headers
 
     # upload_* auxiliary methods
-    def _put_block_async(self, data, hash):
-        event = SilentEvent(method=self._put_block, data=data, hash=hash)
-        event.start()
-        return event
+    def _put_block_async(self, batch, data, hash):
+        return batch.submit(self._put_block, data=data, hash=hash)
+
+    def _put_blocks_async(self, batch, blocks, blocksize):
+        """:param blocks: (list) (data, hash) pairs, as packed by _pack_blocks
+        """
+        if len(blocks) == 1:
+            return self._put_block_async(batch, *blocks[0])
+        return batch.submit(
+            self._put_blocks,
+            data=''.join(str(data) for data, hash in blocks),
+            hashes=[hash for data, hash in blocks],
+            blocksize=blocksize)
+
+    def _pack_blocks(self, missing, sizes, blocksize):
+        """Group blocks to upload in batches of up to BLOCK_BATCH_SIZE bytes
+        The server splits a batch in blocks of blocksize bytes, so a shorter
+        block can only be the last of a batch
+
+        :param sizes: (dict) hash: size of the block
+
+        :param blocksize: (int) if None, each block is a batch on its own
+
+        :yields: (list) the hashes of each batch
+        """
+        budget = int(self.BLOCK_BATCH_SIZE or 0) if blocksize else 0
+        pack, pack_size = [], 0
+        for hash in missing:
+            size = sizes[hash]
+            if pack and pack_size + size > budget:
+                yield pack
+                pack, pack_size = [], 0
+            pack.append(hash)
+            pack_size += size
+            if blocksize and size < blocksize:
+                yield pack
+                pack, pack_size = [], 0
+        if pack:
+            yield pack
+
+    @staticmethod
+    def _job_hashes(job):
+        """:returns: (list) the hashes of the blocks uploaded by job"""
+        return job.kwargs.get('hashes', None) or [job.kwargs['hash']]
+
+    @staticmethod
+    def _collect_jobs(jobs, failures, progress_gen=None, done_cb=None):
+        """Append failed jobs to failures, advance progress for the rest
+
+        :param done_cb: if given, called with the hash of each block uploaded
+        """
+        for job in jobs:
+            if job.exception:
+                failures.append(job)
+                continue
+            for hash in PithosClient._job_hashes(job):
+                if done_cb:
+                    done_cb(hash)
+                if progress_gen:
+                    try:
+                        progress_gen.next()
+                    except:
+                        pass
 
     def _put_block(self, data, hash):
         r = self.container_post(
@@ -256,6 +381,40 @@ class PithosClient(PithosRestClient):
             data=data,
             format='json')
         assert r.json[0] == hash, 'Local hash does not match server'
+        self._store_block(hash, data)
+
+    def _put_blocks(self, data, hashes, blocksize):
+        """Upload consecutive blocks with a single request
+        If the hashes returned by the server do not match, upload the blocks
+        one by one
+
+        :param data: (str) the blocks, all of blocksize bytes but the last
+        """
+        r = self.container_post(
+            update=True,
+            content_type='application/octet-stream',
+            content_length=len(data),
+            data=data,
+            format='json')
+        if r.json == hashes:
+            for i, hash in enumerate(hashes):
+                self._store_block(hash, buffer(data, i * blocksize, blocksize))
+            return
+        sendlog.info('Batch of %s blocks does not match, upload one by one' % (
+            len(hashes)))
+        for i, hash in enumerate(hashes):
+            self._put_block(buffer(data, i * blocksize, blocksize), hash)
+
+    def _store_block(self, hash, data):
+        """Keep a block in the block store, if there is one"""
+        if self.block_store is not None:
+            self.block_store.put(hash, data)
+
+    def _stored_block(self, hash, size):
+        """:returns: (str) the block from the block store or None"""
+        if self.block_store is None:
+            return None
+        return self.block_store.get(hash, size)
 
     def _get_file_block_info(self, fileobj, size=None, cache=None):
         """
@@ -286,12 +445,14 @@ class PithosClient(PithosRestClient):
             format='json',
             hashmap=True,
             content_type=None,
+            etag=None,
             if_etag_match=None,
             if_etag_not_match=None,
             content_encoding=None,
             content_disposition=None,
             permissions=None,
             public=None,
+            metadata=None,
             success=(201, 409)):
         r = self.object_put(
             obj,
@@ -299,29 +460,116 @@ class PithosClient(PithosRestClient):
             hashmap=True,
             content_type=content_type,
             json=json,
+            etag=etag,
             if_etag_match=if_etag_match,
             if_etag_not_match=if_etag_not_match,
             content_encoding=content_encoding,
             content_disposition=content_disposition,
             permissions=permissions,
             public=public,
+            metadata=metadata,
             success=success)
         return (None if r.status_code == 201 else r.json), r.headers
 
+    def _hash_blocks(self, blocks, blockhash):
+        """Hash blocks, in parallel if self.HASH_WORKERS > 1
+        At most 2 * HASH_WORKERS blocks are read ahead of the caller
+
+        :param blocks: iterable of (offset, block)
+
+        :yields: (offset, block, hash) in the order of blocks
+        """
+        workers = int(self.HASH_WORKERS or 1)
+        if workers <= 1:
+            for offset, block in blocks:
+                yield offset, block, _pithos_hash(block, blockhash)
+            return
+
+        pool = (Pool if self.HASH_WITH_PROCESSES else ThreadPool)(workers)
+        #  buffer views can be shared with threads, but not pickled
+        arg = str if self.HASH_WITH_PROCESSES else (lambda b: b)
+        try:
+            batch = []
+            for offset, block in blocks:
+                batch.append((offset, block))
+                if len(batch) < 2 * workers:
+                    continue
+                hashes = pool.map(
+                    _pithos_hash_args, [(arg(b), blockhash) for o, b in batch])
+                for (offset, block), hash in zip(batch, hashes):
+                    yield offset, block, hash
+                batch = []
+            hashes = pool.map(
+                _pithos_hash_args, [(arg(b), blockhash) for o, b in batch])
+            for (offset, block), hash in zip(batch, hashes):
+                yield offset, block, hash
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _get_cached_hashes(self, fileobj, blocksize, blockhash, size):
+        """:returns: (list) the cached block hashes of fileobj, or None"""
+        if self.hash_cache is None:
+            return None
+        try:
+            if fstat(fileobj.fileno()).st_size != size:
+                return None
+        except (AttributeError, EnvironmentError, ValueError):
+            return None
+        return self.hash_cache.get(fileobj, blocksize, blockhash)
+
+    def _get_hash_cache_key(self, fileobj):
+        """:returns: (tuple) the hash cache key of fileobj as it is now, to
+            be read before hashing the file, or None if not cacheable"""
+        if self.hash_cache is None:
+            return None
+        try:
+            fileobj.fileno()
+            return _file_key(fileobj)
+        except (AttributeError, EnvironmentError, ValueError):
+            return None
+
+    def _set_cached_hashes(
+            self, fileobj, blocksize, blockhash, size, hashes, file_key):
+        """Cache the hashes of fileobj, unless it changed since file_key was
+        read (see _get_hash_cache_key)"""
+        if self.hash_cache is None or file_key is None:
+            return
+        if file_key[2] != size:
+            return
+        try:
+            self.hash_cache.set(
+                fileobj, blocksize, blockhash, hashes, file_key=file_key)
+        except (AttributeError, EnvironmentError, ValueError):
+            return
+
     def _calculate_blocks_for_upload(
             self, blocksize, blockhash, size, nblocks, hashes, hmap, fileobj,
-            hash_cb=None):
+            hash_cb=None, known_hashes=None):
+        """:param known_hashes: (list) if given, the file is not hashed"""
         offset = 0
         if hash_cb:
             hash_gen = hash_cb(nblocks)
             hash_gen.next()
 
-        for i in xrange(nblocks):
-            block = readall(fileobj, min(blocksize, size - offset))
+        cached = known_hashes if known_hashes is not None else (
+            self._get_cached_hashes(fileobj, blocksize, blockhash, size))
+        if cached is not None and len(cached) == nblocks:
+            sendlog.info('Block hashes loaded from local cache')
+            for hash in cached:
+                bytes = min(blocksize, size - offset)
+                hashes.append(hash)
+                hmap[hash] = (offset, bytes)
+                offset += bytes
+                if hash_cb:
+                    hash_gen.next()
+            return
+
+        file_key = self._get_hash_cache_key(fileobj)
+        source = BlockSource(fileobj, size)
+        for start, block, hash in self._hash_blocks(
+                source.blocks(blocksize, nblocks), blockhash):
             bytes = len(block)
-            if bytes <= 0:
-                break
-            hash = _pithos_hash(block, blockhash)
             hashes.append(hash)
             hmap[hash] = (offset, bytes)
             offset += bytes
@@ -330,47 +578,144 @@ class PithosClient(PithosRestClient):
         msg = ('Failed to calculate uploading blocks: '
                'read bytes(%s) != requested size (%s)' % (offset, size))
         assert offset == size, msg
+        self._set_cached_hashes(
+            fileobj, blocksize, blockhash, size, hashes, file_key)
+
+    def file_hashes(self, fileobj, blocksize, blockhash):
+        """
+        :param fileobj: open file descriptor
+
+        :returns: (list) the pithos block hashes of a local file, loaded from
+            the hash cache if the file is unchanged since it was hashed
+        """
+        size = fstat(fileobj.fileno()).st_size
+        hashes, hmap = [], dict()
+        self._calculate_blocks_for_upload(
+            blocksize, blockhash, size, 1 + (size - 1) // blocksize,
+            hashes, hmap, fileobj)
+        return hashes
+
+    def file_matches_object(self, obj, fileobj, remote_size=None):
+        """Compare a local file with a remote object, block by block
+
+        :param obj: (str) remote object path
 
-    def _upload_missing_blocks(self, missing, hmap, fileobj, upload_gen=None):
-        """upload missing blocks asynchronously"""
+        :param fileobj: open file descriptor
 
-        self._init_thread_limit()
+        :param remote_size: (int) the size of obj, if known (e.g., from a
+            listing). If it differs from the file size, the remote hashmap
+            is not fetched and the file is not hashed
 
-        flying = []
+        :returns: (bool) True if obj exists and has the contents of fileobj
+        """
+        size = fstat(fileobj.fileno()).st_size
+        if remote_size is not None and int(remote_size) != size:
+            return False
+        try:
+            hashmap = self.get_object_hashmap(obj)
+        except ClientError as ce:
+            if ce.status in (404, ):
+                return False
+            raise
+        if int(hashmap['bytes']) != size:
+            return False
+        if not size:
+            return True
+        return hashmap['hashes'] == self.file_hashes(
+            fileobj, int(hashmap['block_size']), hashmap['block_hash'])
+
+    def _upload_missing_blocks(
+            self, missing, hmap, fileobj, upload_gen=None, done_cb=None,
+            blocksize=None):
+        """upload missing blocks asynchronously
+
+        :param done_cb: called with the hash of each block uploaded
+
+        :param blocksize: (int) if given, blocks are uploaded in batches of
+            up to BLOCK_BATCH_SIZE bytes
+        """
+        batch = self._new_batch()
         failures = []
-        for hash in missing:
-            offset, bytes = hmap[hash]
-            fileobj.seek(offset)
-            data = readall(fileobj, bytes)
-            r = self._put_block_async(data, hash)
-            flying.append(r)
-            unfinished = self._watch_thread_limit(flying)
-            for thread in set(flying).difference(unfinished):
-                if thread.exception:
-                    failures.append(thread)
-                    if isinstance(
-                            thread.exception,
-                            ClientError) and thread.exception.status == 502:
-                        self.POOLSIZE = self._thread_limit
-                elif thread.isAlive():
-                    flying.append(thread)
-                elif upload_gen:
-                    try:
-                        upload_gen.next()
-                    except:
-                        pass
-            flying = unfinished
+        source = BlockSource(fileobj)
+        sizes = dict((hash, hmap[hash][1]) for hash in missing)
+        try:
+            for pack in self._pack_blocks(missing, sizes, blocksize):
+                self._put_blocks_async(batch, [(
+                    source.read(*hmap[hash]), hash) for hash in pack],
+                    blocksize)
+                self._collect_jobs(
+                    batch.completed(), failures, upload_gen, done_cb)
+            self._collect_jobs(
+                batch.completed(wait=True), failures, upload_gen, done_cb)
+        except KeyboardInterrupt:
+            self._cancel_jobs(batch)
+            raise
 
-        for thread in flying:
-            thread.join()
-            if thread.exception:
-                failures.append(thread)
-            elif upload_gen:
-                try:
-                    upload_gen.next()
-                except:
-                    pass
+        return [hash for job in failures for hash in self._job_hashes(job)]
+
+    def _get_remote_hashes(self, obj):
+        """:returns: (set) the block hashes of obj, if it exists remotely"""
+        try:
+            return set(self.get_object_hashmap(obj).get('hashes', []))
+        except ClientError as ce:
+            if ce.status in (404, ):
+                return set()
+            raise
+
+    def _upload_blocks_pipelined(
+            self, blocksize, blockhash, size, nblocks, hashes, hmap, fileobj,
+            known=(), hash_cb=None, upload_gen=None, done_cb=None):
+        """Read, hash and upload blocks in a single pass over fileobj
+        Each block is kept in memory only while it is being uploaded, so the
+        memory footprint is bounded by the worker pool queue.
+
+        :param known: (set) hashes of blocks already stored remotely, these
+            are not uploaded
+
+        :param done_cb: called with the hash of each block uploaded
+
+        :returns: (list) the hashes of the blocks that failed to upload
+        """
+        offset = 0
+        if hash_cb:
+            hash_gen = hash_cb(nblocks)
+            hash_gen.next()
 
+        batch = self._new_batch()
+        failures, handled = [], set(known)
+        file_key = self._get_hash_cache_key(fileobj)
+        source = BlockSource(fileobj, size)
+        try:
+            for start, block, hash in self._hash_blocks(
+                    source.blocks(blocksize, nblocks), blockhash):
+                bytes = len(block)
+                hashes.append(hash)
+                hmap[hash] = (offset, bytes)
+                offset += bytes
+                if hash_cb:
+                    hash_gen.next()
+
+                if hash in handled:
+                    if upload_gen:
+                        try:
+                            upload_gen.next()
+                        except:
+                            pass
+                    continue
+                handled.add(hash)
+                self._put_block_async(batch, block, hash)
+                self._collect_jobs(
+                    batch.completed(), failures, upload_gen, done_cb)
+            self._collect_jobs(
+                batch.completed(wait=True), failures, upload_gen, done_cb)
+        except KeyboardInterrupt:
+            self._cancel_jobs(batch)
+            raise
+        msg = ('Failed to calculate uploading blocks: '
+               'read bytes(%s) != requested size (%s)' % (offset, size))
+        assert offset == size, msg
+        self._set_cached_hashes(
+            fileobj, blocksize, blockhash, size, hashes, file_key)
         return [failure.kwargs['hash'] for failure in failures]
 
     def upload_object(
@@ -386,7 +731,9 @@ class PithosClient(PithosRestClient):
             content_type=None,
             sharing=None,
             public=None,
-            container_info_cache=None):
+            container_info_cache=None,
+            pipelined=False,
+            resume=False):
         """Upload an object using multiple connections (threads)
 
         :param obj: (str) remote object path
@@ -420,6 +767,14 @@ class PithosClient(PithosRestClient):
 
         :param container_info_cache: (dict) if given, avoid redundant calls to
             server for container info (block size and hash information)
+
+        :param pipelined: (bool) if set, hash and upload each block as the
+            file is read, in a single pass. Blocks of a pre-existing remote
+            version of the object are not uploaded. Memory usage is bounded
+            by the thread limit
+
+        :param resume: (bool) if set and the upload_journal has a record of
+            an interrupted upload of this file to obj, continue from there
         """
         self._assert_container()
 
@@ -429,18 +784,54 @@ class PithosClient(PithosRestClient):
         (hashes, hmap, offset) = ([], {}, 0)
         content_type = content_type or 'application/octet-stream'
 
-        self._calculate_blocks_for_upload(
-            *block_info,
-            hashes=hashes,
-            hmap=hmap,
-            fileobj=f,
-            hash_cb=hash_cb)
+        journal, journal_key = self.upload_journal, (
+            self.account, self.container, obj)
+        journaled = journal.get(journal_key, f, blocksize, blockhash) if (
+            journal is not None and resume) else None
+        known_hashes, uploaded = journaled or (None, set())
+        if journaled:
+            sendlog.info('Resume upload, %s blocks uploaded' % len(uploaded))
+        elif journal is not None:
+            journal.start(journal_key, f, blocksize, blockhash)
+        done_cb = (lambda hash: journal.block_done(
+            journal_key, hash)) if journal is not None else None
+
+        if pipelined and (known_hashes is not None or self._get_cached_hashes(
+                f, blocksize, blockhash, size) is not None):
+            #  Hashes are known, let the server tell which blocks are missing
+            pipelined = False
+        if pipelined:
+            upload_gen = None
+            if upload_cb:
+                upload_gen = upload_cb(nblocks)
+                upload_gen.next()
+            self._upload_blocks_pipelined(
+                *block_info,
+                hashes=hashes,
+                hmap=hmap,
+                fileobj=f,
+                known=uploaded.union(
+                    set() if if_not_exist else self._get_remote_hashes(obj)),
+                hash_cb=hash_cb,
+                upload_gen=upload_gen,
+                done_cb=done_cb)
+        else:
+            self._calculate_blocks_for_upload(
+                *block_info,
+                hashes=hashes,
+                hmap=hmap,
+                fileobj=f,
+                hash_cb=hash_cb,
+                known_hashes=known_hashes)
+        if journal is not None and known_hashes is None:
+            journal.set_hashes(journal_key, hashes)
 
         hashmap = dict(bytes=size, hashes=hashes)
         missing, obj_headers = self._create_object_or_get_missing_hashes(
             obj, hashmap,
             content_type=content_type,
             size=size,
+            etag=etag if pipelined else None,
             if_etag_match=if_etag_match,
             if_etag_not_match='*' if if_not_exist else None,
             content_encoding=content_encoding,
@@ -449,9 +840,13 @@ class PithosClient(PithosRestClient):
             public=public)
 
         if missing is None:
+            if journal is not None:
+                journal.remove(journal_key)
             return obj_headers
 
-        if upload_cb:
+        if pipelined:
+            upload_gen = None
+        elif upload_cb:
             upload_gen = upload_cb(len(hashmap['hashes']))
             for i in range(len(hashmap['hashes']) + 1 - len(missing)):
                 try:
@@ -462,27 +857,14 @@ class PithosClient(PithosRestClient):
         else:
             upload_gen = None
 
-        retries = 7
-        while retries:
-            sendlog.info('%s blocks missing' % len(missing))
-            num_of_blocks = len(missing)
-            missing = self._upload_missing_blocks(
-                missing, hmap, f, upload_gen)
-            if missing:
-                if num_of_blocks == len(missing):
-                    retries -= 1
-                else:
-                    num_of_blocks = len(missing)
-            else:
-                break
+        #  Failed blocks are retried by the workers (see JOB_RETRY_LIMIT)
+        sendlog.info('%s blocks missing' % len(missing))
+        missing = self._upload_missing_blocks(
+            missing, hmap, f, upload_gen, done_cb, blocksize)
         if missing:
-            try:
-                details = ['%s' % thread.exception for thread in missing]
-            except Exception:
-                details = ['Also, failed to read thread exceptions']
             raise ClientError(
                 '%s blocks failed to upload' % len(missing),
-                details=details)
+                details=['Blocks: %s' % ', '.join(missing)])
 
         r = self.object_put(
             obj,
@@ -497,8 +879,248 @@ class PithosClient(PithosRestClient):
             permissions=sharing,
             public=public,
             success=201)
+        if journal is not None:
+            journal.remove(journal_key)
         return r.headers
 
+    def upload_objects(
+            self, uploads,
+            hash_cb=None,
+            upload_cb=None,
+            if_not_exist=None,
+            container_info_cache=None,
+            **kwargs):
+        """Upload many files, so that blocks shared among them are uploaded
+        once. The hashmaps of all files are calculated and pushed first, then
+        each distinct missing block is uploaded, then all objects are created
+
+        :param uploads: iterable of (obj, source, params), where source is an
+            open file descriptor or a local file path (opened when needed)
+            and params is a dict of upload_object keyword arguments for this
+            object (content_type, content_encoding, etc.) or None
+
+        :param hash_cb: optional progress.bar object for calculating hashes
+
+        :param upload_cb: optional progress.bar object for uploading
+
+        :param if_not_exist: (bool) If true, objects are uploaded ONLY if
+            they do not exist remotely
+
+        :param container_info_cache: (dict) if given, avoid redundant calls to
+            server for container info (block size and hash information)
+
+        :param kwargs: default upload_object keyword arguments for all objects
+            (content_type, content_encoding, content_disposition, sharing,
+            public)
+
+        :returns: (list) the headers of the created objects, in order
+        """
+        self._assert_container()
+        uploads = [(obj, src, dict(kwargs, **(params or {}))) for (
+            obj, src, params) in uploads]
+        if not isinstance(container_info_cache, dict):
+            container_info_cache = dict()
+
+        def open_source(src):
+            return open(src, 'rb') if isinstance(src, basestring) else src
+
+        def close_source(src, f):
+            if f is not src:
+                f.close()
+
+        sizes = []
+        for obj, src, params in uploads:
+            f = open_source(src)
+            sizes.append(fstat(f.fileno()).st_size)
+            close_source(src, f)
+
+        hash_gen = None
+        if hash_cb:
+            hash_gen = hash_cb(sum(self._get_file_block_info(
+                None, size, container_info_cache)[3] for size in sizes))
+            hash_gen.next()
+
+        def hash_progress(nblocks):
+            yield
+            while True:
+                hash_gen.next()
+                yield
+
+        #  hash: (source, offset, bytes) of a block with this hash
+        blocks, results, hashmaps, missing = {}, [None] * len(uploads), {}, []
+        for i, (obj, src, params) in enumerate(uploads):
+            f = open_source(src)
+            try:
+                block_info = self._get_file_block_info(
+                    f, sizes[i], container_info_cache)
+                hashes, hmap = [], {}
+                self._calculate_blocks_for_upload(
+                    *block_info,
+                    hashes=hashes,
+                    hmap=hmap,
+                    fileobj=f,
+                    hash_cb=hash_progress if hash_gen else None)
+            finally:
+                close_source(src, f)
+            for hash, (offset, bytes) in hmap.items():
+                blocks.setdefault(hash, (src, offset, bytes))
+            blocksize = block_info[0]
+
+            hashmaps[i] = dict(bytes=sizes[i], hashes=hashes)
+            r = self._create_object_or_get_missing_hashes(
+                obj, hashmaps[i],
+                size=sizes[i],
+                content_type=params.get(
+                    'content_type', None) or 'application/octet-stream',
+                if_etag_not_match='*' if if_not_exist else None,
+                content_encoding=params.get('content_encoding', None),
+                content_disposition=params.get('content_disposition', None),
+                permissions=params.get('sharing', None),
+                public=params.get('public', None))
+            obj_missing, results[i] = r
+            if obj_missing is None:
+                hashmaps.pop(i)
+            else:
+                missing += obj_missing
+        missing = list(set(missing))
+        sendlog.info('%s distinct blocks missing from %s objects' % (
+            len(missing), len(hashmaps)))
+
+        upload_gen = None
+        if upload_cb:
+            upload_gen = upload_cb(len(missing))
+            upload_gen.next()
+
+        if missing:
+            missing = self._upload_shared_blocks(
+                missing, blocks, open_source, close_source, upload_gen,
+                blocksize)
+        if missing:
+            raise ClientError(
+                '%s blocks failed to upload' % len(missing),
+                details=['Blocks: %s' % ', '.join(missing)])
+
+        for i, hashmap in sorted(hashmaps.items()):
+            obj, src, params = uploads[i]
+            r = self.object_put(
+                obj,
+                format='json',
+                hashmap=True,
+                content_type=params.get(
+                    'content_type', None) or 'application/octet-stream',
+                content_encoding=params.get('content_encoding', None),
+                content_disposition=params.get('content_disposition', None),
+                if_etag_not_match='*' if if_not_exist else None,
+                json=hashmap,
+                permissions=params.get('sharing', None),
+                public=params.get('public', None),
+                success=201)
+            results[i] = r.headers
+        return results
+
+    def _upload_shared_blocks(
+            self, missing, blocks, open_source, close_source, upload_gen=None,
+            blocksize=None):
+        """Upload blocks of many files, each source is opened once
+
+        :param blocks: (dict) hash: (source, offset, bytes)
+
+        :param blocksize: (int) if given, blocks are uploaded in batches of
+            up to BLOCK_BATCH_SIZE bytes
+
+        :returns: (list) the hashes of the blocks that failed to upload
+        """
+        by_source, sizes = {}, {}
+        for hash in missing:
+            src, offset, bytes = blocks[hash]
+            by_source.setdefault(src, []).append((offset, bytes, hash))
+            sizes[hash] = bytes
+
+        batch = self._new_batch()
+        failures = []
+        try:
+            for src, src_blocks in by_source.items():
+                #  mapped blocks remain valid after the file is closed
+                f = open_source(src)
+                try:
+                    source = BlockSource(f)
+                    src_missing = [hash for o, b, hash in sorted(src_blocks)]
+                    for pack in self._pack_blocks(
+                            src_missing, sizes, blocksize):
+                        self._put_blocks_async(batch, [(source.read(
+                            *blocks[hash][1:]), hash) for hash in pack],
+                            blocksize)
+                        self._collect_jobs(
+                            batch.completed(), failures, upload_gen)
+                finally:
+                    close_source(src, f)
+            self._collect_jobs(
+                batch.completed(wait=True), failures, upload_gen)
+        except KeyboardInterrupt:
+            self._cancel_jobs(batch)
+            raise
+        return [hash for job in failures for hash in self._job_hashes(job)]
+
+    def upload_objects_concurrently(
+            self, uploads,
+            parallel=4,
+            done_cb=None,
+            container_info_cache=None,
+            **kwargs):
+        """Upload many files, up to "parallel" at a time. Blocks of all files
+        are transferred by the worker pool of this client, so the thread and
+        connection budget (MAX_THREADS) is shared by all uploads
+
+        :param uploads: iterable of (obj, source, params), where source is an
+            open file descriptor or a local file path and params is a dict of
+            upload_object keyword arguments for this object, or None.
+            It is consumed as uploads proceed and paths are opened only while
+            uploaded, so that a generator keeps few local files open
+
+        :param parallel: (int) max number of files uploaded at once
+
+        :param done_cb: called as done_cb(obj, source, headers, error) when
+            each upload is over, error is None on success
+
+        :param container_info_cache: (dict) if given, avoid redundant calls to
+            server for container info (block size and hash information)
+
+        :param kwargs: default upload_object keyword arguments for all objects
+
+        :returns: (list) (obj, headers, error) for each upload, in order of
+            completion, where error is None on success
+        """
+        self._assert_container()
+        if not isinstance(container_info_cache, dict):
+            container_info_cache = dict()
+        self._get_worker_pool()
+
+        def upload(obj, src, params):
+            f = open(src, 'rb') if isinstance(src, basestring) else src
+            try:
+                return self._clone().upload_object(
+                    obj, f, container_info_cache=container_info_cache,
+                    **params)
+            finally:
+                if f is not src:
+                    f.close()
+
+        results = []
+
+        def collect(job):
+            obj, src, params = job.args
+            error = job.exception or None
+            results.append((obj, job.value, error))
+            if done_cb:
+                done_cb(obj, src, job.value, error)
+
+        self._run_concurrently(
+            upload,
+            ((obj, src, dict(kwargs, **(params or {}))) for (
+                obj, src, params) in uploads),
+            collect, parallel, 'uploads')
+        return results
+
     def upload_from_string(
             self, obj, input_str,
             hash_cb=None,
@@ -556,11 +1178,14 @@ class PithosClient(PithosRestClient):
 
         hashes = []
         hmap = {}
-        for blockid in range(nblocks):
-            start = blockid * blocksize
-            block = input_str[start: (start + blocksize)]
-            hashes.append(_pithos_hash(block, blockhash))
-            hmap[hashes[blockid]] = (start, block)
+        #  str blocks are served as buffer views, to avoid copying data
+        view = buffer if isinstance(input_str, str) else (
+            lambda data, start, size: data[start: (start + size)])
+        blocks = ((start, view(input_str, start, blocksize)) for start in (
+            blockid * blocksize for blockid in range(nblocks)))
+        for start, block, hash in self._hash_blocks(blocks, blockhash):
+            hashes.append(hash)
+            hmap[hash] = (start, block)
 
         hashmap = dict(bytes=size, hashes=hashes)
         missing, obj_headers = self._create_object_or_get_missing_hashes(
@@ -582,40 +1207,22 @@ class PithosClient(PithosRestClient):
             for i in range(nblocks + 1 - num_of_missing):
                 self._cb_next()
 
-        tries = 7
-        old_failures = 0
+        batch = self._new_batch()
+        upload_gen = getattr(self, 'progress_bar_gen', None)
+        failures = []
         try:
-            while tries and missing:
-                flying = []
-                failures = []
-                for hash in missing:
-                    offset, block = hmap[hash]
-                    bird = self._put_block_async(block, hash)
-                    flying.append(bird)
-                    unfinished = self._watch_thread_limit(flying)
-                    for thread in set(flying).difference(unfinished):
-                        if thread.exception:
-                            failures.append(thread.kwargs['hash'])
-                        if thread.isAlive():
-                            flying.append(thread)
-                        else:
-                            self._cb_next()
-                    flying = unfinished
-                for thread in flying:
-                    thread.join()
-                    if thread.exception:
-                        failures.append(thread.kwargs['hash'])
-                    self._cb_next()
-                missing = failures
-                if missing and len(missing) == old_failures:
-                    tries -= 1
-                old_failures = len(missing)
-            if missing:
-                raise ClientError('%s blocks failed to upload' % len(missing))
+            for hash in missing:
+                offset, block = hmap[hash]
+                self._put_block_async(batch, block, hash)
+                self._collect_jobs(batch.completed(), failures, upload_gen)
+            self._collect_jobs(
+                batch.completed(wait=True), failures, upload_gen)
+            if failures:
+                raise ClientError(
+                    '%s blocks failed to upload' % len(failures),
+                    details=['%s' % job.exception for job in failures])
         except KeyboardInterrupt:
-            sendlog.info('- - - wait for threads to finish')
-            for thread in activethreads():
-                thread.join()
+            self._cancel_jobs(batch)
             raise
         self._cb_next()
 
@@ -634,6 +1241,119 @@ class PithosClient(PithosRestClient):
             success=201)
         return r.headers
 
+    def upload_from_stream(
+            self, obj, stream,
+            size=None,
+            upload_cb=None,
+            etag=None,
+            if_etag_match=None,
+            if_not_exist=None,
+            content_encoding=None,
+            content_disposition=None,
+            content_type=None,
+            sharing=None,
+            public=None,
+            container_info_cache=None):
+        """Upload an object from a stream that cannot be seeked, e.g., a pipe
+        Blocks are hashed and uploaded as they are read. Each block is kept in
+        memory only while it is being uploaded (or retried), so the memory
+        footprint is bounded by the worker pool queue. The hashmap is created
+        last.
+
+        :param obj: (str) remote object path
+
+        :param stream: a file-like object with a read method or an iterable
+            of str chunks
+
+        :param size: (int) the expected size of the stream, if known, only
+            used to report progress
+
+        :param upload_cb: optional progress.bar object for uploading, ignored
+            if size is not given
+
+        :param etag: (str)
+
+        :param if_etag_match: (str) Push that value to if-match header at file
+            creation
+
+        :param if_not_exist: (bool) If true, the file will be uploaded ONLY if
+            it does not exist remotely, otherwise the operation will fail.
+            Involves the case of an object with the same path is created while
+            the object is being uploaded.
+
+        :param content_encoding: (str)
+
+        :param content_disposition: (str)
+
+        :param content_type: (str)
+
+        :param sharing: {'read':[user and/or grp names],
+            'write':[usr and/or grp names]}
+
+        :param public: (bool)
+
+        :param container_info_cache: (dict) if given, avoid redundant calls to
+            server for container info (block size and hash information)
+
+        :returns: (dict) the headers of the created object
+        """
+        self._assert_container()
+        blocksize, blockhash, _, _ = self._get_file_block_info(
+            fileobj=None, size=0, cache=container_info_cache)
+        content_type = content_type or 'application/octet-stream'
+        upload_gen = None
+        if upload_cb and size is not None:
+            upload_gen = upload_cb(1 + (size - 1) // blocksize if size else 0)
+            upload_gen.next()
+
+        #  Blocks of a pre-existing version of the object are not uploaded
+        known = set() if if_not_exist else self._get_remote_hashes(obj)
+        hashes, offset, failures = [], 0, []
+        batch = self._new_batch()
+        try:
+            for start, block, hash in self._hash_blocks(
+                    stream_blocks(stream, blocksize), blockhash):
+                hashes.append(hash)
+                offset += len(block)
+                if hash in known:
+                    if upload_gen:
+                        try:
+                            upload_gen.next()
+                        except:
+                            pass
+                    continue
+                known.add(hash)
+                self._put_block_async(batch, block, hash)
+                self._collect_jobs(batch.completed(), failures, upload_gen)
+            self._collect_jobs(
+                batch.completed(wait=True), failures, upload_gen)
+            #  The stream cannot be read again, blocks are retried from
+            #  memory by the workers (see JOB_RETRY_LIMIT)
+            if failures:
+                raise ClientError(
+                    '%s blocks failed to upload' % len(failures),
+                    details=['%s' % job.exception for job in failures])
+        except KeyboardInterrupt:
+            self._cancel_jobs(batch)
+            raise
+
+        missing, obj_headers = self._create_object_or_get_missing_hashes(
+            obj, dict(bytes=offset, hashes=hashes),
+            content_type=content_type,
+            size=offset,
+            etag=etag,
+            if_etag_match=if_etag_match,
+            if_etag_not_match='*' if if_not_exist else None,
+            content_encoding=content_encoding,
+            content_disposition=content_disposition,
+            permissions=sharing,
+            public=public)
+        if missing:
+            raise ClientError(
+                '%s blocks are missing from the server and the stream cannot '
+                'be read again' % len(missing), 409)
+        return obj_headers
+
     # download_* auxiliary methods
     def _get_remote_blocks_info(self, obj, **restargs):
         #retrieve object hashmap
@@ -653,97 +1373,271 @@ class PithosClient(PithosRestClient):
                 map_dict[h] = [i]
         return (blocksize, blockhash, total_size, hashmap['hashes'], map_dict)
 
-    def _dump_blocks_sync(
+    def _dump_blocks_stream(
             self, obj, remote_hashes, blocksize, total_size, dst, crange,
             **args):
+        """Download blocks in parallel and write them to dst strictly in
+        order, for outputs that cannot seek (e.g., pipes, terminals)
+        Up to 2 * MAX_THREADS ranges are fetched ahead of the next one to
+        write, so memory usage is bounded by this reorder window. Without
+        crange, adjacent blocks are fetched in ranges of up to
+        RANGE_BATCH_SIZE bytes, and blocks found in the block store are not
+        downloaded
+        """
         if not total_size:
             return
-        for blockid, blockhash in enumerate(remote_hashes):
-            if blockhash:
-                start = blocksize * blockid
-                is_last = start + blocksize > total_size
-                end = (total_size - 1) if is_last else (start + blocksize - 1)
-                data_range = _range_up(start, end, total_size, crange)
-                if not data_range:
-                    self._cb_next()
-                    continue
-                args['data_range'] = 'bytes=%s' % data_range
-                r = self.object_get(obj, success=(200, 206), **args)
-                self._cb_next()
-                dst.write(r.content)
+        window = 2 * max(1, int(self.MAX_THREADS or 1))
+        batch = self._new_batch()
+        #  (job, None for a skipped block or a stored block, block offsets)
+        pending, done = deque(), set()
+
+        def write_next():
+            job, run = pending.popleft()
+            if job is None:
+                self._cb_next(len(run))
+                return
+            if isinstance(job, basestring):
+                dst.write(job)
                 dst.flush()
+                self._cb_next(len(run))
+                return
+            if job not in done:
+                for finished in batch.completed(wait=True):
+                    done.add(finished)
+                    if finished is job:
+                        break
+            done.remove(job)
+            if job.exception:
+                raise job.exception
+            content = job.value.content
+            dst.write(content)
+            dst.flush()
+            if not crange:
+                for i, start in enumerate(run):
+                    self._store_block(
+                        remote_hashes[start // blocksize],
+                        buffer(content, i * blocksize, blocksize))
+            self._cb_next(len(run))
+
+        starts = [blocksize * blockid for blockid in range(
+            len(remote_hashes))]
+        stored = set() if (crange or self.block_store is None) else set(
+            start for start in starts if (
+                remote_hashes[start // blocksize] in self.block_store))
+        runs = [[start] for start in starts] if crange else sorted(
+            list(self._coalesce_blocks(
+                [start for start in starts if start not in stored],
+                blocksize)) + [[start] for start in stored])
+        try:
+            for run in runs:
+                start, end = run[0], min(total_size, run[-1] + blocksize) - 1
+                block = self._stored_block(
+                    remote_hashes[start // blocksize],
+                    end + 1 - start) if start in stored else None
+                data_range = _range_up(start, end, total_size, crange)
+                if block is not None:
+                    pending.append((block, run))
+                elif data_range:
+                    args['data_range'] = 'bytes=%s' % data_range
+                    pending.append((self._get_block_async(
+                        batch, obj, size=_range_length(data_range), **args),
+                        run))
+                else:
+                    pending.append((None, run))
+                while len(pending) >= window:
+                    write_next()
+            while pending:
+                write_next()
+        except KeyboardInterrupt:
+            self._cancel_jobs(batch)
+            raise
+        except Exception:
+            batch.cancel()
+            raise
+
+    def _get_range(self, obj, size=None, **args):
+        """Download a range of an object, in the calling (worker) thread
+
+        :param size: (int) the length of the range, if known
 
-    def _get_block_async(self, obj, **args):
-        event = SilentEvent(self.object_get, obj, success=(200, 206), **args)
-        event.start()
-        return event
+        :returns: the response
+
+        :raises ClientError: (500) if the response is not as long as the
+            range, so that the range is retried
+        """
+        r = self.object_get(obj, success=(200, 206), **args)
+        if size is not None and len(r.content) != size:
+            raise ClientError(
+                'Received %s of %s bytes' % (len(r.content), size), 500)
+        return r
+
+    def _get_block_async(self, batch, obj, size=None, **args):
+        return batch.submit(self._get_range, obj, size=size, **args)
 
     def _hash_from_file(self, fp, start, size, blockhash):
+        """:param fp: open file descriptor or BlockSource"""
+        if isinstance(fp, BlockSource):
+            return _pithos_hash(fp.read(start, size), blockhash)
         fp.seek(start)
-        block = readall(fp, size)
-        h = newhashlib(blockhash)
-        h.update(block.strip('\x00'))
-        return hexlify(h.digest())
+        return _pithos_hash(readall(fp, size), blockhash)
 
-    def _thread2file(self, flying, blockids, local_file, offset=0, **restargs):
-        """write the results of a greenleted rest call to a file
+    def _coalesce_blocks(self, starts, blocksize):
+        """Group blocks in runs of adjacent blocks, to be downloaded with a
+        range of up to RANGE_BATCH_SIZE bytes each
 
-        :param offset: the offset of the file up to blocksize
-        - e.g. if the range is 10-100, all blocks will be written to
-        normal_position - 10
+        :param starts: (list) sorted block offsets
+
+        :yields: (list) the block offsets of each run
         """
-        for key, g in flying.items():
-            if g.isAlive():
-                continue
-            if g.exception:
-                raise g.exception
-            block = g.value.content
-            for block_start in blockids[key]:
-                local_file.seek(block_start + offset)
-                local_file.write(block)
-                self._cb_next()
-            flying.pop(key)
-            blockids.pop(key)
-        local_file.flush()
+        budget = max(blocksize, int(self.RANGE_BATCH_SIZE or 0))
+        run = []
+        for start in starts:
+            if run and (start != run[-1] + blocksize or (
+                    len(run) + 1) * blocksize > budget):
+                yield run
+                run = []
+            run.append(start)
+        if run:
+            yield run
+
+    def _get_blocks_to_file(
+            self, sink, blockids, blocksize, obj, hashes=(), size=None,
+            **args):
+        """Download a range of blocks and write each block to all of its
+        positions, in the calling (worker) thread
+
+        :param sink: (BlockSink) the destination file
+
+        :param blockids: (list) [[block positions in file], ...], a list of
+            positions for each block of the range
+
+        :param blocksize: (int) None if the range is a single block
+
+        :param hashes: (list) the hashes of the blocks of the range, to keep
+            them in the block store
+
+        :param size: (int) the length of the range, if known
+
+        :returns: (int) the number of bytes downloaded
+
+        :raises ClientError: (500) if the response is not as long as the
+            range, so that the range is retried
+        """
+        content = self.object_get(obj, success=(200, 206), **args).content
+        if size is not None and len(content) != size:
+            raise ClientError(
+                'Received %s of %s bytes' % (len(content), size), 500)
+        for i, positions in enumerate(blockids):
+            block = content if blocksize is None else buffer(
+                content, i * blocksize, blocksize)
+            if hashes:
+                self._store_block(hashes[i], block)
+            for block_start in positions:
+                sink.write(block_start, block)
+        return len(content)
+
+    def _get_blocks_to_file_async(
+            self, batch, sink, blockids, blocksize, obj, hashes=(), size=None,
+            **args):
+        return batch.submit(
+            self._get_blocks_to_file, sink, blockids, blocksize, obj,
+            hashes=hashes, size=size, **args)
+
+    def _collect_blocks(self, jobs, blockids):
+        """Advance progress for the blocks written by finished jobs
+
+        :param blockids: (dict) job: the number of blocks written by job
+        """
+        for job in jobs:
+            if job.exception:
+                raise job.exception
+            self._cb_next(blockids.pop(job))
 
     def _dump_blocks_async(
             self, obj, remote_hashes, blocksize, total_size, local_file,
             blockhash=None, resume=False, filerange=None, **restargs):
+        """Download blocks in parallel, each worker writes the blocks it
+        downloads straight to local_file, so memory usage is bounded by the
+        blocks in flight. Without filerange, blocks found in the block store
+        are not downloaded"""
         file_size = fstat(local_file.fileno()).st_size if resume else 0
-        flying = dict()
+        #  Cached hashes of an unchanged local file spare hashing its blocks
+        local_hashes = self._get_cached_hashes(
+            local_file, blocksize, blockhash, file_size) if (
+                file_size) else None
+        sink = BlockSink(local_file)
+        if not filerange:
+            #  Workers may write blocks past the end of the file
+            file_size = min(file_size, total_size)
+            sink.preallocate(total_size)
+        #  check local blocks through file mappings, instead of reading them
+        source = BlockSource(local_file, file_size)
+        batch = self._new_batch()
         blockid_dict = dict()
-        offset = 0
+        #  block offset: offsets of the blocks with the same contents
+        needed, hashes = dict(), dict()
 
-        self._init_thread_limit()
-        for block_hash, blockids in remote_hashes.items():
-            blockids = [blk * blocksize for blk in blockids]
-            unsaved = [blk for blk in blockids if not (
-                blk < file_size and block_hash == self._hash_from_file(
-                        local_file, blk, blocksize, blockhash))]
-            self._cb_next(len(blockids) - len(unsaved))
-            if unsaved:
-                key = unsaved[0]
-                self._watch_thread_limit(flying.values())
-                self._thread2file(
-                    flying, blockid_dict, local_file, offset,
-                    **restargs)
-                end = total_size - 1 if (
-                    key + blocksize > total_size) else key + blocksize - 1
-                if end < key:
-                    self._cb_next()
-                    continue
-                data_range = _range_up(key, end, total_size, filerange)
-                if not data_range:
-                    self._cb_next()
-                    continue
-                restargs[
-                    'async_headers'] = {'Range': 'bytes=%s' % data_range}
-                flying[key] = self._get_block_async(obj, **restargs)
-                blockid_dict[key] = unsaved
-
-        for thread in flying.values():
-            thread.join()
-        self._thread2file(flying, blockid_dict, local_file, offset, **restargs)
+        try:
+            for block_hash, blockids in remote_hashes.items():
+                blockids = [blk * blocksize for blk in blockids]
+                unsaved = [blk for blk in blockids if not (
+                    blk < file_size and block_hash == (
+                        local_hashes[blk // blocksize] if local_hashes else (
+                            self._hash_from_file(
+                                source, blk, blocksize, blockhash))))]
+                self._cb_next(len(blockids) - len(unsaved))
+                if unsaved and not filerange:
+                    needed[unsaved[0]] = unsaved
+                    hashes[unsaved[0]] = block_hash
+                elif unsaved:
+                    key = unsaved[0]
+                    self._collect_blocks(batch.completed(), blockid_dict)
+                    end = total_size - 1 if (
+                        key + blocksize > total_size) else key + blocksize - 1
+                    if end < key:
+                        self._cb_next()
+                        continue
+                    data_range = _range_up(key, end, total_size, filerange)
+                    if not data_range:
+                        self._cb_next()
+                        continue
+                    restargs[
+                        'async_headers'] = {'Range': 'bytes=%s' % data_range}
+                    job = self._get_blocks_to_file_async(
+                        batch, sink, [unsaved], None, obj,
+                        size=_range_length(data_range), **restargs)
+                    blockid_dict[job] = len(unsaved)
+
+            for start in sorted(needed) if (
+                    self.block_store is not None) else ():
+                block = self._stored_block(
+                    hashes[start], min(blocksize, total_size - start))
+                if block is not None:
+                    positions = needed.pop(start)
+                    for block_start in positions:
+                        sink.write(block_start, block)
+                    self._cb_next(len(positions))
+
+            #  Each distinct block is downloaded once, with its neighbours
+            for run in self._coalesce_blocks(sorted(needed), blocksize):
+                self._collect_blocks(batch.completed(), blockid_dict)
+                end = min(total_size, run[-1] + blocksize) - 1
+                restargs['async_headers'] = {
+                    'Range': 'bytes=%s-%s' % (run[0], end)}
+                blockids = [needed[start] for start in run]
+                job = self._get_blocks_to_file_async(
+                    batch, sink, blockids, blocksize, obj,
+                    hashes=[hashes[start] for start in run],
+                    size=end - run[0] + 1, **restargs)
+                blockid_dict[job] = sum(len(b) for b in blockids)
+
+            self._collect_blocks(batch.completed(wait=True), blockid_dict)
+        except KeyboardInterrupt:
+            self._cancel_jobs(batch)
+            raise
+        except Exception:
+            batch.cancel()
+            raise
 
     def download_object(
             self, obj, dst,
@@ -757,10 +1651,12 @@ class PithosClient(PithosRestClient):
             if_unmodified_since=None,
             headers=dict()):
         """Download an object (multiple connections, random blocks)
+        If dst cannot seek (e.g., a pipe), blocks are still downloaded in
+        parallel, but written in order
 
         :param obj: (str) remote object path
 
-        :param dst: open file descriptor (wb+)
+        :param dst: open file descriptor (wb+) or stream
 
         :param download_cb: optional progress.bar object for downloading
 
@@ -802,8 +1698,8 @@ class PithosClient(PithosRestClient):
             self.progress_bar_gen = download_cb(len(hash_list))
             self._cb_next()
 
-        if dst.isatty():
-            self._dump_blocks_sync(
+        if not _seekable(dst):
+            self._dump_blocks_stream(
                 obj,
                 hash_list,
                 blocksize,
@@ -824,9 +1720,74 @@ class PithosClient(PithosRestClient):
                 **restargs)
             if not range_str:
                 dst.truncate(total_size)
+                dst.flush()
+                self._set_cached_hashes(
+                    dst, blocksize, blockhash, total_size, hash_list,
+                    self._get_hash_cache_key(dst))
 
         self._complete_cb()
 
+    def download_objects_concurrently(
+            self, downloads,
+            parallel=4,
+            done_cb=None,
+            **kwargs):
+        """Download many objects, up to "parallel" at a time. Blocks of all
+        objects are transferred by the worker pool of this client, so the
+        thread and connection budget (MAX_THREADS) is shared by all downloads
+
+        :param downloads: iterable of (obj, destination, params), where
+            destination is an open file descriptor or a local file path and
+            params is a dict of download_object keyword arguments for this
+            object, or None. It is consumed as downloads proceed and paths
+            are opened only when downloaded, so that a generator keeps few
+            local files open
+
+        :param parallel: (int) max number of objects downloaded at once
+
+        :param done_cb: called as done_cb(obj, destination, headers, error)
+            when each download is over, error is None on success
+
+        :param kwargs: default download_object keyword arguments for all
+            objects
+
+        :returns: (list) (obj, headers, error) for each download, in order of
+            completion, where error is None on success
+        """
+        self._assert_container()
+        self._get_worker_pool()
+
+        def download(obj, dst, params):
+            if isinstance(dst, basestring):
+                resume = params.get('resume') and exists(dst)
+                f = open(dst, 'rb+' if resume else 'wb+')
+            else:
+                f = dst
+            try:
+                headers = dict()
+                self._clone().download_object(
+                    obj, f, headers=headers, **params)
+                return headers
+            finally:
+                if f is not dst:
+                    f.close()
+
+        results = []
+
+        def collect(job):
+            obj, dst, params = job.args
+            error = job.exception or None
+            results.append((obj, job.value, error))
+            if done_cb:
+                done_cb(obj, dst, job.value, error)
+
+        self._run_concurrently(
+            download,
+            ((obj, dst, dict(kwargs, **(params or {}))) for (
+                obj, dst, params) in downloads),
+            collect, parallel, 'downloads')
+        return results
+
     def download_to_string(
             self, obj,
             download_cb=None,
@@ -882,35 +1843,188 @@ class PithosClient(PithosRestClient):
             self.progress_bar_gen = download_cb(len(hash_list))
             self._cb_next()
 
-        num_of_blocks = len(remote_hashes)
-        ret = [''] * num_of_blocks
-        self._init_thread_limit()
-        flying = dict()
+        ret = [''] * len(hash_list)
+        batch = self._new_batch()
+        #  job: [[positions of a block in hash_list], ...] for each block
+        blockids = dict()
+
+        def collect(jobs):
+            for job in jobs:
+                if job.exception:
+                    raise job.exception
+                content, run = job.value.content, blockids.pop(job)
+                for i, positions in enumerate(run):
+                    block = content if len(run) == 1 else content[
+                        i * blocksize:(i + 1) * blocksize]
+                    if not range_str:
+                        self._store_block(hash_list[positions[0]], block)
+                    for blockid in positions:
+                        ret[blockid] = block
+                        self._cb_next()
+
         try:
-            for blockid, blockhash in enumerate(remote_hashes):
-                start = blocksize * blockid
-                is_last = start + blocksize > total_size
-                end = (total_size - 1) if is_last else (start + blocksize - 1)
-                data_range_str = _range_up(start, end, end, range_str)
-                if data_range_str:
-                    self._watch_thread_limit(flying.values())
-                    restargs['data_range'] = 'bytes=%s' % data_range_str
-                    flying[blockid] = self._get_block_async(obj, **restargs)
-                for runid, thread in flying.items():
-                    if (blockid + 1) == num_of_blocks:
-                        thread.join()
-                    elif thread.isAlive():
-                        continue
-                    if thread.exception:
-                        raise thread.exception
-                    ret[runid] = thread.value.content
-                    self._cb_next()
-                    flying.pop(runid)
+            if range_str:
+                for blockid in range(len(hash_list)):
+                    start = blocksize * blockid
+                    is_last = start + blocksize > total_size
+                    end = (total_size - 1) if is_last else (
+                        start + blocksize - 1)
+                    data_range_str = _range_up(start, end, end, range_str)
+                    if data_range_str:
+                        restargs['data_range'] = 'bytes=%s' % data_range_str
+                        job = self._get_block_async(
+                            batch, obj, size=_range_length(data_range_str),
+                            **restargs)
+                        blockids[job] = [[blockid]]
+                    collect(batch.completed())
+            else:
+                #  Each distinct block is downloaded once, with neighbours
+                needed = dict((positions[0] * blocksize, positions) for (
+                    positions) in remote_hashes.values())
+                for start in sorted(needed) if (
+                        self.block_store is not None) else ():
+                    block = self._stored_block(
+                        hash_list[start // blocksize],
+                        min(blocksize, total_size - start))
+                    if block is not None:
+                        for blockid in needed.pop(start):
+                            ret[blockid] = block
+                            self._cb_next()
+                for run in self._coalesce_blocks(sorted(needed), blocksize):
+                    end = min(total_size, run[-1] + blocksize) - 1
+                    restargs['data_range'] = 'bytes=%s-%s' % (run[0], end)
+                    job = self._get_block_async(
+                        batch, obj, size=end - run[0] + 1, **restargs)
+                    blockids[job] = [needed[start] for start in run]
+                    collect(batch.completed())
+            collect(batch.completed(wait=True))
             return ''.join(ret)
         except KeyboardInterrupt:
-            sendlog.info('- - - wait for threads to finish')
-            for thread in activethreads():
-                thread.join()
+            self._cancel_jobs(batch)
+            raise
+        except Exception:
+            batch.cancel()
+            raise
+
+    def _get_range_into(self, obj, view, **args):
+        """Download a range of an object straight into a memory view, in
+        the calling (worker) thread
+
+        :returns: (int) the number of bytes downloaded
+        """
+        r = self.object_get(obj, success=(200, 206), sink=view, **args)
+        if r.sink_size != len(view):
+            raise ClientError(
+                'Received %s of %s bytes' % (r.sink_size, len(view)), 500)
+        return r.sink_size
+
+    def download_to_buffer(
+            self, obj,
+            download_cb=None,
+            version=None,
+            if_match=None,
+            if_none_match=None,
+            if_modified_since=None,
+            if_unmodified_since=None,
+            headers=dict()):
+        """Download an object to a memory buffer (multiple connections)
+        The buffer is allocated once, with the size of the object, and
+        responses are read straight into it, so, unlike download_to_string,
+        the object is not held in memory twice
+
+        :param obj: (str) remote object path
+
+        :param download_cb: optional progress.bar object for downloading
+
+        :param version: (str) file version
+
+        :param if_match: (str)
+
+        :param if_none_match: (str)
+
+        :param if_modified_since: (str) formated date
+
+        :param if_unmodified_since: (str) formated date
+
+        :param headers: (dict) a placeholder dict to gather object headers
+
+        :returns: (bytearray) the whole object contents
+        """
+        restargs = dict(
+            version=version,
+            if_match=if_match,
+            if_none_match=if_none_match,
+            if_modified_since=if_modified_since,
+            if_unmodified_since=if_unmodified_since,
+            headers=dict())
+
+        (
+            blocksize,
+            blockhash,
+            total_size,
+            hash_list,
+            remote_hashes) = self._get_remote_blocks_info(obj, **restargs)
+        headers.update(restargs.pop('headers'))
+        restargs.pop('data_range', None)
+        assert total_size >= 0
+
+        if download_cb:
+            self.progress_bar_gen = download_cb(len(hash_list))
+            self._cb_next()
+
+        ret = bytearray(total_size)
+        view = memoryview(ret)
+        batch = self._new_batch()
+        #  job: the offsets of the blocks of the range
+        blockids = dict()
+        #  block offset: positions in hash_list of blocks with same contents
+        needed = dict((positions[0] * blocksize, positions) for (
+            positions) in remote_hashes.values())
+
+        def copy_block(start, positions):
+            """Copy a block in place to the positions of its duplicates"""
+            size = min(blocksize, total_size - start)
+            for blockid in positions[1:]:
+                view[blockid * blocksize:blockid * blocksize + size] = view[
+                    start:start + size]
+            self._cb_next(len(positions))
+
+        def collect(jobs):
+            for job in jobs:
+                if job.exception:
+                    raise job.exception
+                for start in blockids.pop(job):
+                    positions = needed[start]
+                    self._store_block(hash_list[positions[0]], buffer(
+                        ret, start, min(blocksize, total_size - start)))
+                    copy_block(start, positions)
+
+        try:
+            for start in sorted(needed) if (
+                    self.block_store is not None) else ():
+                size = min(blocksize, total_size - start)
+                block = self._stored_block(hash_list[start // blocksize], size)
+                if block is not None:
+                    view[start:start + size] = block
+                    copy_block(start, needed.pop(start))
+
+            #  Each distinct block is downloaded once, with its neighbours
+            for run in self._coalesce_blocks(sorted(needed), blocksize):
+                end = min(total_size, run[-1] + blocksize)
+                restargs['async_headers'] = {
+                    'Range': 'bytes=%s-%s' % (run[0], end - 1)}
+                job = batch.submit(
+                    self._get_range_into, obj, view[run[0]:end], **restargs)
+                blockids[job] = run
+                collect(batch.completed())
+            collect(batch.completed(wait=True))
+            return ret
+        except KeyboardInterrupt:
+            self._cancel_jobs(batch)
+            raise
+        except Exception:
+            batch.cancel()
+            raise
 
     # Command Progress Bar method
     def _cb_next(self, step=1):
@@ -1312,62 +2426,34 @@ class PithosClient(PithosRestClient):
         return self.set_object_sharing(obj)
 
     def append_object(self, obj, source_file, upload_cb=None):
-        """
+        """Append the data of a local file to an object, by uploading the
+        new blocks in parallel and putting a hashmap of the existing blocks
+        followed by the new ones. The last block of the object, if partial,
+        is merged with the start of the data. Concurrent modifications of
+        the object make the append fail (If-Match), instead of interleaving
+
         :param obj: (str) remote object path
 
         :param source_file: open file descriptor
 
         :param upload_db: progress.bar for uploading
+
+        :returns: (list) the response headers
         """
         self._assert_container()
-        meta = self.get_container_info()
-        blocksize = int(meta['x-container-block-size'])
-        filesize = fstat(source_file.fileno()).st_size
-        nblocks = 1 + (filesize - 1) // blocksize
-        offset = 0
-        headers = {}
-        if upload_cb:
-            self.progress_bar_gen = upload_cb(nblocks)
-            self._cb_next()
-        flying = {}
-        self._init_thread_limit()
+        info = self.get_object_info(obj)
+        #  A directory object becomes a file
+        if info.get('content-type', '').split(';')[0].strip() in (
+                'application/directory', 'application/folder'):
+            info = dict(info, **{'content-type': 'application/octet-stream'})
+        hashmap = self.get_object_hashmap(obj)
+        datasize = fstat(source_file.fileno()).st_size - source_file.tell()
         try:
-            for i in range(nblocks):
-                block = source_file.read(min(blocksize, filesize - offset))
-                offset += len(block)
-
-                self._watch_thread_limit(flying.values())
-                unfinished = {}
-                flying[i] = SilentEvent(
-                    method=self.object_post,
-                    obj=obj,
-                    update=True,
-                    content_range='bytes */*',
-                    content_type='application/octet-stream',
-                    content_length=len(block),
-                    data=block)
-                flying[i].start()
-
-                for key, thread in flying.items():
-                    if thread.isAlive():
-                        if i < (nblocks - 1):
-                            unfinished[key] = thread
-                            continue
-                        thread.join()
-                    if thread.exception:
-                        raise thread.exception
-                    headers[key] = thread.value.headers
-                    self._cb_next()
-                flying = unfinished
-        except KeyboardInterrupt:
-            sendlog.info('- - - wait for threads to finish')
-            for thread in activethreads():
-                thread.join()
+            return [self._write_object_blocks(
+                obj, int(hashmap['bytes']), datasize, source_file, info,
+                hashmap, upload_cb=upload_cb)]
         finally:
-            from time import sleep
-            sleep(2 * len(activethreads()))
             self._cb_next()
-        return headers.values()
 
     def truncate_object(self, obj, upto_bytes):
         """
@@ -1389,7 +2475,7 @@ class PithosClient(PithosRestClient):
 
     def overwrite_object(
             self, obj, start, end, source_file,
-            source_version=None, upload_cb=None):
+            source_version=None, upload_cb=None, block_diff=False):
         """Overwrite a part of an object from local source file
         ATTENTION: content_type must always be application/octet-stream
 
@@ -1402,9 +2488,18 @@ class PithosClient(PithosRestClient):
         :param source_file: open file descriptor
 
         :param upload_db: progress.bar for uploading
+
+        :param block_diff: (bool) instead of posting the whole range, compare
+            the blocks of the range with the remote hashmap, upload only the
+            changed blocks in parallel and put the updated hashmap
+
+        :returns: (list) the response headers of each request
         """
 
         self._assert_container()
+        if block_diff:
+            return [self._overwrite_object_blocks(
+                obj, start, end, source_file, source_version, upload_cb)]
         r = self.get_object_info(obj, version=source_version)
         rf_size = int(r['content-length'])
         start, end = int(start), int(end)
@@ -1441,6 +2536,152 @@ class PithosClient(PithosRestClient):
         self._cb_next()
         return headers
 
+    def _overwrite_object_blocks(
+            self, obj, start, end, source_file, source_version, upload_cb):
+        """Overwrite a part of an object by rewriting its hashmap
+
+        :returns: (dict) the response headers of the hashmap PUT
+        """
+        info = self.get_object_info(obj, version=source_version)
+        #  The new version replaces the current one, not the source version
+        etag = self.get_object_info(obj).get('etag', None) if (
+            source_version) else info.get('etag', None)
+        hashmap = self.get_object_hashmap(obj, version=source_version)
+        size, start, end = int(hashmap['bytes']), int(start), int(end)
+        assert size >= start, 'Range start %s exceeds file size %s' % (
+            start, size)
+        assert size >= end, 'Range end %s exceeds file size %s' % (end, size)
+        datasize = min(end - start + 1, fstat(
+            source_file.fileno()).st_size - source_file.tell())
+        return self._write_object_blocks(
+            obj, start, datasize, source_file, info, hashmap, source_version,
+            upload_cb, etag)
+
+    def _write_object_blocks(
+            self, obj, start, datasize, source_file, info, hashmap,
+            source_version=None, upload_cb=None, etag=None):
+        """Write data from the current position of source_file to an object,
+        from position start on, by rewriting the object hashmap. The object
+        grows if the data go past its end.
+        Only the first and last blocks of the range may be downloaded, to
+        merge them with the local data, if the range is not block aligned.
+        Only the changed blocks missing from the server are uploaded, in
+        parallel. The object is replaced by a new version with the same
+        metadata, unless it is modified meanwhile (If-Match)
+
+        :param info: (dict) the object headers, as from get_object_info
+
+        :param hashmap: (dict) the object hashmap
+
+        :param source_version: (str) the version info and hashmap are of
+
+        :param etag: (str) the etag of the current version of the object,
+            to replace it only if unmodified (default: the etag in info)
+
+        :returns: (dict) the response headers of the hashmap PUT
+        """
+        blocksize, blockhash = int(hashmap['block_size']), hashmap[
+            'block_hash']
+        size, hashes = int(hashmap['bytes']), list(hashmap['hashes'])
+        base = source_file.tell()
+        if datasize <= 0:
+            return dict()
+        end = start + datasize - 1
+        new_size = max(size, end + 1)
+        first, last = start // blocksize, end // blocksize
+        if upload_cb:
+            self.progress_bar_gen = upload_cb(last - first + 1)
+            self._cb_next()
+
+        source = BlockSource(source_file)
+        #  hash: (offset, size) in source_file for the blocks in there
+        hmap = dict()
+        #  hash: data of the first/last blocks, merged with remote data
+        merged = dict()
+
+        def blocks():
+            for i in range(first, last + 1):
+                bstart = i * blocksize
+                bend = min(new_size, bstart + blocksize)
+                lo, hi = max(start, bstart), min(end + 1, bend)
+                local = (base + lo - start, hi - lo)
+                if (lo, hi) == (bstart, bend):
+                    hmap[i] = local
+                    yield i, source.read(*local)
+                    continue
+                remote = self.object_get(
+                    obj,
+                    data_range='bytes=%s-%s' % (bstart, min(size, bend) - 1),
+                    version=source_version,
+                    success=(200, 206)).content if bstart < size else ''
+                remote += '\x00' * (bend - bstart - len(remote))
+                merged[i] = remote[:lo - bstart] + str(
+                    source.read(*local)) + remote[hi - bstart:]
+                yield i, merged[i]
+
+        changed = set()
+        for i, block, hash in self._hash_blocks(blocks(), blockhash):
+            if i >= len(hashes) or hashes[i] != hash:
+                changed.add(hash)
+            if i >= len(hashes):
+                hashes.append(hash)
+            else:
+                hashes[i] = hash
+            if i in hmap:
+                hmap[hash] = hmap.pop(i)
+            else:
+                merged[hash] = merged.pop(i)
+            self._cb_next()
+        sendlog.info('%s of %s blocks changed' % (
+            len(changed), last - first + 1))
+
+        sharing = info.get('x-object-sharing', None)
+        put_kwargs = dict(
+            content_type=info.get('content-type', None),
+            content_encoding=info.get('content-encoding', None),
+            content_disposition=info.get('content-disposition', None),
+            if_etag_match=etag or info.get('etag', None),
+            permissions=dict((k.strip(), v.split(',')) for k, v in (
+                perm.split('=', 1) for perm in sharing.split(
+                    ';'))) if sharing else None,
+            public=True if info.get('x-object-public', None) else None,
+            metadata=dict(
+                (k[len('x-object-meta-'):], v) for k, v in info.items() if (
+                    k.startswith('x-object-meta-'))))
+        json = dict(bytes=new_size, hashes=hashes)
+        missing, obj_headers = self._create_object_or_get_missing_hashes(
+            obj, json, **put_kwargs)
+        if missing is None:
+            return obj_headers
+
+        #  Only changed blocks can be missing, they are uploaded in parallel
+        batch = self._new_batch()
+        failures = []
+        try:
+            for hash in set(missing).intersection(merged):
+                self._put_block_async(batch, merged[hash], hash)
+            self._collect_jobs(batch.completed(wait=True), failures)
+        except KeyboardInterrupt:
+            self._cancel_jobs(batch)
+            raise
+        failed = [hash for job in failures for hash in self._job_hashes(
+            job)] + self._upload_missing_blocks(
+                [hash for hash in missing if hash in hmap], hmap, source_file,
+                blocksize=blocksize)
+        if failed:
+            raise ClientError(
+                '%s blocks failed to upload' % len(failed),
+                details=['Blocks: %s' % ', '.join(failed)])
+
+        r = self.object_put(
+            obj,
+            format='json',
+            hashmap=True,
+            json=json,
+            success=201,
+            **put_kwargs)
+        return r.headers
+
     def copy_object(
             self, src_container, src_object, dst_container,
             dst_object=None,
@@ -1530,6 +2771,337 @@ class PithosClient(PithosRestClient):
             delimiter=delimiter)
         return r.headers
 
+    def clone_object(
+            self, src_object,
+            dst_object=None,
+            source=None,
+            source_version=None,
+            public=None,
+            content_type=None,
+            relay=False):
+        """Create an object with the hashmap of another object, so that no
+        data are transferred. The metadata of the source object are kept
+
+        :param src_object: (str) source object path
+
+        :param dst_object: (str) destination object path, default: src_object
+
+        :param source: (PithosClient) a client for the account and container
+            of the source object, default: this client
+
+        :param source_version: (str) source object version
+
+        :param public: (bool)
+
+        :param content_type: (str) default: the content type of the source
+
+        :param relay: (bool) if the destination does not have some of the
+            blocks, e.g., the source is in another deployment, copy them from
+            the source with range GETs, without touching the local disk
+
+        :returns: (dict) response headers
+
+        :raises ClientError: (409) if the destination does not have some of
+            the blocks of the source object and relay is not set
+        """
+        self._assert_container()
+        source = source or self
+        headers = dict()
+        hashmap = source.get_object_hashmap(
+            src_object, version=source_version, headers=headers)
+        if relay:
+            self._assert_block_params(hashmap)
+        dst_object = dst_object or src_object
+        json = dict(bytes=hashmap['bytes'], hashes=hashmap['hashes'])
+        put_kwargs = dict(
+            content_type=content_type or headers.get('content-type', None),
+            public=public,
+            metadata=dict(
+                (k[len('x-object-meta-'):], v) for k, v in headers.items() if (
+                    k.startswith('x-object-meta-'))))
+        missing, obj_headers = self._create_object_or_get_missing_hashes(
+            dst_object, json, **put_kwargs)
+        if not missing:
+            return obj_headers
+        if not relay:
+            raise ClientError(
+                'Cannot clone %s: %s blocks missing' % (
+                    src_object, len(missing)),
+                status=409,
+                details=['Missing blocks: %s' % ', '.join(missing)])
+        self._relay_blocks(
+            missing, hashmap, source, src_object,
+            version=source_version, etag=headers.get('etag', None))
+        r = self.object_put(
+            dst_object,
+            format='json',
+            hashmap=True,
+            json=json,
+            success=201,
+            **put_kwargs)
+        return r.headers
+
+    def _assert_block_params(self, hashmap):
+        """:raises ClientError: if the blocks of this container do not have
+            the block size and hash of hashmap"""
+        meta = self.get_container_info()
+        local = (
+            int(meta['x-container-block-size']),
+            meta['x-container-block-hash'])
+        remote = (int(hashmap['block_size']), hashmap['block_hash'])
+        if local != remote:
+            raise ClientError(
+                'Block size or hash of container %s do not match' % (
+                    self.container),
+                status=409,
+                details=[
+                    'Source blocks: %s bytes, %s' % remote,
+                    'Destination blocks: %s bytes, %s' % local])
+
+    def _relay_block(self, source, obj, start, end, hash, **args):
+        r = source.object_get(
+            obj,
+            data_range='bytes=%s-%s' % (start, end),
+            success=(200, 206),
+            **args)
+        self._put_block(r.content, hash)
+
+    def _relay_blocks(self, hashes, hashmap, source, obj, **args):
+        """Copy blocks of a source object to this container, each one with a
+        range GET from the source and a POST here. Only the blocks in flight
+        are kept in memory
+
+        :param hashes: (list) the hashes of the blocks to copy
+
+        :param hashmap: (dict) the hashmap of the source object
+
+        :param source: (PithosClient) a client for the source object
+
+        :param args: version and etag of the source object
+        """
+        blocksize, size = int(hashmap['block_size']), int(hashmap['bytes'])
+        starts = dict()
+        for i, hash in enumerate(hashmap['hashes']):
+            starts.setdefault(hash, i * blocksize)
+        batch = self._new_batch()
+        failures = []
+        try:
+            for hash in hashes:
+                start = starts[hash]
+                batch.submit(
+                    self._relay_block, source, obj,
+                    start, min(size, start + blocksize) - 1,
+                    hash=hash,
+                    version=args.get('version', None),
+                    if_etag_match=args.get('etag', None))
+                self._collect_jobs(batch.completed(), failures)
+            self._collect_jobs(batch.completed(wait=True), failures)
+        except KeyboardInterrupt:
+            self._cancel_jobs(batch)
+            raise
+        if failures:
+            raise ClientError(
+                '%s blocks failed to relay' % len(failures),
+                details=['%s: %s' % (job.kwargs['hash'], job.exception) for (
+                    job) in failures])
+        sendlog.info('Relayed %s blocks of %s' % (len(hashes), obj))
+
+    def clone_objects(
+            self, clones,
+            source=None,
+            parallel=8,
+            done_cb=None,
+            **kwargs):
+        """Clone many objects (see clone_object), up to "parallel" at a time
+
+        :param clones: iterable of (src_object, dst_object, params), where
+            params is a dict of clone_object keyword arguments for this
+            object, or None
+
+        :param source: (PithosClient) a client for the account and container
+            of the source objects, default: this client
+
+        :param parallel: (int) max number of objects cloned at once
+
+        :param done_cb: called as done_cb(src_object, dst_object, headers,
+            error) when each clone is over, error is None on success
+
+        :param kwargs: default clone_object keyword arguments for all objects
+
+        :returns: (list) (src_object, dst_object, headers, error) for each
+            clone, in order of completion, where error is None on success
+        """
+        self._assert_container()
+        source = source or self
+        self._get_worker_pool()
+
+        def clone(src, dst, params):
+            return self._clone().clone_object(
+                src, dst, source=source._clone(), **params)
+
+        results = []
+
+        def collect(job):
+            src, dst, params = job.args
+            error = job.exception or None
+            results.append((src, dst, job.value, error))
+            if done_cb:
+                done_cb(src, dst, job.value, error)
+
+        self._run_concurrently(
+            clone,
+            ((src, dst, dict(kwargs, **(params or {}))) for (
+                src, dst, params) in clones),
+            collect, parallel, 'clones')
+        return results
+
+    def bulk_object_operation(
+            self, operation, objects,
+            parallel=8,
+            done_cb=None,
+            dry_run=False,
+            retry_budget=None,
+            **kwargs):
+        """Apply an operation to many objects, up to "parallel" at a time
+        Operations failing with a transient error are retried with backoff,
+        up to JOB_RETRY_LIMIT times each. A retried move or delete that finds
+        the object missing is a success: the previous attempt was applied,
+        but its response was lost
+
+        :param operation: (str) one of BULK_OPERATIONS: copy, move, delete
+            or meta, applied by copy_object, move_object, del_object or
+            set_object_meta respectively
+
+        :param objects: iterable of object paths or (path, params) pairs,
+            where params is a dict of keyword arguments of the operation for
+            this object. It is consumed as operations proceed
+
+        :param parallel: (int) max number of operations running at once
+
+        :param done_cb: called as done_cb(obj, result, error) when each
+            operation is over, error is None on success
+
+        :param dry_run: (bool) do not apply the operations, result is the
+            keyword arguments each operation would be called with
+
+        :param retry_budget: (int) max number of retries in the whole run,
+            default: one per object submitted, but no less than
+            JOB_RETRY_BUDGET
+
+        :param kwargs: default keyword arguments of the operation for all
+            objects, e.g., src_container and dst_container for copy
+
+        :returns: (list) (obj, result, error) for each object, in order of
+            completion, where error is None on success
+        """
+        self._assert_container()
+        method, obj_arg = self.BULK_OPERATIONS[operation]
+
+        def apply(obj, call_kwargs, attempts):
+            attempts[0] += 1
+            try:
+                return getattr(self._clone(), method)(**call_kwargs)
+            except ClientError as ce:
+                #  A previous attempt was applied, but the response was lost
+                if ce.status == 404 and attempts[0] > 1 and (
+                        operation in ('move', 'delete')):
+                    return None
+                raise
+
+        results = []
+
+        def collect(obj, result, error):
+            results.append((obj, result, error))
+            if done_cb:
+                done_cb(obj, result, error)
+
+        def plan():
+            for item in objects:
+                obj, params = item if isinstance(item, tuple) else (
+                    item, None)
+                call_kwargs = dict(kwargs, **(params or {}))
+                call_kwargs[obj_arg] = obj
+                yield obj, call_kwargs
+
+        if dry_run:
+            for obj, call_kwargs in plan():
+                collect(obj, call_kwargs, None)
+            return results
+
+        policy = RetryPolicy(self.JOB_RETRY_LIMIT, retry_budget)
+
+        def calls():
+            for submitted, (obj, call_kwargs) in enumerate(plan()):
+                if retry_budget is None:
+                    policy.budget = max(self.JOB_RETRY_BUDGET, submitted + 1)
+                yield obj, call_kwargs, [0]
+
+        self._run_concurrently(
+            apply, calls(),
+            lambda job: collect(job.args[0], job.value, job.exception or None),
+            parallel, '%s operations' % operation, policy)
+        return results
+
+    def iter_objects(
+            self,
+            prefix=None,
+            delimiter=None,
+            limit=None,
+            marker=None,
+            **kwargs):
+        """Iterate over the objects of the container, a page of the listing
+        at a time. The next page is requested in the background, while the
+        caller consumes the current one
+
+        :param prefix: (str) list objects starting with prefix
+
+        :param delimiter: (str) list objects up to the delimiter
+
+        :param limit: (int) objects per page requested (default: the server
+            limit), the server may return fewer
+
+        :param marker: (str) list objects after marker
+
+        :param kwargs: container_get keyword arguments, e.g., path, meta,
+            show_only_shared or until
+
+        :yields: (dict) object info, or {'subdir': ...} entries if a
+            delimiter is given
+        """
+        self._assert_container()
+        lister = self._clone()
+
+        def page(marker):
+            r = lister.container_get(
+                limit=limit,
+                marker=marker,
+                prefix=prefix,
+                delimiter=delimiter,
+                success=(200, 204),
+                **kwargs)
+            return r.json if r.status_code == 200 else []
+
+        pages = WorkerPool(1, dedicated_connections=False)
+        batch = pages.batch(RetryPolicy(
+            self.JOB_RETRY_LIMIT, self.JOB_RETRY_BUDGET))
+        try:
+            batch.submit(page, marker)
+            while batch.pending:
+                for job in batch.completed(wait=True):
+                    if job.exception:
+                        raise job.exception
+                    objects = job.value
+                #  The server may cap pages below limit, only an empty page
+                #  is the end of the listing
+                if objects:
+                    last = objects[-1]
+                    batch.submit(page, last.get('name', last.get('subdir')))
+                for obj in objects:
+                    yield obj
+        finally:
+            batch.cancel()
+            pages.close()
+
     def get_sharing_accounts(self, limit=None, marker=None, *args, **kwargs):
         """Get accounts that share with self.account
 
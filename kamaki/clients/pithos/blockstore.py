@@ -0,0 +1,212 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+import sqlite3
+from contextlib import closing
+from os import makedirs, fdopen, rename, remove
+from os.path import join, isdir, dirname
+from tempfile import mkstemp
+from time import time
+from logging import getLogger
+from hashlib import new as newhashlib
+
+from kamaki.clients.utils import rstrip_nul
+
+
+log = getLogger(__name__)
+
+#  Default limit for the total size of the stored blocks, in bytes
+DEFAULT_LIMIT = 1024 * 1024 * 1024
+
+
+class BlockStore(object):
+    """A persistent, content addressed store of pithos blocks
+
+    Each block is kept in a file named after its hash, with its trailing
+    NUL bytes stripped, the way pithos hashes blocks. So, a stored block
+    serves any block with the same hash, padded with NULs to the size of
+    the latter. An SQLite index in the same directory keeps the size and
+    the last access time of each block. Least recently used blocks are
+    evicted when the total size of the stored blocks exceeds the limit.
+    Blocks are checked against their hashes when stored and when read, so
+    that a bad response or a damaged file is never served as a block.
+    """
+
+    def __init__(self, dirpath, limit=DEFAULT_LIMIT, blockhash='sha256'):
+        """
+        :param dirpath: (str) the store directory, created if missing
+
+        :param limit: (int) max total size of stored blocks in bytes
+
+        :param blockhash: (str) the hash algorithm of the blocks
+        """
+        self.dirpath = dirpath
+        self.limit = int(limit)
+        self.blockhash = blockhash
+        if not isdir(dirpath):
+            makedirs(dirpath)
+        with closing(self._connect()) as db:
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS blocks ('
+                'hash TEXT PRIMARY KEY, size INTEGER, atime REAL)')
+            db.commit()
+
+    def _connect(self):
+        return sqlite3.connect(join(self.dirpath, 'index.db'), timeout=30)
+
+    def _path(self, hash):
+        return join(self.dirpath, hash[:2], hash)
+
+    def _matches(self, hash, data):
+        """:returns: (bool) whether data, without trailing NULs, hash to hash
+        """
+        h = newhashlib(self.blockhash)
+        h.update(data)
+        return h.hexdigest() == hash
+
+    def _drop(self, hash):
+        """Remove a block that does not match its hash"""
+        log.debug('Block %s does not match its hash, dropped' % hash)
+        try:
+            remove(self._path(hash))
+        except OSError:
+            pass
+        try:
+            with closing(self._connect()) as db:
+                db.execute('DELETE FROM blocks WHERE hash=?', (hash, ))
+                db.commit()
+        except sqlite3.Error as e:
+            log.debug('Block store update failed: %s' % e)
+
+    def __contains__(self, hash):
+        try:
+            with closing(self._connect()) as db:
+                return db.execute(
+                    'SELECT 1 FROM blocks WHERE hash=?',
+                    ('%s' % hash, )).fetchone() is not None
+        except sqlite3.Error as e:
+            log.debug('Block store lookup failed: %s' % e)
+            return False
+
+    def get(self, hash, size):
+        """
+        :param hash: (str) the pithos hash of the block
+
+        :param size: (int) the size of the block
+
+        :returns: (str) the block or None if it is not stored
+        """
+        hash = '%s' % hash
+        try:
+            with open(self._path(hash), 'rb') as f:
+                data = f.read(size + 1)
+        except IOError:
+            return None
+        if len(data) > size:
+            return None
+        if not self._matches(hash, data):
+            self._drop(hash)
+            return None
+        try:
+            with closing(self._connect()) as db:
+                db.execute(
+                    'UPDATE blocks SET atime=? WHERE hash=?', (time(), hash))
+                db.commit()
+        except sqlite3.Error as e:
+            log.debug('Block store update failed: %s' % e)
+        return data + '\x00' * (size - len(data))
+
+    def put(self, hash, data):
+        """Store a block, evict old blocks if needed
+
+        :param hash: (str) the pithos hash of the block
+
+        :param data: (str or buffer) the block contents
+        """
+        hash, data = '%s' % hash, rstrip_nul(data)
+        if not self._matches(hash, data):
+            log.debug('Block does not match hash %s, not stored' % hash)
+            return
+        path = self._path(hash)
+        try:
+            with closing(self._connect()) as db:
+                if db.execute(
+                        'UPDATE blocks SET atime=? WHERE hash=?',
+                        (time(), hash)).rowcount:
+                    db.commit()
+                    return
+                if not isdir(dirname(path)):
+                    try:
+                        makedirs(dirname(path))
+                    except OSError:
+                        if not isdir(dirname(path)):
+                            raise
+                #  Readers never see a partially written block
+                fd, tmp = mkstemp(dir=dirname(path))
+                with fdopen(fd, 'wb') as f:
+                    f.write(data)
+                rename(tmp, path)
+                db.execute(
+                    'INSERT OR REPLACE INTO blocks VALUES (?,?,?)',
+                    (hash, len(data), time()))
+                db.commit()
+                self._evict(db)
+        except (sqlite3.Error, EnvironmentError) as e:
+            log.debug('Block store update failed: %s' % e)
+
+    def _evict(self, db):
+        total = db.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM blocks').fetchone()[0]
+        if total <= self.limit:
+            return
+        for hash, size in db.execute(
+                'SELECT hash, size FROM blocks ORDER BY atime').fetchall():
+            db.execute('DELETE FROM blocks WHERE hash=?', (hash, ))
+            try:
+                remove(self._path(hash))
+            except OSError:
+                pass
+            total -= size
+            if total <= self.limit:
+                break
+        db.commit()
+
+    def clear(self):
+        with closing(self._connect()) as db:
+            for (hash, ) in db.execute('SELECT hash FROM blocks').fetchall():
+                try:
+                    remove(self._path(hash))
+                except OSError:
+                    pass
+            db.execute('DELETE FROM blocks')
+            db.commit()
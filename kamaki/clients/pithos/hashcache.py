@@ -0,0 +1,157 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+
+import sqlite3
+from contextlib import closing
+from os import fstat, stat
+from time import time
+from logging import getLogger
+
+
+log = getLogger(__name__)
+
+#  Default limit for the total size of the stored hash lists, in bytes
+DEFAULT_LIMIT = 64 * 1024 * 1024
+
+
+def _file_key(fileobj):
+    """:returns: (device, inode, size, mtime_ns) of an open file or a path"""
+    try:
+        st = fstat(fileobj.fileno())
+    except AttributeError:
+        st = stat(fileobj)
+    mtime_ns = getattr(st, 'st_mtime_ns', int(st.st_mtime * 10 ** 9))
+    return st.st_dev, st.st_ino, st.st_size, mtime_ns
+
+
+class HashCache(object):
+    """A persistent cache of the block hashes of local files
+
+    Entries are keyed by (device, inode, size, mtime) of a file, along with
+    the block size and hash algorithm they were calculated with. If the
+    file is modified, its key changes and the old entry is never hit again.
+    Least recently used entries are evicted when the total size of the
+    stored hashes exceeds the limit.
+    """
+
+    def __init__(self, filepath, limit=DEFAULT_LIMIT):
+        """
+        :param filepath: (str) the SQLite database file
+
+        :param limit: (int) max total size of stored hashes in bytes
+        """
+        self.filepath = filepath
+        self.limit = int(limit)
+        with closing(self._connect()) as db:
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS hashes ('
+                'dev INTEGER, ino INTEGER, size INTEGER, mtime INTEGER, '
+                'blocksize INTEGER, blockhash TEXT, hashes TEXT, '
+                'atime REAL, '
+                'PRIMARY KEY (dev, ino, size, mtime, blocksize, blockhash))')
+            db.commit()
+
+    def _connect(self):
+        return sqlite3.connect(self.filepath, timeout=30)
+
+    def get(self, fileobj, blocksize, blockhash):
+        """
+        :param fileobj: open file descriptor or file path
+
+        :returns: (list) the block hashes of the file or None if not cached
+        """
+        key = _file_key(fileobj) + (int(blocksize), '%s' % blockhash)
+        try:
+            with closing(self._connect()) as db:
+                row = db.execute(
+                    'SELECT hashes FROM hashes WHERE dev=? AND ino=? AND '
+                    'size=? AND mtime=? AND blocksize=? AND blockhash=?',
+                    key).fetchone()
+                if row is None:
+                    return None
+                db.execute(
+                    'UPDATE hashes SET atime=? WHERE dev=? AND ino=? AND '
+                    'size=? AND mtime=? AND blocksize=? AND blockhash=?',
+                    (time(), ) + key)
+                db.commit()
+        except sqlite3.Error as e:
+            log.debug('Hash cache lookup failed: %s' % e)
+            return None
+        return row[0].split(',') if row[0] else []
+
+    def set(self, fileobj, blocksize, blockhash, hashes, file_key=None):
+        """Store the block hashes of a file, evict old entries if needed
+
+        :param fileobj: open file descriptor or file path
+
+        :param hashes: (list) the block hashes, in order
+
+        :param file_key: (tuple) the _file_key of the file before it was
+            hashed, if given. If the file changed since, hashes are not
+            stored
+        """
+        key = _file_key(fileobj)
+        if file_key is not None and tuple(file_key) != key:
+            log.debug('File changed while hashed, hashes not cached')
+            return
+        key += (int(blocksize), '%s' % blockhash)
+        try:
+            with closing(self._connect()) as db:
+                db.execute(
+                    'INSERT OR REPLACE INTO hashes VALUES (?,?,?,?,?,?,?,?)',
+                    key + (','.join(hashes), time()))
+                db.commit()
+                self._evict(db)
+        except sqlite3.Error as e:
+            log.debug('Hash cache update failed: %s' % e)
+
+    def _evict(self, db):
+        total = db.execute(
+            'SELECT COALESCE(SUM(LENGTH(hashes)), 0) FROM hashes').fetchone()
+        total = total[0]
+        if total <= self.limit:
+            return
+        for rowid, length in db.execute(
+                'SELECT rowid, LENGTH(hashes) FROM hashes '
+                'ORDER BY atime').fetchall():
+            db.execute('DELETE FROM hashes WHERE rowid=?', (rowid, ))
+            total -= length
+            if total <= self.limit:
+                break
+        db.commit()
+
+    def clear(self):
+        with closing(self._connect()) as db:
+            db.execute('DELETE FROM hashes')
+            db.commit()
@@ -0,0 +1,169 @@
+# Copyright 2015 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+import sqlite3
+from contextlib import closing
+from time import time
+from logging import getLogger
+
+from kamaki.clients.pithos.hashcache import _file_key
+
+
+log = getLogger(__name__)
+
+
+class UploadJournal(object):
+    """A persistent record of the progress of uploads
+
+    For each upload, the journal keeps the source file identity (device,
+    inode, size, mtime), the block hashes of the file and the hashes of the
+    blocks uploaded so far. An interrupted upload can resume from there,
+    without re-hashing the file or re-uploading blocks. If the source file
+    has changed since, its entry is stale and it is discarded.
+    Uploads are keyed by (account, container, object path).
+    """
+
+    def __init__(self, filepath):
+        """:param filepath: (str) the SQLite database file"""
+        self.filepath = filepath
+        with closing(self._connect()) as db:
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS uploads ('
+                'account TEXT, container TEXT, obj TEXT, '
+                'dev INTEGER, ino INTEGER, size INTEGER, mtime INTEGER, '
+                'blocksize INTEGER, blockhash TEXT, hashes TEXT, '
+                'ctime REAL, '
+                'PRIMARY KEY (account, container, obj))')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS blocks ('
+                'account TEXT, container TEXT, obj TEXT, hash TEXT, '
+                'PRIMARY KEY (account, container, obj, hash))')
+            db.commit()
+
+    def _connect(self):
+        return sqlite3.connect(self.filepath, timeout=30)
+
+    @staticmethod
+    def _key(key):
+        account, container, obj = key
+        return ('%s' % (account or ''), '%s' % container, '%s' % obj)
+
+    def get(self, key, fileobj, blocksize, blockhash):
+        """
+        :param key: (account, container, object path)
+
+        :param fileobj: open file descriptor or file path
+
+        :returns: (hashes, uploaded) where hashes is the list of block hashes
+            of the file (None if they were not recorded) and uploaded is the
+            set of uploaded block hashes, or None if there is no valid entry
+        """
+        key = self._key(key)
+        try:
+            with closing(self._connect()) as db:
+                row = db.execute(
+                    'SELECT dev, ino, size, mtime, blocksize, blockhash, '
+                    'hashes FROM uploads WHERE account=? AND container=? AND '
+                    'obj=?', key).fetchone()
+                if row is None:
+                    return None
+                if tuple(row[:6]) != _file_key(fileobj) + (
+                        int(blocksize), '%s' % blockhash):
+                    log.debug('Stale upload journal entry for %s' % (key, ))
+                    self._remove(db, key)
+                    return None
+                uploaded = set(h for (h, ) in db.execute(
+                    'SELECT hash FROM blocks WHERE account=? AND '
+                    'container=? AND obj=?', key))
+        except sqlite3.Error as e:
+            log.debug('Upload journal lookup failed: %s' % e)
+            return None
+        hashes = row[6].split(',') if row[6] else (
+            None if row[6] is None else [])
+        return hashes, uploaded
+
+    def start(self, key, fileobj, blocksize, blockhash, hashes=None):
+        """Record a new upload, drop any previous entry for key
+
+        :param hashes: (list) the block hashes of the file, if known
+        """
+        key = self._key(key)
+        try:
+            with closing(self._connect()) as db:
+                self._remove(db, key)
+                db.execute(
+                    'INSERT INTO uploads VALUES (?,?,?,?,?,?,?,?,?,?,?)',
+                    key + _file_key(fileobj) + (
+                        int(blocksize), '%s' % blockhash,
+                        None if hashes is None else ','.join(hashes), time()))
+                db.commit()
+        except sqlite3.Error as e:
+            log.debug('Upload journal update failed: %s' % e)
+
+    def set_hashes(self, key, hashes):
+        """Record the block hashes of an upload started without them"""
+        try:
+            with closing(self._connect()) as db:
+                db.execute(
+                    'UPDATE uploads SET hashes=? WHERE account=? AND '
+                    'container=? AND obj=?',
+                    (','.join(hashes), ) + self._key(key))
+                db.commit()
+        except sqlite3.Error as e:
+            log.debug('Upload journal update failed: %s' % e)
+
+    def block_done(self, key, hash):
+        """Record that the block with this hash is uploaded"""
+        try:
+            with closing(self._connect()) as db:
+                db.execute(
+                    'INSERT OR IGNORE INTO blocks VALUES (?,?,?,?)',
+                    self._key(key) + ('%s' % hash, ))
+                db.commit()
+        except sqlite3.Error as e:
+            log.debug('Upload journal update failed: %s' % e)
+
+    def _remove(self, db, key):
+        for table in ('uploads', 'blocks'):
+            db.execute(
+                'DELETE FROM %s WHERE account=? AND container=? AND '
+                'obj=?' % table, key)
+        db.commit()
+
+    def remove(self, key):
+        """Drop the entry of a finished upload"""
+        try:
+            with closing(self._connect()) as db:
+                self._remove(db, self._key(key))
+        except sqlite3.Error as e:
+            log.debug('Upload journal update failed: %s' % e)
@@ -32,11 +32,14 @@
 # or implied, of GRNET S.A.
 
 from unittest import TestCase
-from mock import patch, call
-from tempfile import NamedTemporaryFile
-from os import urandom
+from mock import patch, call, DEFAULT
+from tempfile import NamedTemporaryFile, mkdtemp
+from os.path import join
+from shutil import rmtree
+from os import urandom, utime
 from itertools import product
-from random import randint
+from random import randint, random
+from time import sleep
 
 from kamaki.clients import pithos, ClientError
 
@@ -142,6 +145,16 @@ sharers = [
     dict(last_modified="2013-01-29T16:50:06.084674+00:00", name="2b1a-82d6")]
 
 
+class FakeHashCache(object):
+    stored = None
+
+    def get(self, fileobj, blocksize, blockhash):
+        return self.stored
+
+    def set(self, fileobj, blocksize, blockhash, hashes, file_key=None):
+        self.stored = hashes
+
+
 class FR(object):
     """FR stands for Fake Response"""
     json = dict()
@@ -770,6 +783,164 @@ class PithosMethods(TestCase):
             self.assertEqual(_range_up(*args), expected)
 
 
+class HashCache(TestCase):
+
+    def setUp(self):
+        from kamaki.clients.pithos.hashcache import HashCache
+        self.db = NamedTemporaryFile()
+        self.cache = HashCache(self.db.name)
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_get_set(self):
+        with NamedTemporaryFile() as f:
+            f.write('some data')
+            f.flush()
+            self.assertEqual(self.cache.get(f, 4, 'sha256'), None)
+            self.cache.set(f, 4, 'sha256', ['h1', 'h2', 'h3'])
+            self.assertEqual(self.cache.get(f, 4, 'sha256'), [
+                'h1', 'h2', 'h3'])
+            self.assertEqual(self.cache.get(f.name, 4, 'sha256'), [
+                'h1', 'h2', 'h3'])
+            self.assertEqual(self.cache.get(f, 8, 'sha256'), None)
+            self.assertEqual(self.cache.get(f, 4, 'md5'), None)
+
+            #  A modified file is a cache miss
+            f.write('more data')
+            f.flush()
+            self.assertEqual(self.cache.get(f, 4, 'sha256'), None)
+
+            #  Hashes of a file modified while hashed are not stored
+            from kamaki.clients.pithos.hashcache import _file_key
+            key = _file_key(f)
+            f.seek(0)
+            f.write('other')
+            f.flush()
+            utime(f.name, (1, 1))
+            self.cache.set(f, 4, 'sha256', ['h4'], file_key=key)
+            self.assertEqual(self.cache.get(f, 4, 'sha256'), None)
+            self.cache.set(f, 4, 'sha256', ['h5'], file_key=_file_key(f))
+            self.assertEqual(self.cache.get(f, 4, 'sha256'), ['h5'])
+
+    def test_evict(self):
+        self.cache.limit = 10
+        files = [NamedTemporaryFile() for i in range(3)]
+        try:
+            for i, f in enumerate(files):
+                self.cache.set(f, 4, 'sha256', ['hash%s' % i])
+            self.assertEqual(self.cache.get(files[0], 4, 'sha256'), None)
+            self.assertEqual(self.cache.get(files[1], 4, 'sha256'), ['hash1'])
+            self.assertEqual(self.cache.get(files[2], 4, 'sha256'), ['hash2'])
+            self.cache.clear()
+            self.assertEqual(self.cache.get(files[2], 4, 'sha256'), None)
+        finally:
+            for f in files:
+                f.close()
+
+
+class UploadJournal(TestCase):
+
+    key = ('acc0un7', 'c0nt@1n3r', 'dir/0bj')
+
+    def setUp(self):
+        from kamaki.clients.pithos.journal import UploadJournal
+        self.db = NamedTemporaryFile()
+        self.journal = UploadJournal(self.db.name)
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_progress(self):
+        with NamedTemporaryFile() as f:
+            f.write('some data')
+            f.flush()
+            self.assertEqual(self.journal.get(self.key, f, 4, 'sha256'), None)
+            self.journal.start(self.key, f, 4, 'sha256')
+            self.assertEqual(
+                self.journal.get(self.key, f, 4, 'sha256'), (None, set()))
+            self.journal.block_done(self.key, 'h1')
+            self.journal.block_done(self.key, 'h1')
+            self.journal.set_hashes(self.key, ['h1', 'h2', 'h3'])
+            self.assertEqual(
+                self.journal.get(self.key, f.name, 4, 'sha256'),
+                (['h1', 'h2', 'h3'], set(['h1'])))
+            self.assertEqual(self.journal.get(
+                ('acc0un7', 'c0nt@1n3r', 'other'), f, 4, 'sha256'), None)
+
+            #  A different block size invalidates the entry
+            self.assertEqual(self.journal.get(self.key, f, 8, 'sha256'), None)
+            self.assertEqual(self.journal.get(self.key, f, 4, 'sha256'), None)
+
+            #  So does a modified file
+            self.journal.start(self.key, f, 4, 'sha256', ['h1', 'h2', 'h3'])
+            self.journal.block_done(self.key, 'h2')
+            f.write('more data')
+            f.flush()
+            self.assertEqual(self.journal.get(self.key, f, 4, 'sha256'), None)
+
+            self.journal.start(self.key, f, 4, 'sha256', [])
+            self.assertEqual(
+                self.journal.get(self.key, f, 4, 'sha256'), ([], set()))
+            self.journal.remove(self.key)
+            self.assertEqual(self.journal.get(self.key, f, 4, 'sha256'), None)
+
+
+class BlockStore(TestCase):
+
+    def setUp(self):
+        from kamaki.clients.pithos.blockstore import BlockStore
+        self.dirpath = mkdtemp()
+        self.store = BlockStore(join(self.dirpath, 'blocks'))
+
+    def tearDown(self):
+        rmtree(self.dirpath)
+
+    def test_get_put(self):
+        h1, h2 = pithos._pithos_hash('ab', 'sha256'), pithos._pithos_hash(
+            '123', 'sha256')
+        self.assertEqual(self.store.get(h1, 4), None)
+        self.assertFalse(h1 in self.store)
+        self.store.put(h1, 'ab\x00\x00')
+        self.assertTrue(h1 in self.store)
+        self.assertEqual(self.store.get(h1, 4), 'ab\x00\x00')
+        #  Trailing NULs are not stored, any size with the same hash fits
+        self.assertEqual(self.store.get(h1, 2), 'ab')
+        self.assertEqual(self.store.get(h1, 6), 'ab\x00\x00\x00\x00')
+        self.assertEqual(self.store.get(h1, 1), None)
+        self.store.put(h2, buffer('xyz123', 3))
+        self.assertEqual(self.store.get(h2, 3), '123')
+
+    def test_hash_check(self):
+        h1 = pithos._pithos_hash('ab', 'sha256')
+        #  Blocks that do not match their hash are not stored
+        self.store.put(h1, 'a')
+        self.assertFalse(h1 in self.store)
+        self.assertEqual(self.store.get(h1, 2), None)
+        #  Damaged blocks are dropped
+        self.store.put(h1, 'ab')
+        with open(self.store._path(h1), 'wb') as f:
+            f.write('ax')
+        self.assertEqual(self.store.get(h1, 2), None)
+        self.assertFalse(h1 in self.store)
+
+    def test_evict(self):
+        hashes = [pithos._pithos_hash('%s' % i * 4, 'sha256') for i in range(
+            4)]
+        self.store.limit = 10
+        for i in range(3):
+            self.store.put(hashes[i], '%s' % i * 4)
+        self.assertEqual(self.store.get(hashes[0], 4), None)
+        self.assertEqual(self.store.get(hashes[1], 4), '1111')
+        #  hash1 is used more recently than hash2
+        self.store.put(hashes[3], '3333')
+        self.assertEqual(self.store.get(hashes[2], 4), None)
+        self.assertEqual(self.store.get(hashes[1], 4), '1111')
+        self.assertEqual(self.store.get(hashes[3], 4), '3333')
+        self.store.clear()
+        self.assertEqual(self.store.get(hashes[3], 4), None)
+
+
 class PithosClient(TestCase):
 
     files = []
@@ -970,6 +1141,395 @@ class PithosClient(TestCase):
         self.assertEqual(OP.mock_calls[-1][2]['if_etag_not_match'], '*')
         self.assertEqual(OP.mock_calls[-1][2]['etag'], etag)
 
+    @patch('%s.get_container_info' % pithos_pkg, return_value=container_info)
+    @patch('%s._put_block' % pithos_pkg)
+    @patch('%s.object_put' % pithos_pkg, return_value=FR())
+    def test_upload_object_resume(self, OP, PB, GCI):
+        from kamaki.clients.pithos.journal import UploadJournal
+        num_of_blocks = 4
+        tmpFile = self._create_temp_file(num_of_blocks)
+        blocksize = container_info['x-container-block-size']
+        blockhash = container_info['x-container-block-hash']
+        exp_hashes = []
+        for i in range(num_of_blocks):
+            exp_hashes.append(pithos._pithos_hash(
+                tmpFile.read(blocksize), blockhash))
+        tmpFile.seek(0)
+        FR.status_code = 201
+        key = (self.client.account, self.client.container, obj)
+        with NamedTemporaryFile() as db:
+            journal = self.client.upload_journal = UploadJournal(db.name)
+
+            #  An interrupted pipelined upload: hashes were not recorded
+            journal.start(key, tmpFile, blocksize, blockhash)
+            for hash in exp_hashes[:2]:
+                journal.block_done(key, hash)
+            with patch.object(
+                    pithos.PithosClient, 'get_object_hashmap',
+                    return_value=dict(hashes=[])):
+                self.client.upload_object(
+                    obj, tmpFile, pipelined=True, resume=True)
+            self.assertEqual(
+                sorted(c[2]['hash'] for c in PB.mock_calls),
+                sorted(exp_hashes[2:]))
+            self.assertEqual(OP.mock_calls[-1][2]['json'], dict(
+                bytes=num_of_blocks * blocksize, hashes=exp_hashes))
+            self.assertEqual(
+                journal.get(key, tmpFile, blocksize, blockhash), None)
+
+            #  Recorded hashes are used without reading the file
+            journal.start(key, tmpFile, blocksize, blockhash, exp_hashes)
+            with patch.object(
+                    pithos, '_pithos_hash', side_effect=AssertionError):
+                self.client.upload_object(obj, tmpFile, resume=True)
+            self.assertEqual(OP.mock_calls[-1][2]['json'], dict(
+                bytes=num_of_blocks * blocksize, hashes=exp_hashes))
+            self.assertEqual(
+                journal.get(key, tmpFile, blocksize, blockhash), None)
+
+            #  Without resume, uploads are recorded from scratch
+            journal.start(key, tmpFile, blocksize, blockhash, ['bogus'])
+            PB.reset_mock()
+            FR.status_code = 200
+            FR.json = exp_hashes[1:]
+            with patch.object(
+                    pithos.PithosClient, '_upload_missing_blocks',
+                    side_effect=KeyboardInterrupt):
+                self.assertRaises(
+                    KeyboardInterrupt,
+                    self.client.upload_object, obj, tmpFile)
+            self.assertEqual(
+                journal.get(key, tmpFile, blocksize, blockhash),
+                (exp_hashes, set()))
+
+    @patch('%s.get_container_info' % pithos_pkg, return_value=container_info)
+    @patch('%s._put_block' % pithos_pkg)
+    @patch('%s.object_put' % pithos_pkg, return_value=FR())
+    def test_upload_from_stream(self, OP, PB, GCI):
+        num_of_blocks = 3
+        tmpFile = self._create_temp_file(num_of_blocks)
+        blocksize = container_info['x-container-block-size']
+        blockhash = container_info['x-container-block-hash']
+        data = tmpFile.read() + 'tail'
+        exp_hashes = [pithos._pithos_hash(
+            data[i:i + blocksize], blockhash) for i in range(
+                0, len(data), blocksize)]
+        chunks = (data[i:i + 1000000] for i in range(0, len(data), 1000000))
+
+        FR.status_code = 201
+        FR.headers = dict(etag='some etag')
+        with patch.object(
+                pithos.PithosClient, 'get_object_hashmap',
+                return_value=dict(hashes=exp_hashes[:1])) as GOH:
+            r = self.client.upload_from_stream(obj, chunks)
+            GOH.assert_called_once_with(obj)
+        self.assertEqual(r, FR.headers)
+        self.assertEqual(
+            sorted(c[2]['hash'] for c in PB.mock_calls),
+            sorted(exp_hashes[1:]))
+        self.assertEqual(len(OP.mock_calls), 1)
+        self.assertEqual(OP.mock_calls[-1][2]['json'], dict(
+            bytes=len(data), hashes=exp_hashes))
+
+        #  Failed blocks are retried, from memory
+        PB.reset_mock()
+        PB.side_effect = [ClientError('fail', 503)] + [None] * num_of_blocks
+        tmpFile.seek(0)
+        self.client.upload_from_stream(obj, tmpFile, if_not_exist=True)
+        self.assertEqual(
+            sorted(c[2]['hash'] for c in PB.mock_calls),
+            sorted(exp_hashes[:1] + exp_hashes[:-1]))
+        self.assertEqual(OP.mock_calls[-1][2]['if_etag_not_match'], '*')
+
+        #  Missing blocks cannot be uploaded after the stream is consumed
+        FR.status_code, FR.json = 409, exp_hashes[:1]
+        PB.side_effect = None
+        tmpFile.seek(0)
+        self.assertRaises(
+            ClientError,
+            self.client.upload_from_stream, obj, tmpFile, if_not_exist=True)
+
+    def test__pack_blocks(self):
+        sizes = dict(h0=3, h1=3, h2=3, h3=1, h4=2)
+        for budget, blocksize, missing, expected in (
+                (0, 3, ['h0', 'h1', 'h2'], [['h0'], ['h1'], ['h2']]),
+                (6, None, ['h0', 'h1', 'h2'], [['h0'], ['h1'], ['h2']]),
+                (6, 3, ['h0', 'h1', 'h2', 'h3'], [['h0', 'h1'], ['h2', 'h3']]),
+                (9, 3, ['h3', 'h0', 'h4', 'h1'], [
+                    ['h3'], ['h0', 'h4'], ['h1']]),
+                (2, 3, ['h0', 'h1'], [['h0'], ['h1']])):
+            self.client.BLOCK_BATCH_SIZE = budget
+            self.assertEqual(
+                list(self.client._pack_blocks(missing, sizes, blocksize)),
+                expected)
+
+    def test__upload_missing_blocks(self):
+        blocksize, data = 3, '0123456789'
+        hashes = [pithos._pithos_hash(
+            data[i:i + blocksize], 'sha256') for i in range(0, 10, 3)]
+        hmap = dict((hash, (3 * i, 3 if i < 3 else 1)) for (
+            i, hash) in enumerate(hashes))
+        posted = []
+
+        def server(data=None, **kwargs):
+            r, blocks = FR(), [str(data)[i:i + blocksize] for i in range(
+                0, len(data), blocksize)]
+            posted.append(blocks)
+            r.json = [pithos._pithos_hash(b, 'sha256') for b in blocks]
+            if len(blocks) > 1 and mismatch:
+                r.json.reverse()
+            return r
+
+        with NamedTemporaryFile() as f:
+            f.write(data)
+            f.flush()
+            for budget, mismatch, expected in (
+                    (0, False, [['012'], ['345'], ['678'], ['9']]),
+                    (6, False, [['012', '345'], ['678', '9']]),
+                    (6, True, [
+                        ['012', '345'], ['012'], ['345'],
+                        ['678', '9'], ['678'], ['9']])):
+                self.client.BLOCK_BATCH_SIZE = budget
+                posted, done = [], []
+                with patch.object(
+                        pithos.PithosClient, 'container_post',
+                        side_effect=server):
+                    failed = self.client._upload_missing_blocks(
+                        hashes, hmap, f, done_cb=done.append,
+                        blocksize=blocksize)
+                self.assertEqual(failed, [])
+                self.assertEqual(sorted(done), sorted(hashes))
+                self.assertEqual(sorted(posted), sorted(expected))
+
+            #  A failed batch reports all of its blocks
+            self.client.BLOCK_BATCH_SIZE = 6
+            self.client.JOB_RETRY_LIMIT = 0
+            with patch.object(
+                    pithos.PithosClient, 'container_post',
+                    side_effect=ClientError('fail', 503)):
+                failed = self.client._upload_missing_blocks(
+                    hashes, hmap, f, blocksize=blocksize)
+            self.assertEqual(sorted(failed), sorted(hashes))
+
+    def test__calculate_blocks_for_upload(self):
+        num_of_blocks, blocksize = 5, 4 * 1024 * 1024
+        tmpFile = self._create_temp_file(num_of_blocks)
+        tmpFile.seek(0, 2)
+        tmpFile.write('\x00' * 1024)
+        tmpFile.flush()
+        size = num_of_blocks * blocksize + 1024
+        nblocks = num_of_blocks + 1
+        results = []
+        for workers, processes in ((1, False), (3, False), (4, True)):
+            self.client.HASH_WORKERS = workers
+            self.client.HASH_WITH_PROCESSES = processes
+            hashes, hmap = [], {}
+            tmpFile.seek(0)
+            self.client._calculate_blocks_for_upload(
+                blocksize, 'sha256', size, nblocks, hashes, hmap, tmpFile)
+            self.assertEqual(len(hashes), nblocks)
+            results.append((hashes, hmap))
+        for r in results[1:]:
+            self.assertEqual(r, results[0])
+
+        #  Cached hashes are used without reading the file
+        self.client.hash_cache = FakeHashCache()
+        tmpFile.seek(0)
+        self.client._calculate_blocks_for_upload(
+            blocksize, 'sha256', size, nblocks, [], {}, tmpFile)
+        self.assertEqual(self.client.hash_cache.stored, results[0][0])
+        tmpFile.seek(0)
+        hashes, hmap = [], {}
+        with patch.object(
+                pithos, '_pithos_hash', side_effect=AssertionError) as PH:
+            self.client._calculate_blocks_for_upload(
+                blocksize, 'sha256', size, nblocks, hashes, hmap, tmpFile)
+            self.assertEqual(PH.mock_calls, [])
+        self.assertEqual((hashes, hmap), results[0])
+
+        #  Hashes of a file modified while hashed are not cached
+        from kamaki.clients.pithos.hashcache import HashCache
+        hash_block, self.client.HASH_WORKERS = pithos._pithos_hash, 1
+
+        def modify_and_hash(block, blockhash):
+            if not modified:
+                tmpFile.seek(0)
+                tmpFile.write('x' * 16)
+                tmpFile.flush()
+                utime(tmpFile.name, (1, 1))
+                modified.append(True)
+            return hash_block(block, blockhash)
+
+        with NamedTemporaryFile() as db:
+            self.client.hash_cache = HashCache(db.name)
+            modified = []
+            with patch.object(
+                    pithos, '_pithos_hash', side_effect=modify_and_hash):
+                self.client._calculate_blocks_for_upload(
+                    blocksize, 'sha256', size, nblocks, [], {}, tmpFile)
+            self.assertEqual(self.client.hash_cache.get(
+                tmpFile, blocksize, 'sha256'), None)
+            hashes = []
+            self.client._calculate_blocks_for_upload(
+                blocksize, 'sha256', size, nblocks, hashes, {}, tmpFile)
+            self.assertEqual(self.client.hash_cache.get(
+                tmpFile, blocksize, 'sha256'), hashes)
+
+    @patch('%s.get_container_info' % pithos_pkg, return_value=container_info)
+    @patch('%s._put_block' % pithos_pkg)
+    @patch('%s.object_put' % pithos_pkg, return_value=FR())
+    def test_upload_object_pipelined(self, OP, PB, GCI):
+        num_of_blocks = 4
+        tmpFile = self._create_temp_file(num_of_blocks)
+        blocksize = container_info['x-container-block-size']
+        exp_hashes = []
+        for i in range(num_of_blocks):
+            exp_hashes.append(pithos._pithos_hash(
+                tmpFile.read(blocksize), container_info[
+                    'x-container-block-hash']))
+        tmpFile.seek(0)
+
+        FR.status_code = 201
+        known = dict(hashes=exp_hashes[:1])
+        with patch.object(
+                pithos.PithosClient, 'get_object_hashmap',
+                return_value=known) as GOH:
+            self.client.upload_object(obj, tmpFile, pipelined=True)
+            GOH.assert_called_once_with(obj)
+        self.assertEqual(
+            sorted(c[2]['hash'] for c in PB.mock_calls),
+            sorted(exp_hashes[1:]))
+        self.assertEqual(len(OP.mock_calls), 1)
+        self.assertEqual(OP.mock_calls[-1][2]['json'], dict(
+            bytes=num_of_blocks * blocksize, hashes=exp_hashes))
+
+        #  Object does not exist, every block is uploaded
+        tmpFile.seek(0)
+        with patch.object(
+                pithos.PithosClient, 'get_object_hashmap',
+                side_effect=ClientError('Not found', 404)):
+            self.client.upload_object(obj, tmpFile, pipelined=True)
+        self.assertEqual(len(PB.mock_calls), 2 * num_of_blocks - 1)
+
+        #  No remote lookup if object should not exist
+        tmpFile.seek(0)
+        with patch.object(
+                pithos.PithosClient, 'get_object_hashmap') as GOH:
+            self.client.upload_object(
+                obj, tmpFile, pipelined=True, if_not_exist=True, etag='e7')
+            self.assertEqual(GOH.mock_calls, [])
+        self.assertEqual(OP.mock_calls[-1][2]['if_etag_not_match'], '*')
+        self.assertEqual(OP.mock_calls[-1][2]['etag'], 'e7')
+
+    @patch('%s.get_container_info' % pithos_pkg, return_value=container_info)
+    @patch('%s._put_block' % pithos_pkg)
+    @patch('%s.object_put' % pithos_pkg, return_value=FR())
+    def test_upload_objects(self, OP, PB, GCI):
+        blocksize = container_info['x-container-block-size']
+        blockhash = container_info['x-container-block-hash']
+        shared, own = urandom(blocksize), [urandom(blocksize) for i in (1, 2)]
+        files, exp_hashes = [], []
+        for data in ((shared + own[0]), (own[1] + shared + shared)):
+            self.files.append(NamedTemporaryFile())
+            self.files[-1].write(data)
+            self.files[-1].flush()
+            files.append(self.files[-1])
+            exp_hashes.append([pithos._pithos_hash(
+                data[i:i + blocksize], blockhash) for i in range(
+                    0, len(data), blocksize)])
+        distinct = set(exp_hashes[0] + exp_hashes[1])
+        self.assertEqual(len(distinct), 3)
+
+        FR.status_code = 409
+        FR.headers = dict(etag='some etag')
+        with patch.object(
+                pithos.PithosClient, '_create_object_or_get_missing_hashes',
+                side_effect=lambda obj, hashmap, **kw: (
+                    hashmap['hashes'], {})) as COGMH:
+            r = self.client.upload_objects(
+                [('obj0', files[0], None),
+                    ('obj1', files[1].name, dict(content_type='text/plain'))],
+                public=True,
+                container_info_cache=dict())
+        self.assertEqual(r, [FR.headers, FR.headers])
+        self.assertEqual(len(COGMH.mock_calls), 2)
+        self.assertEqual(
+            sorted(c[2]['hash'] for c in PB.mock_calls), sorted(distinct))
+        self.assertEqual([c[1][0] for c in OP.mock_calls], ['obj0', 'obj1'])
+        for i, c in enumerate(OP.mock_calls):
+            self.assertEqual(c[2]['json'], dict(
+                bytes=len(exp_hashes[i]) * blocksize, hashes=exp_hashes[i]))
+            self.assertEqual(c[2]['public'], True)
+        self.assertEqual(
+            [c[2]['content_type'] for c in OP.mock_calls],
+            ['application/octet-stream', 'text/plain'])
+
+        #  Nothing missing, nothing to upload
+        PB.reset_mock()
+        OP.reset_mock()
+        with patch.object(
+                pithos.PithosClient, '_create_object_or_get_missing_hashes',
+                return_value=(None, dict(etag='new'))):
+            r = self.client.upload_objects(
+                [('obj0', files[0], None), ('obj1', files[1], None)])
+        self.assertEqual(r, [dict(etag='new')] * 2)
+        self.assertEqual((PB.mock_calls, OP.mock_calls), ([], []))
+
+    def test_upload_objects_concurrently(self):
+        tmpFile = self._create_temp_file(1)
+        uploads = [('obj%s' % i, tmpFile.name, dict(public=i)) for i in range(
+            6)] + [('obj6', tmpFile, None)]
+        opened = []
+
+        def upload_object(client, obj, f, **kwargs):
+            self.assertFalse(client is self.client)
+            self.assertEqual(client.container, self.client.container)
+            self.assertTrue(
+                client._worker_pool is self.client._get_worker_pool())
+            self.assertFalse(f.closed)
+            opened.append(f)
+            if obj == 'obj3':
+                raise ClientError('Some error', 500)
+            return dict(obj=obj, public=kwargs.get('public', None))
+
+        done = []
+        with patch.object(
+                pithos.PithosClient, 'upload_object',
+                autospec=True, side_effect=upload_object):
+            r = self.client.upload_objects_concurrently(
+                iter(uploads), parallel=3,
+                done_cb=lambda *args: done.append(args))
+        self.assertEqual(len(r), 7)
+        self.assertEqual(sorted(o for o, h, e in r), [u[0] for u in uploads])
+        for obj, headers, error in r:
+            if obj == 'obj3':
+                self.assertEqual(headers, None)
+                self.assertEqual(error.status, 500)
+            else:
+                self.assertEqual(error, None)
+                self.assertEqual(headers['obj'], obj)
+        self.assertEqual(
+            [(o, h, e) for o, s, h, e in done], r)
+        #  Paths are opened by the uploads and closed after them
+        self.assertEqual(len([f for f in opened if f.closed]), 6)
+        self.assertFalse(tmpFile.closed)
+
+        #  On interrupt, the block transfers of all uploads are cancelled
+        pools = []
+
+        def interrupt(obj, *args):
+            pools.append(self.client._worker_pool)
+            raise KeyboardInterrupt()
+
+        with patch.object(
+                pithos.PithosClient, 'upload_object',
+                autospec=True, side_effect=upload_object):
+            self.assertRaises(
+                KeyboardInterrupt, self.client.upload_objects_concurrently,
+                iter(uploads), parallel=3, done_cb=interrupt)
+        self.assertTrue(pools[0].cancelled)
+        self.assertTrue(pools[0].closed)
+
     @patch('%s.get_container_info' % pithos_pkg, return_value=container_info)
     @patch('%s.container_post' % pithos_pkg, return_value=FR())
     @patch('%s.object_put' % pithos_pkg, return_value=FR())
@@ -1191,6 +1751,286 @@ class PithosClient(TestCase):
         for k, v in kwargs.items():
             self.assertEqual(v, put.mock_calls[-1][2][k])
 
+    @patch('%s._create_object_or_get_missing_hashes' % pithos_pkg)
+    @patch('%s.get_object_hashmap' % pithos_pkg)
+    def test_clone_object(self, GOH, COGMH):
+        hashmap = dict(
+            block_size=16, block_hash='sha256', bytes=20, hashes=['h1', 'h2'])
+
+        def get_object_hashmap(obj, version=None, headers=None):
+            headers.update({
+                'content-type': 'text/plain',
+                'x-object-meta-k': 'v',
+                'etag': 'src-etag'})
+            return hashmap
+
+        GOH.side_effect = get_object_hashmap
+        COGMH.return_value = (None, dict(etag='n3w'))
+        source = pithos.PithosClient(self.url, self.token, 'src-acc', 'src-c')
+        r = self.client.clone_object(
+            'src-0bj', 'dst-0bj', source=source, source_version='v1')
+        self.assertEqual(r, dict(etag='n3w'))
+        self.assertEqual(
+            GOH.mock_calls[-1][1:], (('src-0bj', ), dict(
+                version='v1', headers=GOH.mock_calls[-1][2]['headers'])))
+        COGMH.assert_called_once_with(
+            'dst-0bj', dict(bytes=20, hashes=['h1', 'h2']),
+            content_type='text/plain', public=None, metadata=dict(k='v'))
+
+        self.client.clone_object('src-0bj', content_type='x/y', public=True)
+        self.assertEqual(COGMH.mock_calls[-1][1][0], 'src-0bj')
+        self.assertEqual(COGMH.mock_calls[-1][2]['content_type'], 'x/y')
+        self.assertEqual(COGMH.mock_calls[-1][2]['public'], True)
+
+        COGMH.return_value = (['h2'], dict())
+        try:
+            self.client.clone_object('src-0bj', 'dst-0bj')
+        except pithos.ClientError as ce:
+            self.assertEqual(ce.status, 409)
+        else:
+            self.fail('A clone with missing blocks should fail')
+
+    def test_clone_object_relay(self):
+        blocksize, data = 16, 'a' * 16 + 'b' * 16 + 'a' * 16 + 'c' * 5
+        hashes = [pithos._pithos_hash(data[i:i + blocksize], 'sha256') for (
+            i) in range(0, len(data), blocksize)]
+        server = {hashes[0]: True}
+        source = pithos.PithosClient(self.url, self.token, 'src-acc', 'src-c')
+
+        def get_object_hashmap(obj, version=None, headers=None):
+            headers.update({'content-type': 'text/plain', 'etag': 's3t4g'})
+            return dict(
+                block_size=blocksize, block_hash='sha256', bytes=len(data),
+                hashes=hashes)
+
+        def object_put(obj, json=None, **kwargs):
+            r = FR()
+            missing = [h for h in json['hashes'] if h not in server]
+            r.status_code, r.json = (409, missing) if missing else (201, {})
+            r.headers = dict(etag='n3w')
+            return r
+
+        def object_get(obj, data_range=None, **kwargs):
+            start, end = data_range.split('=')[1].split('-')
+            r = FR()
+            r.content = data[int(start):int(end) + 1]
+            return r
+
+        def container_post(data=None, **kwargs):
+            r = FR()
+            r.json = [pithos._pithos_hash(data, 'sha256')]
+            server[r.json[0]] = True
+            return r
+
+        with patch.multiple(
+                pithos.PithosClient,
+                get_object_hashmap=DEFAULT,
+                get_container_info=DEFAULT,
+                object_get=DEFAULT,
+                object_put=DEFAULT,
+                container_post=DEFAULT) as mocks:
+            mocks['get_object_hashmap'].side_effect = get_object_hashmap
+            mocks['get_container_info'].return_value = {
+                'x-container-block-size': '%s' % blocksize,
+                'x-container-block-hash': 'sha256'}
+            mocks['object_get'].side_effect = object_get
+            mocks['object_put'].side_effect = object_put
+            mocks['container_post'].side_effect = container_post
+            r = self.client.clone_object(
+                'src-0bj', 'dst-0bj', source=source, relay=True)
+            self.assertEqual(r, dict(etag='n3w'))
+            #  Only the missing blocks are copied, with the source ETag
+            self.assertEqual(
+                sorted(c[2]['data_range'] for c in mocks[
+                    'object_get'].mock_calls), ['bytes=16-31', 'bytes=48-52'])
+            for c in mocks['object_get'].mock_calls:
+                self.assertEqual(c[2]['if_etag_match'], 's3t4g')
+            self.assertEqual(len(mocks['container_post'].mock_calls), 2)
+            self.assertEqual(len(mocks['object_put'].mock_calls), 2)
+            kwargs = mocks['object_put'].mock_calls[-1][2]
+            self.assertEqual(kwargs['json'], dict(
+                bytes=len(data), hashes=hashes))
+            self.assertEqual(kwargs['content_type'], 'text/plain')
+
+            #  Blocks of other sizes cannot be relayed
+            mocks['get_container_info'].return_value = {
+                'x-container-block-size': '32',
+                'x-container-block-hash': 'sha256'}
+            self.assertRaises(
+                pithos.ClientError, self.client.clone_object, 'src-0bj',
+                source=source, relay=True)
+            self.assertEqual(len(mocks['object_put'].mock_calls), 2)
+
+    def test_clone_objects(self):
+        source = pithos.PithosClient(self.url, self.token, 'src-acc', 'src-c')
+        clones = [('src%s' % i, 'dst%s' % i, dict(
+            source_version=i)) for i in range(5)] + [('src5', 'dst5', None)]
+
+        def clone_object(client, src, dst, source=None, **kwargs):
+            self.assertFalse(client is self.client)
+            self.assertEqual(client.container, self.client.container)
+            self.assertEqual(
+                (source.account, source.container), ('src-acc', 'src-c'))
+            self.assertTrue(client._worker_pool is self.client._worker_pool)
+            if src == 'src3':
+                raise pithos.ClientError('Missing blocks', 409)
+            return dict(src=src, dst=dst, **kwargs)
+
+        done = []
+        with patch.object(
+                pithos.PithosClient, 'clone_object',
+                autospec=True, side_effect=clone_object):
+            r = self.client.clone_objects(
+                iter(clones), source=source, parallel=3, public=True,
+                done_cb=lambda *args: done.append(args))
+        self.assertEqual(len(r), 6)
+        self.assertEqual(sorted(s for s, d, h, e in r), [c[0] for c in clones])
+        for src, dst, headers, error in r:
+            if src == 'src3':
+                self.assertEqual(headers, None)
+                self.assertEqual(error.status, 409)
+                continue
+            self.assertEqual(error, None)
+            self.assertEqual(headers['dst'], dst)
+            self.assertEqual(headers['public'], True)
+            self.assertEqual(
+                headers.get('source_version'),
+                None if src == 'src5' else int(src[3:]))
+        self.assertEqual(done, r)
+        self.assertEqual(self.client._worker_pool, None)
+
+    def test__clone(self):
+        self.client.MAX_THREADS = 3
+        client = self.client._clone()
+        self.assertFalse(client is self.client)
+        self.assertEqual(
+            (client.account, client.container, client.MAX_THREADS),
+            (self.client.account, self.client.container, 3))
+        #  No worker pool is started for a clone
+        self.assertEqual(getattr(self.client, '_worker_pool', None), None)
+        self.assertEqual(client._worker_pool, None)
+        pool = self.client._get_worker_pool()
+        try:
+            self.assertTrue(self.client._clone()._worker_pool is pool)
+        finally:
+            self.client.close_worker_pool()
+
+    def test_bulk_object_operation(self):
+        attempts = dict()
+
+        def move_object(client, **kwargs):
+            self.assertFalse(client is self.client)
+            src = kwargs['src_object']
+            attempts[src] = attempts.get(src, 0) + 1
+            if src == 'o2' and attempts[src] < 2:
+                raise pithos.ClientError('Unavailable', 503)
+            if src == 'o3' or (src == 'o4' and attempts[src] > 1):
+                raise pithos.ClientError('Not Found', 404)
+            if src == 'o4':
+                raise pithos.ClientError('Gateway Timeout', 504)
+            return dict(kwargs)
+
+        objects = ['o0', 'o1', ('o2', dict(dst_object='d2')), 'o3', 'o4']
+        done = []
+        with patch.object(
+                pithos.PithosClient, 'move_object',
+                autospec=True, side_effect=move_object):
+            with patch.object(pithos.RetryPolicy, 'BASE_DELAY', 0.0):
+                r = self.client.bulk_object_operation(
+                    'move', iter(objects), parallel=3,
+                    done_cb=lambda *args: done.append(args),
+                    src_container='s', dst_container='d')
+        self.assertEqual(done, r)
+        self.assertEqual(sorted(o for o, v, e in r), [
+            'o%s' % i for i in range(5)])
+        results = dict((o, (v, e)) for o, v, e in r)
+        #  Transient errors are retried, others are reported
+        self.assertEqual(attempts['o2'], 2)
+        self.assertEqual(results['o2'], (dict(
+            src_object='o2', dst_object='d2', src_container='s',
+            dst_container='d'), None))
+        self.assertEqual(attempts['o3'], 1)
+        self.assertEqual(results['o3'][1].status, 404)
+        #  A retried move that finds the object gone has succeeded
+        self.assertEqual(attempts['o4'], 2)
+        self.assertEqual(results['o4'], (None, None))
+        self.assertEqual(results['o0'][0]['src_object'], 'o0')
+
+        #  The retries of a run are limited by the retry budget
+        attempts.clear()
+        with patch.object(
+                pithos.PithosClient, 'move_object',
+                autospec=True, side_effect=move_object):
+            with patch.object(pithos.RetryPolicy, 'BASE_DELAY', 0.0):
+                r = self.client.bulk_object_operation(
+                    'move', ['o2', 'o4'], parallel=1, retry_budget=1,
+                    src_container='s', dst_container='d')
+        results = dict((o, (v, e)) for o, v, e in r)
+        self.assertEqual(results['o2'][1], None)
+        self.assertEqual(results['o4'][1].status, 504)
+        self.assertEqual(attempts, dict(o2=2, o4=1))
+
+        with patch.object(pithos.PithosClient, 'del_object') as DO:
+            r = self.client.bulk_object_operation(
+                'delete', iter(objects), dry_run=True, until='d4t3')
+            self.assertEqual(DO.mock_calls, [])
+        self.assertEqual(r[2], ('o2', dict(
+            obj='o2', dst_object='d2', until='d4t3'), None))
+        self.assertEqual([o for o, v, e in r], [
+            'o%s' % i for i in range(5)])
+
+    def test_iter_objects(self):
+        names = ['o%02d' % i for i in range(7)]
+        markers = []
+
+        def container_get(**kwargs):
+            markers.append(kwargs['marker'])
+            self.assertEqual(kwargs['prefix'], 'o')
+            self.assertEqual(kwargs['until'], 'd4t3')
+            self.assertEqual(kwargs['success'], (200, 204))
+            #  The server returns up to 3 objects per page
+            limit = min(kwargs['limit'] or 3, 3)
+            start = names.index(kwargs['marker']) + 1 if (
+                kwargs['marker']) else 0
+            r = FR()
+            r.json = [dict(name=n) for n in names[start:start + limit]]
+            r.status_code = 200 if r.json else 204
+            return r
+
+        with patch.object(
+                pithos.PithosClient, 'container_get',
+                side_effect=container_get):
+            #  Without a page limit, pages are fetched until an empty one
+            r = self.client.iter_objects('o', until='d4t3')
+            self.assertEqual([o['name'] for o in r], names)
+            self.assertEqual(markers, [None, 'o02', 'o05', 'o06'])
+
+            #  Pages shorter than limit are not the last one, the server
+            #  may cap the page size
+            markers[:] = []
+            r = self.client.iter_objects('o', limit=5, until='d4t3')
+            self.assertEqual([o['name'] for o in r], names)
+            self.assertEqual(markers, [None, 'o02', 'o05', 'o06'])
+
+            #  The next page is fetched while the current one is consumed
+            markers[:] = []
+            r = self.client.iter_objects(
+                'o', limit=2, marker='o02', until='d4t3')
+            self.assertEqual(r.next()['name'], 'o03')
+            for i in range(50):
+                if len(markers) > 1:
+                    break
+                sleep(0.1)
+            self.assertEqual(markers, ['o02', 'o04'])
+            r.close()
+
+        with patch.object(
+                pithos.PithosClient, 'container_get',
+                side_effect=pithos.ClientError('Not Found', 404)):
+            self.client.JOB_RETRY_LIMIT = 0
+            r = self.client.iter_objects()
+            self.assertRaises(pithos.ClientError, list, r)
+
     #  Pithos+ only methods
 
     @patch('%s.container_put' % pithos_pkg, return_value=FR())
@@ -1286,13 +2126,22 @@ class PithosClient(TestCase):
         self.assertEqual(put.mock_calls[-1], call(obj, **expected))
 
     @patch('%s.get_object_hashmap' % pithos_pkg, return_value=object_hashmap)
-    @patch('%s.object_get' % pithos_pkg, return_value=FR())
+    @patch('%s.object_get' % pithos_pkg)
     def test_download_to_string(self, GET, GOH):
-        FR.content = 'some sample content'
         num_of_blocks = len(object_hashmap['hashes'])
+        blocksize = object_hashmap['block_size']
+        data = ''.join(chr(97 + i) * blocksize for i in range(num_of_blocks))
+        truncate = [0]
+
+        def object_get(obj, data_range=None, **kwargs):
+            first, last = data_range[len('bytes='):].split('-')
+            r = FR()
+            r.content = data[int(first):int(last) + 1 - truncate[0]]
+            return r
+
+        GET.side_effect = object_get
         r = self.client.download_to_string(obj)
-        expected_content = FR.content * num_of_blocks
-        self.assertEqual(expected_content, r)
+        self.assertEqual(data, r)
         self.assertEqual(len(GET.mock_calls), num_of_blocks)
         self.assertEqual(GET.mock_calls[-1][1], (obj,))
 
@@ -1311,6 +2160,7 @@ class PithosClient(TestCase):
         GOH.assert_called_once_with(obj, **expargs)
 
         r = self.client.download_to_string(obj, **kwargs)
+        self.assertEqual(r, data[10:21])
         expargs['data_range'] = 'bytes=%s' % kwargs['range_str']
         expargs.pop('headers')
         for k, v in expargs.items():
@@ -1318,6 +2168,16 @@ class PithosClient(TestCase):
                 GET.mock_calls[-1][2][k],
                 v or kwargs.get(k))
 
+        #  A short range body is an error, retried by the workers
+        truncate[0], self.client.JOB_RETRY_LIMIT = 1, 0
+        self.assertRaises(ClientError, self.client.download_to_string, obj)
+
+        with patch.object(
+                pithos.PithosClient, '_get_block_async',
+                side_effect=KeyboardInterrupt):
+            self.assertRaises(
+                KeyboardInterrupt, self.client.download_to_string, obj)
+
     @patch('%s.get_object_hashmap' % pithos_pkg, return_value=object_hashmap)
     @patch('%s.object_get' % pithos_pkg, return_value=FR())
     def test_download_object(self, GET, GOH):
@@ -1382,6 +2242,12 @@ class PithosClient(TestCase):
         tmpFile.seek(0)
         kwargs.pop('async_headers')
         kwargs.pop('resume')
+        #  A response that ignores the range is rejected
+        self.client.JOB_RETRY_LIMIT = 0
+        self.assertRaises(
+            ClientError, self.client.download_object, obj, tmpFile, **kwargs)
+        FR.content = FR.content[10:21]
+        tmpFile.seek(0)
         self.client.download_object(obj, tmpFile, **kwargs)
         for k, v in kwargs.items():
             if k == 'range_str':
@@ -1404,6 +2270,351 @@ class PithosClient(TestCase):
             else:
                 self.assertEqual(GET.mock_calls[-1][2][k], v)
 
+    @patch('%s.get_object_hashmap' % pithos_pkg)
+    def test_download_object_stream(self, GOH):
+        blocksize, nblocks = 16, 10
+        data = ''.join(chr(ord('a') + i) * blocksize for i in range(nblocks))
+        data = data[:-3]
+        GOH.return_value = dict(
+            block_size=blocksize, block_hash='sha256', bytes=len(data),
+            hashes=['h%s' % (i % 4) for i in range(nblocks)])
+
+        def object_get(obj, data_range=None, **kwargs):
+            sleep(random() / 100)
+            start, end = data_range.split('=')[1].split('-')
+            r = FR()
+            r.content = data[int(start):int(end) + 1]
+            return r
+
+        class Pipe(object):
+            written = []
+
+            def isatty(self):
+                return False
+
+            def seek(self, offset, whence=0):
+                raise IOError(29, 'Illegal seek')
+
+            def write(self, data):
+                self.written.append(data)
+
+            def flush(self):
+                pass
+
+        self.client.MAX_THREADS = 3
+        with patch.object(
+                pithos.PithosClient, 'object_get',
+                side_effect=object_get) as GET:
+            dst = Pipe()
+            self.client.download_object(obj, dst)
+            self.assertEqual(''.join(dst.written), data)
+            self.assertEqual(len(GET.mock_calls), nblocks)
+
+            dst.written[:] = []
+            self.client.download_object(obj, dst, range_str='20-50')
+            self.assertEqual(''.join(dst.written), data[20:51])
+
+        #  Short range bodies are retried
+        truncated = set()
+
+        def truncate_once(obj, data_range=None, **kwargs):
+            r = object_get(obj, data_range, **kwargs)
+            if data_range not in truncated:
+                truncated.add(data_range)
+                r.content = r.content[:-1]
+            return r
+
+        with patch.object(
+                pithos.PithosClient, 'object_get',
+                side_effect=truncate_once) as GET:
+            with patch.object(pithos.RetryPolicy, 'BASE_DELAY', 0.0):
+                dst = Pipe()
+                dst.written[:] = []
+                self.client.download_object(obj, dst)
+            self.assertEqual(''.join(dst.written), data)
+            self.assertEqual(len(GET.mock_calls), 2 * nblocks)
+
+            truncated.clear()
+            self.client.JOB_RETRY_LIMIT = 0
+            self.assertRaises(
+                ClientError, self.client.download_object, obj, Pipe())
+
+        with patch.object(
+                pithos.PithosClient, 'object_get',
+                side_effect=ClientError('Not Found', 404)):
+            self.assertRaises(
+                ClientError, self.client.download_object, obj, Pipe())
+
+    @patch('%s.get_object_hashmap' % pithos_pkg)
+    def test_download_coalesced(self, GOH):
+        blocksize, nblocks = 16, 10
+        data = ''.join(chr(ord('a') + i % 4) * blocksize for i in range(
+            nblocks - 1)) + 'z' * 13
+        GOH.return_value = dict(
+            block_size=blocksize, block_hash='sha256', bytes=len(data),
+            hashes=['h%s' % (i % 4) for i in range(nblocks - 1)] + ['h9'])
+
+        def object_get(obj, data_range=None, async_headers={}, **kwargs):
+            data_range = async_headers.get('Range', data_range)
+            start, end = data_range.split('=')[1].split('-')
+            r = FR()
+            r.content = data[int(start):int(end) + 1]
+            return r
+
+        self.client.RANGE_BATCH_SIZE = 3 * blocksize
+        with patch.object(
+                pithos.PithosClient, 'object_get',
+                side_effect=object_get) as GET:
+            with NamedTemporaryFile() as f:
+                self.client.download_object(obj, f)
+                f.seek(0)
+                self.assertEqual(f.read(), data)
+            ranges = ['bytes=0-47', 'bytes=144-156', 'bytes=48-63']
+            self.assertEqual(sorted(
+                c[2]['async_headers']['Range'] for c in GET.mock_calls),
+                ranges)
+
+            GET.reset_mock()
+            self.assertEqual(self.client.download_to_string(obj), data)
+            self.assertEqual(sorted(
+                c[2]['data_range'] for c in GET.mock_calls), ranges)
+
+            GET.reset_mock()
+            with NamedTemporaryFile() as f:
+                f.isatty = lambda: True
+                self.client.download_object(obj, f)
+                f.seek(0)
+                self.assertEqual(f.read(), data)
+            self.assertEqual([c[2]['data_range'] for c in GET.mock_calls], [
+                'bytes=0-47', 'bytes=48-95', 'bytes=96-143', 'bytes=144-156'])
+
+    def test_download_objects_concurrently(self):
+        dirpath = mkdtemp()
+        tmpFile = NamedTemporaryFile()
+        downloads = [('obj%s' % i, join(dirpath, 'f%s' % i), dict(
+            version=i)) for i in range(6)] + [('obj6', tmpFile, None)]
+        with open(join(dirpath, 'f0'), 'w') as f:
+            f.write('old contents')
+        opened = []
+
+        def download_object(client, obj, f, headers=None, **kwargs):
+            self.assertFalse(client is self.client)
+            self.assertTrue(
+                client._worker_pool is self.client._get_worker_pool())
+            self.assertFalse(f.closed)
+            opened.append((f, f.mode))
+            if obj == 'obj3':
+                raise ClientError('Some error', 500)
+            headers['obj'], headers['version'] = obj, kwargs.get('version')
+            f.write(obj)
+
+        done = []
+        try:
+            with patch.object(
+                    pithos.PithosClient, 'download_object',
+                    autospec=True, side_effect=download_object):
+                r = self.client.download_objects_concurrently(
+                    iter(downloads), parallel=3, resume=True,
+                    done_cb=lambda *args: done.append(args))
+            self.assertEqual(len(r), 7)
+            self.assertEqual(
+                sorted(o for o, h, e in r), [d[0] for d in downloads])
+            for obj, headers, error in r:
+                if obj == 'obj3':
+                    self.assertEqual(headers, None)
+                    self.assertEqual(error.status, 500)
+                else:
+                    self.assertEqual(error, None)
+                    self.assertEqual(headers['obj'], obj)
+            self.assertEqual([(o, h, e) for o, d, h, e in done], r)
+            #  Paths are opened by the downloads and closed after them
+            self.assertEqual(len([f for f, m in opened if f.closed]), 6)
+            self.assertEqual(
+                sorted(m for f, m in opened if f.closed),
+                ['rb+'] + ['wb+'] * 5)
+            self.assertFalse(tmpFile.closed)
+            with open(join(dirpath, 'f0')) as f:
+                self.assertEqual(f.read(), 'obj0contents')
+
+            #  On interrupt, the block transfers of all downloads are
+            #  cancelled
+            pools = []
+
+            def interrupt(obj, *args):
+                pools.append(self.client._worker_pool)
+                raise KeyboardInterrupt()
+
+            with patch.object(
+                    pithos.PithosClient, 'download_object',
+                    autospec=True, side_effect=download_object):
+                self.assertRaises(
+                    KeyboardInterrupt,
+                    self.client.download_objects_concurrently,
+                    iter(downloads), parallel=3, done_cb=interrupt)
+            self.assertTrue(pools[0].cancelled)
+            self.assertTrue(pools[0].closed)
+        finally:
+            tmpFile.close()
+            rmtree(dirpath)
+
+    @patch('%s.get_object_hashmap' % pithos_pkg)
+    def test_file_matches_object(self, GOH):
+        blocksize, data = 16, 'a' * 16 + 'b' * 16 + 'c' * 5
+        hashes = [pithos._pithos_hash(data[i:i + blocksize], 'sha256') for (
+            i) in range(0, len(data), blocksize)]
+        GOH.return_value = dict(
+            block_size=blocksize, block_hash='sha256', bytes=len(data),
+            hashes=hashes)
+        self.client.hash_cache = FakeHashCache()
+        with NamedTemporaryFile() as f:
+            f.write(data)
+            f.flush()
+            self.assertFalse(self.client.file_matches_object(obj, f, 36))
+            self.assertEqual(GOH.call_count, 0)
+            self.assertTrue(self.client.file_matches_object(obj, f, 37))
+            self.assertEqual(self.client.hash_cache.stored, hashes)
+            self.assertTrue(self.client.file_matches_object(obj, f))
+
+            #  Cached hashes are used instead of hashing the file again
+            self.client.hash_cache.stored = ['h1', 'h2', 'h3']
+            self.assertFalse(self.client.file_matches_object(obj, f))
+
+            GOH.side_effect = ClientError('Not found', 404)
+            self.assertFalse(self.client.file_matches_object(obj, f))
+
+    @patch('%s.get_object_hashmap' % pithos_pkg)
+    def test_download_resume_cached_hashes(self, GOH):
+        blocksize, data = 16, 'a' * 16 + 'b' * 16 + 'c' * 5
+        hashes = [pithos._pithos_hash(data[i:i + blocksize], 'sha256') for (
+            i) in range(0, len(data), blocksize)]
+        GOH.return_value = dict(
+            block_size=blocksize, block_hash='sha256', bytes=len(data),
+            hashes=hashes)
+
+        def object_get(obj, data_range=None, async_headers={}, **kwargs):
+            start, end = async_headers['Range'].split('=')[1].split('-')
+            r = FR()
+            r.content = data[int(start):int(end) + 1]
+            return r
+
+        self.client.hash_cache = FakeHashCache()
+        with NamedTemporaryFile() as f:
+            f.write('a' * 16 + 'x' * 16 + 'c' * 5)
+            f.flush()
+            self.client.hash_cache.stored = [hashes[0], 'changed', hashes[2]]
+            with patch.object(
+                    pithos.PithosClient, '_hash_from_file') as HFF:
+                with patch.object(
+                        pithos.PithosClient, 'object_get',
+                        side_effect=object_get) as GET:
+                    self.client.download_object(obj, f, resume=True)
+            self.assertEqual(HFF.call_count, 0)
+            self.assertEqual(
+                [c[2]['async_headers']['Range'] for c in GET.mock_calls],
+                ['bytes=16-31'])
+            f.seek(0)
+            self.assertEqual(f.read(), data)
+            #  The hashes of the downloaded file are cached
+            self.assertEqual(self.client.hash_cache.stored, hashes)
+
+    @patch('%s.get_object_hashmap' % pithos_pkg)
+    def test_download_to_buffer(self, GOH):
+        blocksize, nblocks = 16, 10
+        data = ''.join(chr(ord('a') + i % 4) * blocksize for i in range(
+            nblocks - 1)) + 'z' * 13
+        GOH.return_value = dict(
+            block_size=blocksize, block_hash='sha256', bytes=len(data),
+            hashes=['h%s' % (i % 4) for i in range(nblocks - 1)] + ['h9'])
+
+        def object_get(obj, sink=None, async_headers={}, **kwargs):
+            start, end = async_headers['Range'].split('=')[1].split('-')
+            r = FR()
+            r.content, r.sink_size = '', int(end) + 1 - int(start)
+            sink[:] = data[int(start):int(end) + 1]
+            return r
+
+        self.client.RANGE_BATCH_SIZE = 3 * blocksize
+        with patch.object(
+                pithos.PithosClient, 'object_get',
+                side_effect=object_get) as GET:
+            buf = self.client.download_to_buffer(obj)
+            self.assertTrue(isinstance(buf, bytearray))
+            self.assertEqual(str(buf), data)
+            self.assertEqual(sorted(
+                c[2]['async_headers']['Range'] for c in GET.mock_calls),
+                ['bytes=0-47', 'bytes=144-156', 'bytes=48-63'])
+            for c in GET.mock_calls:
+                self.assertEqual(c[1], (obj, ))
+                self.assertTrue(isinstance(c[2]['sink'], memoryview))
+
+        #  Short responses fail
+        self.client.JOB_RETRY_LIMIT = 0
+        FR.sink_size = 1
+        with patch.object(
+                pithos.PithosClient, 'object_get', return_value=FR()):
+            self.assertRaises(
+                ClientError, self.client.download_to_buffer, obj)
+        del FR.sink_size
+
+    @patch('%s.get_object_hashmap' % pithos_pkg)
+    def test_download_block_store(self, GOH):
+        from kamaki.clients.pithos.blockstore import BlockStore
+        blocksize, nblocks = 16, 10
+        data = ''.join(chr(ord('a') + i % 4) * blocksize for i in range(
+            nblocks - 1)) + 'z' * 13
+        hashes = [pithos._pithos_hash(data[i:i + blocksize], 'sha256') for (
+            i) in range(0, len(data), blocksize)]
+        GOH.return_value = dict(
+            block_size=blocksize, block_hash='sha256', bytes=len(data),
+            hashes=hashes)
+
+        def object_get(obj, data_range=None, async_headers={}, **kwargs):
+            data_range = async_headers.get('Range', data_range)
+            start, end = data_range.split('=')[1].split('-')
+            r = FR()
+            r.content = data[int(start):int(end) + 1]
+            return r
+
+        dirpath = mkdtemp()
+        try:
+            self.client.RANGE_BATCH_SIZE = 3 * blocksize
+            store = self.client.block_store = BlockStore(dirpath)
+            store.put(hashes[1], 'b' * blocksize)
+            with patch.object(
+                    pithos.PithosClient, 'object_get',
+                    side_effect=object_get) as GET:
+                with NamedTemporaryFile() as f:
+                    self.client.download_object(obj, f)
+                    f.seek(0)
+                    self.assertEqual(f.read(), data)
+                self.assertEqual(sorted(
+                    c[2]['async_headers']['Range'] for c in GET.mock_calls),
+                    ['bytes=0-15', 'bytes=144-156', 'bytes=32-63'])
+                for h in set(hashes):
+                    self.assertTrue(h in store)
+
+                GET.reset_mock()
+                self.assertEqual(self.client.download_to_string(obj), data)
+                with NamedTemporaryFile() as f:
+                    self.client.download_object(obj, f)
+                    f.seek(0)
+                    self.assertEqual(f.read(), data)
+                with NamedTemporaryFile() as f:
+                    f.isatty = lambda: True
+                    self.client.download_object(obj, f)
+                    f.seek(0)
+                    self.assertEqual(f.read(), data)
+                self.assertEqual(GET.mock_calls, [])
+
+                #  Ranges are not served from the store
+                self.assertEqual(
+                    self.client.download_to_string(obj, range_str='0-3'),
+                    data[:4])
+                self.assertEqual(len(GET.mock_calls), 1)
+        finally:
+            self.client.block_store = None
+            rmtree(dirpath)
+
     def test_get_object_hashmap(self):
         FR.json = object_hashmap
         for empty in (304, 412):
@@ -1678,16 +2889,40 @@ class PithosClient(TestCase):
         self.client.del_object_sharing(obj)
         SOS.assert_called_once_with(obj)
 
-    @patch('%s.get_container_info' % pithos_pkg, return_value=container_info)
-    @patch('%s.object_post' % pithos_pkg, return_value=FR())
-    def test_append_object(self, post, GCI):
-        num_of_blocks = 4
-        tmpFile = self._create_temp_file(num_of_blocks)
-        tmpFile.seek(0, 2)
-        file_size = tmpFile.tell()
+    def test_append_object(self):
+        blocksize = 16
+        data = 'a' * blocksize + 'b' * 5
+
+        def hashes_of(data):
+            return [pithos._pithos_hash(data[i:i + blocksize], 'sha256') for (
+                i) in range(0, len(data), blocksize)]
+
+        server = dict((h, True) for h in hashes_of(data))
+        info = dict(object_info, etag='3t46', **{
+            'content-type': 'application/directory'})
+
+        def container_post(data=None, **kwargs):
+            r = FR()
+            r.json = [pithos._pithos_hash(data, 'sha256')]
+            server[r.json[0]] = True
+            return r
+
+        def object_put(obj, json=None, **kwargs):
+            r = FR()
+            missing = [h for h in json['hashes'] if h not in server]
+            r.status_code, r.json = (409, missing) if missing else (201, {})
+            r.headers = dict(etag='n3w')
+            return r
+
+        def object_get(obj, data_range=None, **kwargs):
+            start, end = data_range.split('=')[1].split('-')
+            r = FR()
+            r.content = data[int(start):int(end) + 1]
+            return r
+
+        local = 'c' * 11 + 'a' * blocksize + 'd' * 3
+        expected = data + local
         for turn in range(2):
-            tmpFile.seek(0, 0)
-
             try:
                 from progress.bar import ShadyBar
                 apn_bar = ShadyBar('Mock append')
@@ -1704,19 +2939,44 @@ class PithosClient(TestCase):
             else:
                 append_gen = None
 
-            self.client.append_object(
-                obj, tmpFile,
-                upload_cb=append_gen if turn else None)
-            self.assertEqual((turn + 1) * num_of_blocks, len(post.mock_calls))
-            (args, kwargs) = post.mock_calls[-1][1:3]
-            self.assertEqual(kwargs['obj'], obj)
-            self.assertEqual(kwargs['content_length'], len(kwargs['data']))
-            fsize = num_of_blocks * int(kwargs['content_length'])
-            self.assertEqual(fsize, file_size)
-            self.assertEqual(kwargs['content_range'], 'bytes */*')
-            exp = 'application/octet-stream'
-            self.assertEqual(kwargs['content_type'], exp)
-            self.assertEqual(kwargs['update'], True)
+            with NamedTemporaryFile() as f:
+                f.write(local)
+                f.flush()
+                f.seek(0)
+                with patch.multiple(
+                        pithos.PithosClient,
+                        get_object_info=DEFAULT,
+                        get_object_hashmap=DEFAULT,
+                        object_get=DEFAULT,
+                        object_put=DEFAULT,
+                        container_post=DEFAULT) as mocks:
+                    mocks['get_object_info'].return_value = info
+                    mocks['get_object_hashmap'].return_value = dict(
+                        block_size=blocksize, block_hash='sha256',
+                        bytes=len(data), hashes=hashes_of(data))
+                    mocks['object_get'].side_effect = object_get
+                    mocks['object_put'].side_effect = object_put
+                    mocks['container_post'].side_effect = container_post
+                    r = self.client.append_object(
+                        obj, f, upload_cb=append_gen if turn else None)
+                    self.assertEqual(r, [dict(etag='n3w')])
+                    #  Only the partial tail block is downloaded
+                    self.assertEqual(
+                        [c[2]['data_range'] for c in mocks[
+                            'object_get'].mock_calls], ['bytes=16-20'])
+                    kwargs = mocks['object_put'].mock_calls[-1][2]
+                    self.assertEqual(kwargs['json'], dict(
+                        bytes=len(expected), hashes=hashes_of(expected)))
+                    self.assertEqual(kwargs['if_etag_match'], '3t46')
+                    self.assertEqual(
+                        kwargs['content_type'], 'application/octet-stream')
+                    self.assertEqual(
+                        len(mocks['object_put'].mock_calls), 1 if turn else 2)
+                    #  New blocks, but those the server has, are uploaded
+                    posted = sorted(str(c[2]['data']) for c in mocks[
+                        'container_post'].mock_calls)
+                    self.assertEqual(posted, [] if turn else sorted([
+                        expected[16:32], expected[48:]]))
 
     @patch('%s.object_post' % pithos_pkg, return_value=FR())
     def test_truncate_object(self, post):
@@ -1792,6 +3052,117 @@ class PithosClient(TestCase):
                 exp = 'application/octet-stream'
                 self.assertEqual(kwargs['content_type'], exp)
 
+    def test_overwrite_object_block_diff(self):
+        blocksize = 16
+        data = ''.join(chr(ord('a') + i) * blocksize for i in range(4)) + (
+            'e' * 5)
+
+        def hashes_of(data):
+            return [pithos._pithos_hash(data[i:i + blocksize], 'sha256') for (
+                i) in range(0, len(data), blocksize)]
+
+        server = dict((h, True) for h in hashes_of(data))
+        info = dict(
+            object_info, etag='3t46', **{
+                'x-object-meta-k': 'v',
+                'x-object-sharing': 'read=u1,u2;write=u3'})
+
+        def container_post(data=None, **kwargs):
+            r = FR()
+            r.json = [pithos._pithos_hash(data, 'sha256')]
+            server[r.json[0]] = True
+            return r
+
+        def object_put(obj, json=None, **kwargs):
+            r = FR()
+            missing = [h for h in json['hashes'] if h not in server]
+            r.status_code, r.json = (409, missing) if missing else (201, {})
+            return r
+
+        def object_get(obj, data_range=None, **kwargs):
+            start, end = data_range.split('=')[1].split('-')
+            r = FR()
+            r.content = data[int(start):int(end) + 1]
+            return r
+
+        for start, end, local, ranges in (
+                (20, 40, 'X' * 21, ['bytes=16-31', 'bytes=32-47']),
+                (16, 63, 'b' * 16 + 'Y' * 16 + 'd' * 16, []),
+                (60, 68, 'dddd' + 'Z' * 5, ['bytes=48-63'])):
+            expected = data[:start] + local + data[end + 1:]
+            with NamedTemporaryFile() as f:
+                f.write(local)
+                f.flush()
+                f.seek(0)
+                with patch.multiple(
+                        pithos.PithosClient,
+                        get_object_info=DEFAULT,
+                        get_object_hashmap=DEFAULT,
+                        object_get=DEFAULT,
+                        object_put=DEFAULT,
+                        container_post=DEFAULT) as mocks:
+                    mocks['get_object_info'].return_value = info
+                    mocks['get_object_hashmap'].return_value = dict(
+                        block_size=blocksize, block_hash='sha256',
+                        bytes=len(data), hashes=hashes_of(data))
+                    mocks['object_get'].side_effect = object_get
+                    mocks['object_put'].side_effect = object_put
+                    mocks['container_post'].side_effect = container_post
+                    self.client.overwrite_object(
+                        obj, start, end, f, block_diff=True)
+                    self.assertEqual(sorted(
+                        c[2]['data_range'] for c in mocks[
+                            'object_get'].mock_calls), ranges)
+                    puts = mocks['object_put'].mock_calls
+                    self.assertEqual(len(puts), 2)
+                    kwargs = puts[-1][2]
+                    self.assertEqual(kwargs['json'], dict(
+                        bytes=len(data), hashes=hashes_of(expected)))
+                    self.assertEqual(kwargs['if_etag_match'], '3t46')
+                    self.assertEqual(kwargs['metadata']['k'], 'v')
+                    self.assertEqual(kwargs['permissions'], dict(
+                        read=['u1', 'u2'], write=['u3']))
+                    #  Only changed blocks are uploaded
+                    posted = [c[2]['data'] for c in mocks[
+                        'container_post'].mock_calls]
+                    changed = set(hashes_of(expected)).difference(
+                        hashes_of(data))
+                    self.assertEqual(len(posted), len(changed))
+                    for block in posted:
+                        self.assertTrue(str(block) in expected)
+
+        #  A source version is read, the current version is replaced
+        def get_object_info(obj, version=None):
+            return dict(info, etag='0ld' if version else 'cur3n7')
+
+        with NamedTemporaryFile() as f:
+            f.write('X' * 21)
+            f.flush()
+            f.seek(0)
+            with patch.multiple(
+                    pithos.PithosClient,
+                    get_object_info=DEFAULT,
+                    get_object_hashmap=DEFAULT,
+                    object_get=DEFAULT,
+                    object_put=DEFAULT,
+                    container_post=DEFAULT) as mocks:
+                mocks['get_object_info'].side_effect = get_object_info
+                mocks['get_object_hashmap'].return_value = dict(
+                    block_size=blocksize, block_hash='sha256',
+                    bytes=len(data), hashes=hashes_of(data))
+                mocks['object_get'].side_effect = object_get
+                mocks['object_put'].side_effect = object_put
+                mocks['container_post'].side_effect = container_post
+                self.client.overwrite_object(
+                    obj, 20, 40, f, source_version='v1', block_diff=True)
+                mocks['get_object_hashmap'].assert_called_once_with(
+                    obj, version='v1')
+                for c in mocks['object_get'].mock_calls:
+                    self.assertEqual(c[2]['version'], 'v1')
+                self.assertEqual(
+                    mocks['object_put'].mock_calls[-1][2]['if_etag_match'],
+                    'cur3n7')
+
     @patch('%s.set_param' % pithos_pkg)
     @patch('%s.get' % pithos_pkg, return_value=FR())
     def test_get_sharing_accounts(self, get, SP):
@@ -33,7 +33,7 @@
 
 from mock import patch, call
 from unittest import makeSuite, TestSuite, TextTestRunner, TestCase
-from time import sleep
+from time import sleep, time
 from inspect import getmembers, isclass
 from itertools import product
 from random import randint
@@ -49,7 +49,8 @@ from kamaki.clients.cyclades.test import (
 from kamaki.clients.image.test import ImageClient
 from kamaki.clients.storage.test import StorageClient
 from kamaki.clients.pithos.test import (
-    PithosClient, PithosRestClient, PithosMethods)
+    PithosClient, PithosRestClient, PithosMethods, HashCache,
+    UploadJournal, BlockStore)
 from kamaki.clients.blockstorage.test import (
     BlockStorageRestClient, BlockStorageClient)
 
@@ -214,6 +215,50 @@ class ResponseManager(TestCase):
         self.assertEqual(self.RM.headers, FakeResp.HEADERS)
         perform.assert_called_only_once
 
+    def test_sink(self):
+        from kamaki.clients import (
+            ResponseManager, RequestManager, ClientError)
+        from StringIO import StringIO
+
+        class ChunkedResp(FakeResp):
+            status = 206
+
+            def __init__(self, data):
+                self.fp = StringIO(data)
+
+            def read(self, amt=None):
+                return self.fp.read(amt)
+
+        buf = bytearray('-' * 12)
+        RM = ResponseManager(
+            RequestManager('GET', 'http://ok', '/'),
+            sink=memoryview(buf)[2:10])
+        RM.SINK_CHUNK_SIZE = 3
+        with patch(
+                'kamaki.clients.RequestManager.perform',
+                return_value=ChunkedResp('12345678')):
+            self.assertEqual(RM.content, '')
+        self.assertEqual(RM.sink_size, 8)
+        self.assertEqual(buf, bytearray('--12345678--'))
+
+        RM = ResponseManager(
+            RequestManager('GET', 'http://ok', '/'),
+            sink=memoryview(buf)[2:4])
+        with patch(
+                'kamaki.clients.RequestManager.perform',
+                return_value=ChunkedResp('too long')):
+            self.assertRaises(ClientError, RM._get_response)
+
+        #  Error responses are not read into the sink
+        RM = ResponseManager(
+            RequestManager('GET', 'http://ok', '/'),
+            sink=memoryview(buf)[2:10])
+        with patch(
+                'kamaki.clients.RequestManager.perform',
+                return_value=FakeResp()):
+            self.assertEqual(RM.content, FakeResp.READ)
+        self.assertEqual(RM.sink_size, 0)
+
 
 class SilentEvent(TestCase):
 
@@ -269,6 +314,249 @@ class SilentEvent(TestCase):
                 self.assertFalse(t.exception)
 
 
+class AIMDController(TestCase):
+
+    def setUp(self):
+        from kamaki.clients import AIMDController
+        self.ctrl = AIMDController(8)
+
+    def test_slow_start(self):
+        self.assertEqual(self.ctrl.window, 1)
+        for i in range(4):
+            self.ctrl.completed(time() - 0.01, 1024)
+        self.assertEqual(self.ctrl.window, 5)
+        for i in range(10):
+            self.ctrl.completed(time() - 0.01, 1024)
+        self.assertEqual(self.ctrl.window, 8)
+        self.assertEqual(self.ctrl.history[-1][1:3], (8, 'slow start'))
+
+    def test_backoff(self):
+        from kamaki.clients import ClientError
+        self.ctrl.limit = 8.0
+        started = time()
+        for error in (
+                ClientError('Bad Gateway', 502),
+                ClientError('Service Unavailable', 503)):
+            self.ctrl.completed(started, error=error)
+        #  Both errors belong to the same overload event
+        self.assertEqual(self.ctrl.window, 4)
+        self.assertFalse(self.ctrl.slow_start)
+        self.assertEqual(self.ctrl.history[-1][1:3], (4, 'backoff on 502'))
+
+        from socket import timeout
+        self.ctrl.completed(time(), error=timeout())
+        self.assertEqual(self.ctrl.window, 2)
+        self.ctrl.completed(time(), error=ClientError('Not Found', 404))
+        self.assertEqual(self.ctrl.window, 2)
+        for i in range(20):
+            self.ctrl.completed(time(), error=timeout())
+        self.assertEqual(self.ctrl.window, 1)
+
+    def test_additive_increase(self):
+        self.ctrl.slow_start, self.ctrl.limit = False, 2.0
+        for i in range(4):
+            self.ctrl.completed(time() - 0.01, 1024)
+        self.assertEqual(self.ctrl.window, 3)
+        #  High latency means requests are queued, so the limit stays
+        self.ctrl.completed(time() - 1.0, 1024)
+        limit = self.ctrl.limit
+        self.ctrl.completed(time() - 1.0, 1024)
+        self.assertEqual(self.ctrl.limit, limit)
+
+    def test_goodput_plateau(self):
+        self.ctrl.max_limit = 100
+        for i in range(20):
+            self.ctrl._round = (time() - 1.0, 0, 0)
+            self.ctrl.completed(time() - 0.01, 1024)
+            self.ctrl._end_round(time())
+            if not self.ctrl.slow_start:
+                break
+        self.assertFalse(self.ctrl.slow_start)
+        self.assertTrue(self.ctrl.goodput > 0)
+        self.assertEqual(self.ctrl.history[-1][2], 'goodput plateau')
+
+
+class RetryPolicy(TestCase):
+
+    def setUp(self):
+        from kamaki.clients import RetryPolicy
+        self.policy = RetryPolicy(retries=3, budget=4)
+
+    def test_retry(self):
+        from kamaki.clients import ClientError
+        from socket import timeout
+        for error in (
+                ClientError('Not Found', 404),
+                ClientError('Conflict', 409),
+                ValueError('not transient')):
+            self.assertEqual(self.policy.retry(error, 0), None)
+        error = ClientError('Bad Gateway', 502)
+        for attempt in range(3):
+            delay = self.policy.retry(error, attempt)
+            self.assertTrue(0 <= delay <= 0.5 * 2 ** attempt)
+        self.assertEqual(self.policy.retry(error, 3), None)
+        self.assertEqual(self.policy.retried, 3)
+
+        #  The budget is shared by all jobs
+        self.assertNotEqual(self.policy.retry(timeout(), 0), None)
+        self.assertEqual(self.policy.retry(timeout(), 0), None)
+        self.assertEqual(self.policy.retried, 4)
+
+    def test_delay(self):
+        from kamaki.clients import ClientError
+        error = ClientError('Service Unavailable', 503)
+        for attempt in range(12):
+            self.assertTrue(
+                0 <= self.policy.delay(error, attempt) <= min(
+                    self.policy.MAX_DELAY, 0.5 * 2 ** attempt))
+        error.retry_after = 7
+        self.assertEqual(self.policy.delay(error, 0), 7)
+        error.retry_after = 3600
+        self.assertEqual(self.policy.delay(error, 0), self.policy.MAX_DELAY)
+
+
+class WorkerPool(TestCase):
+
+    def setUp(self):
+        from kamaki.clients import WorkerPool
+        self.pool = WorkerPool(3)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def job_content(self, jobid, raise_exception=False):
+        from kamaki.clients import _worker
+        if raise_exception:
+            raise Exception('Some exception %s' % jobid)
+        return jobid, getattr(_worker, 'pool_key', None)
+
+    def test_batch(self):
+        batch = self.pool.batch()
+        jobs = [batch.submit(self.job_content, i, i % 3 == 2) for i in range(
+            10)]
+        self.assertEqual(batch.pending, 10)
+        done = list(batch.completed(wait=True))
+        self.assertEqual(batch.pending, 0)
+        self.assertEqual(set(done), set(jobs))
+        for i, job in enumerate(jobs):
+            if i % 3 == 2:
+                self.assertTrue(isinstance(job.exception, Exception))
+                self.assertEqual(job.value, None)
+            else:
+                self.assertFalse(job.exception)
+                jobid, pool_key = job.value
+                self.assertEqual(jobid, i)
+                self.assertTrue(pool_key.startswith('kamaki.worker.'))
+        self.assertEqual(sum(self.pool.jobs_per_worker), 10)
+        self.assertEqual(list(batch.completed()), [])
+
+    def test_cancel(self):
+        from threading import Event, Timer
+        go_on = Event()
+        batch, other = self.pool.batch(), self.pool.batch()
+        jobs = [batch.submit(go_on.wait, 4) for i in range(6)]
+        Timer(0.2, go_on.set).start()
+        batch.cancel()
+        self.assertEqual(batch.pending, 0)
+        #  At most 3 jobs were running, the rest were skipped
+        self.assertTrue(len([j for j in jobs if j.value is None]) >= 3)
+        job = other.submit(self.job_content, 42)
+        self.assertEqual(list(other.completed(wait=True)), [job])
+        self.assertEqual(job.value[0], 42)
+
+        #  Cancelling the pool skips the jobs of all its batches
+        from kamaki import clients
+        self.pool.cancel()
+        self.assertTrue(other.cancelled)
+        job = other.submit(self.job_content, 42)
+        self.assertEqual(list(other.completed(wait=True)), [job])
+        self.assertEqual(job.value, None)
+        self.assertTrue(isinstance(job.exception, clients.ClientError))
+        self.assertTrue(self.pool.batch().cancelled)
+
+    def test_close(self):
+        from kamaki.clients import _open_pools
+        batch = self.pool.batch()
+        jobs = [batch.submit(sleep, 0.05) for i in range(3)]
+        self.assertTrue(self.pool in _open_pools)
+        self.pool.close()
+        self.assertTrue(self.pool.closed)
+        self.assertFalse([w for w in self.pool._workers if w.is_alive()])
+        self.assertFalse(self.pool in _open_pools)
+        self.assertEqual(set(batch.completed()), set(jobs))
+        self.pool.close()
+
+    def test_controller(self):
+        from kamaki.clients import WorkerPool
+        from threading import Lock
+
+        class FixedWindow(object):
+            window, outcomes = 2, []
+
+            def completed(self, started, nbytes=0, error=None):
+                self.outcomes.append((nbytes, error))
+
+        running, lock = [0, 0], Lock()
+
+        def job_content(data):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            sleep(0.05)
+            with lock:
+                running[0] -= 1
+
+        pool = WorkerPool(4, controller=FixedWindow())
+        try:
+            batch = pool.batch()
+            for i in range(8):
+                batch.submit(job_content, data='x' * i)
+            list(batch.completed(wait=True))
+        finally:
+            pool.close()
+        self.assertEqual(running[1], 2)
+        self.assertEqual(
+            sorted(FixedWindow.outcomes), [(i, None) for i in range(8)])
+
+    def test_retry(self):
+        from kamaki.clients import ClientError, RetryPolicy
+        failures = dict(a=2, b=9, c=1)
+
+        def job_content(key, status=503):
+            if failures[key]:
+                failures[key] -= 1
+                raise ClientError('fail %s' % key, status)
+            return key
+
+        policy = RetryPolicy(retries=3)
+        policy.BASE_DELAY = 0.01
+        batch = self.pool.batch(policy)
+        jobs = [batch.submit(job_content, key) for key in ('a', 'b')]
+        jobs.append(batch.submit(job_content, 'c', 404))
+        list(batch.completed(wait=True))
+        self.assertEqual(jobs[0].value, 'a')
+        self.assertFalse(jobs[0].exception)
+        self.assertEqual(jobs[1].exception.status, 503)
+        self.assertEqual(failures, dict(a=0, b=5, c=0))
+        self.assertEqual(jobs[2].exception.status, 404)
+        self.assertEqual(policy.retried, 5)
+
+        #  Without a retry policy, jobs run once
+        failures['a'] = 1
+        batch = self.pool.batch()
+        job = batch.submit(job_content, 'a')
+        list(batch.completed(wait=True))
+        self.assertEqual(job.exception.status, 503)
+
+    def test_close(self):
+        self.pool.close()
+        self.assertTrue(self.pool.closed)
+        for worker in self.pool._workers:
+            worker.join(4)
+            self.assertFalse(worker.is_alive())
+        self.assertRaises(AssertionError, self.pool.batch)
+
+
 class FR(object):
     json = None
     text = None
@@ -398,7 +686,7 @@ class Client(TestCase):
             self.client.request(method, path, **kwargs)
             self.assertEqual(
                 RespInit.mock_calls[-1],
-                call(FR, connection_retry_limit=0, poolsize=None))
+                call(FR, connection_retry_limit=0, poolsize=None, sink=None))
 
     @patch('kamaki.clients.Client.request', return_value='lala')
     def _test_foo(self, foo, request):
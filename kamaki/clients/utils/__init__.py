@@ -32,6 +32,10 @@
 # or implied, of GRNET S.A.
 
 import unicodedata
+import mmap
+from os import fstat, lseek, write, SEEK_SET
+from stat import S_ISREG
+from threading import Lock
 
 
 def _matches(val1, val2, exactMath=True):
@@ -97,18 +101,174 @@ def path4url(*args):
 def readall(openfile, size, retries=7):
     """Read a file until size is reached"""
     remains = size if size > 0 else 0
-    buf = ''
+    chunks = []
     for i in range(retries):
         tmp_buf = openfile.read(remains)
         if tmp_buf:
-            buf += tmp_buf
+            chunks.append(tmp_buf)
             remains -= len(tmp_buf)
             if remains > 0:
                 continue
-        return buf
+        return chunks[0] if len(chunks) == 1 else ''.join(chunks)
     raise IOError('Failed to read %s bytes from file' % size)
 
 
+def stream_blocks(stream, blocksize):
+    """Split a stream in blocks of blocksize bytes, the last may be shorter
+    Only one block is kept in memory at a time
+
+    :param stream: a file-like object with a read method (e.g., a pipe) or
+        an iterable of str chunks
+
+    :yields: (offset, block)
+    """
+    if hasattr(stream, 'read'):
+        chunks = iter(lambda: stream.read(blocksize), '')
+    else:
+        chunks = iter(stream)
+    offset, pending, pending_size = 0, [], 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        pending.append(chunk)
+        pending_size += len(chunk)
+        if pending_size < blocksize:
+            continue
+        data = ''.join(pending)
+        end = len(data) - len(data) % blocksize
+        for start in range(0, end, blocksize):
+            yield offset, data[start:start + blocksize]
+            offset += blocksize
+        rest = data[end:]
+        pending, pending_size = [rest] if rest else [], len(rest)
+    if pending:
+        yield offset, ''.join(pending)
+
+
+def rstrip_nul(block, chunksize=64 * 1024):
+    """Strip trailing '\\x00' bytes without copying the block
+
+    :param block: (str or buffer)
+
+    :returns: (str or buffer) a str is stripped as usual, a buffer is
+        narrowed by reading only its trailing NUL bytes
+    """
+    if isinstance(block, basestring):
+        return block.rstrip('\x00')
+    end = len(block)
+    if not end or block[end - 1] != '\x00':
+        return block
+    while end:
+        start = max(0, end - chunksize)
+        tail = block[start:end].rstrip('\x00')
+        if tail:
+            end = start + len(tail)
+            break
+        end = start
+    return buffer(block, 0, end)
+
+
+class BlockSource(object):
+    """Zero-copy, read-only access to the data of a local file
+
+    Each block is memory-mapped on its own and served as a buffer object on
+    the mapping, so it can be hashed and sent over the network without
+    intermediate copies. A mapping is released as soon as the last view of
+    it is dropped, so memory usage is bounded by the blocks in use.
+    Files that cannot be mapped (e.g., empty files, pipes) fall back to
+    plain reads.
+    Offsets are absolute positions in the file.
+    """
+
+    def __init__(self, fileobj, size=None):
+        """
+        :param fileobj: open file descriptor (rb)
+
+        :param size: (int) the amount of data to serve (default: file size)
+        """
+        self.fileobj, self.mapped = fileobj, False
+        try:
+            st = fstat(fileobj.fileno())
+            self.size = st.st_size if size is None else min(size, st.st_size)
+            self.mapped = S_ISREG(st.st_mode) and self.size > 0
+        except (AttributeError, EnvironmentError, ValueError):
+            self.size = size
+
+    def read(self, offset, length):
+        """:returns: (buffer or str) up to length bytes from offset"""
+        if self.mapped:
+            length = max(0, min(length, self.size - offset))
+            if length:
+                start = offset - offset % mmap.ALLOCATIONGRANULARITY
+                try:
+                    block = mmap.mmap(
+                        self.fileobj.fileno(), length + offset - start,
+                        access=mmap.ACCESS_READ, offset=start)
+                    return buffer(block, offset - start, length)
+                except EnvironmentError:
+                    self.mapped = False
+            else:
+                return ''
+        self.fileobj.seek(offset)
+        return readall(self.fileobj, length)
+
+    def blocks(self, blocksize, nblocks):
+        """:yields: (offset, block) for each block, up to self.size"""
+        offset = 0
+        if not self.mapped:
+            try:
+                self.fileobj.seek(0)
+            except (AttributeError, EnvironmentError):
+                pass  # not seekable (e.g., a pipe), read from where it is
+        for i in xrange(nblocks):
+            if self.mapped:
+                block = self.read(offset, blocksize)
+            else:
+                block = readall(self.fileobj, min(
+                    blocksize, (self.size - offset) if (
+                        self.size is not None) else blocksize))
+            if not len(block):
+                break
+            yield offset, block
+            offset += len(block)
+
+
+class BlockSink(object):
+    """Write blocks of data at absolute positions of a file, from many
+    threads at once
+
+    Writes go straight to the file descriptor, each one seeking and writing
+    under a lock (a portable positional write), so they do not interfere
+    with each other. Objects without a file descriptor (e.g., StringIO) are
+    written through their seek and write methods.
+    """
+
+    def __init__(self, fileobj):
+        """:param fileobj: open file descriptor (wb+)"""
+        self.fileobj, self._lock = fileobj, Lock()
+        try:
+            fileobj.flush()
+            self.fd = fileobj.fileno()
+        except (AttributeError, EnvironmentError, ValueError):
+            self.fd = None
+
+    def preallocate(self, size):
+        """Set the file size, so that blocks can be written in any order"""
+        with self._lock:
+            self.fileobj.truncate(size)
+
+    def write(self, offset, data):
+        """:param data: (str or buffer)"""
+        with self._lock:
+            if self.fd is None:
+                self.fileobj.seek(offset)
+                self.fileobj.write(data)
+                return
+            lseek(self.fd, offset, SEEK_SET)
+            while len(data):
+                data = buffer(data, write(self.fd, data))
+
+
 def escape_ctrl_chars(s):
     """Escape control characters from unicode and string objects."""
     if isinstance(s, unicode):
@@ -31,9 +31,12 @@
 # interpreted as representing official policies, either expressed
 # or implied, of GRNET S.A.
 
+import os
 from unittest import TestCase
 from tempfile import TemporaryFile
+from StringIO import StringIO
 from itertools import product
+from threading import Thread
 
 from kamaki.clients import utils
 
@@ -139,6 +142,85 @@ class Utils(TestCase):
             self.assertEqual(utils.readall(f, 1), '')
             self.assertRaises(IOError, utils.readall, f, 1, 0)
 
+    def test_stream_blocks(self):
+        data = '1234567890'
+        for blocksize in (1, 3, 10, 11):
+            expected = [(i, data[i:i + blocksize]) for i in range(
+                0, len(data), blocksize)]
+            self.assertEqual(list(utils.stream_blocks(
+                StringIO(data), blocksize)), expected)
+            for chunks in (
+                    ['1', '', '234', '5678', '9', '0'], [data], list(data)):
+                self.assertEqual(
+                    list(utils.stream_blocks(chunks, blocksize)), expected)
+        self.assertEqual(list(utils.stream_blocks(StringIO(''), 4)), [])
+        self.assertEqual(list(utils.stream_blocks([], 4)), [])
+
+    def test_rstrip_nul(self):
+        for data in ('', '\x00' * 10, 'abc', 'a\x00bc\x00\x00', '\x00ab'):
+            self.assertEqual(utils.rstrip_nul(data), data.rstrip('\x00'))
+            for chunksize in (1, 2, 64 * 1024):
+                stripped = utils.rstrip_nul(buffer(data), chunksize)
+                self.assertEqual(str(stripped), data.rstrip('\x00'))
+        data = buffer('abc')
+        self.assertTrue(utils.rstrip_nul(data) is data)
+
+    def test_BlockSource(self):
+        tstr = '1234567890'
+        with TemporaryFile() as f:
+            f.write(tstr)
+            f.flush()
+            f.seek(0)
+            source = utils.BlockSource(f)
+            self.assertTrue(source.mapped)
+            self.assertEqual(source.size, len(tstr))
+            self.assertTrue(isinstance(source.read(2, 3), buffer))
+            self.assertEqual(str(source.read(2, 3)), tstr[2:5])
+            self.assertEqual(str(source.read(8, 5)), tstr[8:])
+            self.assertEqual(source.read(10, 5), '')
+            self.assertEqual(
+                [(o, str(b)) for o, b in source.blocks(4, 3)],
+                [(0, tstr[:4]), (4, tstr[4:8]), (8, tstr[8:])])
+            source = utils.BlockSource(f, 6)
+            self.assertEqual(
+                [(o, str(b)) for o, b in source.blocks(4, 3)],
+                [(0, tstr[:4]), (4, tstr[4:6])])
+
+        with TemporaryFile() as f:
+            source = utils.BlockSource(f)
+            self.assertFalse(source.mapped)
+            self.assertEqual(list(source.blocks(4, 1)), [])
+
+        source = utils.BlockSource(StringIO(tstr), 7)
+        self.assertFalse(source.mapped)
+        self.assertEqual(source.read(5, 5), tstr[5:])
+        #  Blocks start at offset 0, wherever the file position is
+        self.assertEqual(
+            list(source.blocks(4, 2)), [(0, tstr[:4]), (4, tstr[4:7])])
+
+    def test_BlockSink(self):
+        blocks = ['%s' % i * 4 for i in range(8)]
+        with TemporaryFile() as f:
+            sink = utils.BlockSink(f)
+            self.assertTrue(sink.fd is not None)
+            sink.preallocate(30)
+            self.assertEqual(os.fstat(f.fileno()).st_size, 30)
+            threads = [Thread(
+                target=sink.write, args=(i * 4, buffer(b, 0, 30 - i * 4)))
+                for i, b in reversed(list(enumerate(blocks)))]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            f.seek(0)
+            self.assertEqual(f.read(), ''.join(blocks)[:30])
+
+        f = StringIO('abcdef')
+        sink = utils.BlockSink(f)
+        self.assertEqual(sink.fd, None)
+        sink.write(2, 'XY')
+        self.assertEqual(f.getvalue(), 'abXYef')
+
     def test_escape_ctrl_chars(self):
         gr_synnefo = u'\u03c3\u03cd\u03bd\u03bd\u03b5\u03c6\u03bf'
         gr_kamaki = u'\u03ba\u03b1\u03bc\u03ac\u03ba\u03b9'